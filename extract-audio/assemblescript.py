@@ -1,29 +1,351 @@
 #!/usr/bin/env python
 
+import argparse
+import math
+import re
+import tempfile
+import threading
 import time
 import assemblyai as aai
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 from pathlib import Path
 import os
-import glob
+import sys
 
 # === CONFIGURATION ===
 SCRIPT_DIR = Path(__file__).resolve().parent
 PREPROCESS_AUDIO_CHUNKS_FOLDER = SCRIPT_DIR.parent / "joe-charlie-aa-js/test-output/preprocess-audio/chunks"
 EN_AUDIO_OUTPUT_TEXT_FILE = SCRIPT_DIR.parent / "joe-charlie-aa-js/test-output/EN-audio-text-output/joe-charlie-first-5-minutes.txt"
 
-def main():
-    # === SETUP ===
-    # Load .env from parent of current file
-    env_path = Path(__file__).resolve().parent.parent / ".env"
-    load_dotenv(dotenv_path=env_path)
+TRANSCRIPTION_CACHE_PATH = SCRIPT_DIR.parent / "joe-charlie-aa-js/test-output/cache/transcription_cache.sqlite"
+
+sys.path.insert(0, str(SCRIPT_DIR.parent / "pipeline-common"))
+from rate_limit import TokenBucket
+from transcription_cache import TranscriptionCache, utterance_to_dict
+from preprocess_audio import (CHUNK_PLAN_FILENAME, ChunkPlan, audio_duration_ms, cut_clip, decode_to_wav,
+                              describe_bytes_per_hour, export_chunk_from_wav, find_chunk_files)
+from window_stitch import (WindowSettings, clip_name, plan_windows, stitch_windows, transcript_words,
+                           words_to_utterances)
+from stage_manifest import StageManifest, open_manifest
+from metrics import count, finish_run, span, start_run
+from utterance_index import (Selection, UtteranceIndex, add_selection_arguments, format_row, format_timestamp,
+                             index_path_for, selection_from_args)
+
+FIX_PADDING_MS = 250   # Audio kept around a re-transcribed window so its first and last words are not clipped
+
+class ChunkTranscriptionError(Exception):
+    pass
+
+class UploadTally:
+    """
+    Bytes sent to AssemblyAI (every attempt uploads the chunk again), shared by the transcription threads
+    """
+    def __init__(self):
+        self.bytes = 0
+        self.uploads = 0
+        self._lock = threading.Lock()
+
+    def add(self, size: int):
+        with self._lock:
+            self.bytes += size
+            self.uploads += 1
+
+def transcript_utterances(transcript):
+    return [utterance_to_dict(u) for u in transcript.utterances or []]
+
+def transcribe_with_retry(transcriber, chunk_path, rate_limiter: TokenBucket, max_retries: int, retry_delay: float,
+                          uploads: UploadTally = None, extract=transcript_utterances):
+    """
+    Transcribe one chunk, retrying it on its own until it succeeds or max_retries is reached.
+    Returns extract(transcript): its utterances, or e.g. window_stitch.transcript_words for the words.
+    """
+    for attempt in range(1, max_retries + 1):
+        rate_limiter.acquire()
+        print(f"🎙 Transcribing: {chunk_path} (attempt {attempt}/{max_retries})")
+        if uploads is not None:
+            uploads.add(os.path.getsize(chunk_path))
+        with span("transcribe", "api_call", chunk=os.path.basename(chunk_path), attempt=attempt,
+                  request_bytes=os.path.getsize(chunk_path)) as call:
+            try:
+                transcript = transcriber.transcribe(chunk_path)
+                if transcript.status != "error":
+                    items = extract(transcript)
+                    response_bytes = sum(len(item["text"].encode("utf-8")) for item in items)
+                    call.set(items=len(items), response_bytes=response_bytes)
+                    count("request_bytes_total", os.path.getsize(chunk_path), stage="transcribe")
+                    count("response_bytes_total", response_bytes, stage="transcribe")
+                    return items
+                error = transcript.error
+                call.fail("TranscriptError")
+            except Exception as e:
+                error = f"{e.__class__.__name__}: {e}"
+                call.fail(e)
+
+        print(f"❌ Transcription failed for {chunk_path}: {error}")
+        if attempt < max_retries:
+            count("retries_total", stage="transcribe")
+            delay = retry_delay * (2 ** (attempt - 1))
+            print(f"⏳ Retrying {os.path.basename(chunk_path)} in {delay:.1f} seconds...")
+            time.sleep(delay)
+
+    raise ChunkTranscriptionError(f"{chunk_path}: {error}")
+
+def transcribe_windows(transcriber, chunk_path, windows: WindowSettings, window_pool, rate_limiter: TokenBucket,
+                       max_retries: int, retry_delay: float, uploads: UploadTally = None):
+    """
+    Low-latency mode: transcribe the chunk as short overlapping windows on window_pool and stitch their words
+    into utterances (times in the chunk, like a whole-chunk job)
+    """
+    with tempfile.TemporaryDirectory() as clip_dir:
+        # A compressed chunk is decoded once; its windows are cut from that WAV and sent as FLAC, so a window
+        # never uploads more than the chunk's own share
+        if str(chunk_path).lower().endswith(".wav"):
+            source_wav, extension = chunk_path, ".wav"
+        else:
+            source_wav = decode_to_wav(chunk_path, os.path.join(clip_dir, "chunk.wav"))
+            extension = ".flac"
+        plan = plan_windows(audio_duration_ms(source_wav), windows.window_ms, windows.overlap_ms)
+        if len(plan) == 1:
+            return transcribe_with_retry(transcriber, chunk_path, rate_limiter, max_retries, retry_delay, uploads)
+
+        def transcribe_window(start_ms, end_ms):
+            clip_path = os.path.join(clip_dir, clip_name(chunk_path, start_ms, end_ms, extension))
+            export_chunk_from_wav(source_wav, clip_path, start_ms, end_ms - start_ms)
+            return transcribe_with_retry(transcriber, clip_path, rate_limiter, max_retries, retry_delay, uploads,
+                                         extract=transcript_words)
+
+        futures = [window_pool.submit(transcribe_window, start_ms, end_ms) for start_ms, end_ms in plan]
+        words, stats = stitch_windows([(start_ms, end_ms, future.result())
+                                       for (start_ms, end_ms), future in zip(plan, futures)])
+    print(f"🧵 Stitched {stats['windows']} windows of {os.path.basename(chunk_path)} "
+          f"({stats['words_dropped']} overlap words dropped, {stats['unaligned_overlaps']} overlaps cut by time)")
+    return words_to_utterances(words)
+
+def transcribe_chunk(transcriber, chunk_path, rate_limiter: TokenBucket, max_retries: int, retry_delay: float,
+                     cache: TranscriptionCache = None, uploads: UploadTally = None, windows: WindowSettings = None,
+                     window_pool=None):
+    """
+    Serve the chunk from the cache when its audio and model config are unchanged, otherwise transcribe it
+    (as overlapping windows on window_pool when `windows` is set)
+    """
+    def transcribe():
+        if windows is not None:
+            return transcribe_windows(transcriber, chunk_path, windows, window_pool, rate_limiter, max_retries,
+                                      retry_delay, uploads)
+        return transcribe_with_retry(transcriber, chunk_path, rate_limiter, max_retries, retry_delay, uploads)
+
+    with span("transcribe", "chunk", chunk=os.path.basename(chunk_path)) as chunk_span:
+        if cache is None:
+            return transcribe()
+
+        key = cache.key_for(chunk_path)
+        utterances = cache.get(key)
+        chunk_span.set(cached=utterances is not None)
+        if utterances is not None:
+            print(f"📦 Cached: {chunk_path}")
+            return utterances
+
+        utterances = transcribe()
+        cache.put(key, utterances)
+        return utterances
+
+def chunk_number(chunk_path) -> int:
+    return int(re.match(r"chunk_(\d+)", os.path.basename(str(chunk_path))).group(1))
+
+def chunk_durations_ms(chunk_dir, chunk_files) -> dict:
+    """
+    Chunk number -> duration, from the preprocessing chunk plan or else from the chunk files themselves
+    """
+    plan_path = Path(chunk_dir) / CHUNK_PLAN_FILENAME
+    if plan_path.exists():
+        return {chunk["index"]: chunk["duration_ms"] for chunk in ChunkPlan.load(plan_path).chunks}
+    return {chunk_number(chunk_path): audio_duration_ms(chunk_path) for chunk_path in chunk_files}
+
+def chunk_time_map(chunk_dir, chunk_files):
+    """
+    (chunk number, ms inside the chunk) -> ms in the source audio, through the preprocessing chunk plan.
+    Without a plan the chunks are taken to follow each other, so times are in the cleaned audio.
+    """
+    plan_path = Path(chunk_dir) / CHUNK_PLAN_FILENAME
+    if plan_path.exists():
+        return ChunkPlan.load(plan_path).chunk_to_source_ms
+    offsets, offset_ms = {}, 0
+    for chunk_path in chunk_files:
+        offsets[chunk_number(chunk_path)] = offset_ms
+        offset_ms += audio_duration_ms(chunk_path)
+    return lambda chunk, chunk_ms: offsets[chunk] + chunk_ms
+
+def utterance_row(row_id: int, chunk: int, utterance: dict, to_source_ms) -> dict:
+    start, end = utterance.get("start"), utterance.get("end")
+    return {"id": row_id, "speaker": utterance["speaker"], "chunk": chunk, "chunk_start_ms": start,
+            "chunk_end_ms": end, "start_ms": to_source_ms(chunk, start) if start is not None else None,
+            "end_ms": to_source_ms(chunk, end) if end is not None else None, "text": utterance["text"]}
+
+def transcript_line(row) -> str:
+    return f"Speaker {row['speaker']}: {row['text']}\n"
+
+def write_chunk_rows(chunk: int, utterances, outfile, index_file=None, next_id: int = 1, to_source_ms=None) -> int:
+    """
+    Write one chunk's utterances as transcript lines (and index rows); returns the id of the next row
+    """
+    for utterance in utterances:
+        row = utterance_row(next_id, chunk, utterance, to_source_ms or (lambda _, ms: ms))
+        outfile.write(transcript_line(row))
+        if index_file is not None:
+            index_file.write(format_row(row))
+        next_id += 1
+    outfile.flush()
+    return next_id
 
+def window_chunk_workers(chunk_files, windows: WindowSettings, max_in_flight: int = 1) -> int:
+    """
+    Chunk threads needed to keep windows.workers window jobs in flight, plus one that decodes the next chunk
+    while the others' windows run
+    """
+    if not chunk_files:
+        return 1
+    durations = chunk_durations_ms(os.path.dirname(str(chunk_files[0])), chunk_files).values()
+    total_windows = sum(len(plan_windows(duration, windows.window_ms, windows.overlap_ms)) for duration in durations)
+    windows_per_chunk = max(1, total_windows // len(chunk_files))
+    return min(len(chunk_files), max(max_in_flight, math.ceil(windows.workers / windows_per_chunk) + 1))
+
+def transcribe_chunks(transcriber, chunk_files, outfile, max_in_flight: int = 1, rate_limiter: TokenBucket = None,
+                      max_retries: int = 3, retry_delay: float = 5, cache: TranscriptionCache = None,
+                      index_file=None, to_source_ms=None, uploads: UploadTally = None,
+                      windows: WindowSettings = None):
+    """
+    Transcribe chunks with up to max_in_flight jobs at once and write utterances in chunk order:
+    a chunk is written as soon as it and every chunk before it are done. Cached chunks skip the API.
+    With `windows`, every chunk is sent as overlapping windows instead, windows.workers jobs at once, and stitched
+    back together. Chunks are taken in order, only as many at a time as keep the window jobs busy, so earlier
+    chunks' windows go first and only a few chunks are decoded to temporary WAVs at once.
+    With an index_file, every transcript line also gets a row there (ids count up from 1; times via to_source_ms).
+    Raises ChunkTranscriptionError listing the chunks that still failed after their retries.
+    """
+    rate_limiter = rate_limiter or TokenBucket()
+    finished = {}
+    failed = {}
+    next_to_write = 0
+    next_id = 1
+    # In window mode the chunk threads decode, cut, wait and stitch; the window pool bounds the jobs in flight
+    chunk_workers = window_chunk_workers(chunk_files, windows, max_in_flight) if windows is not None else max_in_flight
+
+    with ThreadPoolExecutor(max_workers=max(1, windows.workers if windows else 1)) as window_pool, \
+            ThreadPoolExecutor(max_workers=max(1, chunk_workers)) as pool:
+        futures = {
+            pool.submit(transcribe_chunk, transcriber, chunk_path, rate_limiter, max_retries, retry_delay, cache,
+                        uploads, windows, window_pool): index
+            for index, chunk_path in enumerate(chunk_files)
+        }
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                finished[index] = future.result()
+            except ChunkTranscriptionError as e:
+                failed[index] = str(e)
+                continue
+
+            # Flush every chunk that is now contiguous with what has been written
+            while next_to_write in finished:
+                # Save each speaker-marked line
+                next_id = write_chunk_rows(chunk_number(chunk_files[next_to_write]), finished.pop(next_to_write),
+                                           outfile, index_file, next_id, to_source_ms)
+                print(f"✅ Written: {chunk_files[next_to_write]}")
+                next_to_write += 1
+
+    if failed:
+        details = "\n".join(f"  - {failed[index]}" for index in sorted(failed))
+        raise ChunkTranscriptionError(
+            f"{len(failed)} chunk(s) failed after {max_retries} attempts; "
+            f"transcript stops before {chunk_files[next_to_write]}:\n{details}"
+        )
+
+def matched_speaker(utterance: dict, old_rows) -> str:
+    """
+    Label of the old row this utterance overlaps most: a short clip is diarized on its own, so its A/B labels
+    need not match the full chunk's
+    """
+    best, best_overlap = utterance["speaker"], 0
+    for row in old_rows:
+        overlap = min(utterance["end"], row["chunk_end_ms"]) - max(utterance["start"], row["chunk_start_ms"])
+        if overlap > best_overlap:
+            best, best_overlap = row["speaker"], overlap
+    return best
+
+def retranscribe_selection(transcriber, index: UtteranceIndex, positions, chunk_files, rate_limiter: TokenBucket,
+                           max_retries: int, retry_delay: float, to_source_ms, uploads: UploadTally = None):
+    """
+    Transcribe only the audio under the selected rows: per chunk, one clip from the first selected utterance's
+    start to the last one's end (plus FIX_PADDING_MS). Every row inside a clip is replaced by the new utterances
+    whose midpoint falls inside it. Returns the new index and the seconds of audio sent.
+    """
+    chunk_paths = {chunk_number(chunk_path): chunk_path for chunk_path in chunk_files}
+    by_chunk = {}
+    for position in positions:
+        by_chunk.setdefault(index.rows[position]["chunk"], []).append(index.rows[position])
+    replaced, removed = {}, set()
+    next_id = index.next_id()
+    audio_seconds = 0.0
+    with tempfile.TemporaryDirectory() as clip_dir:
+        for chunk, selected in sorted(by_chunk.items()):
+            if any(row["chunk_start_ms"] is None for row in selected):
+                raise ValueError(f"❌ Chunk {chunk} has utterances without timestamps; re-transcribe the whole file")
+            first = min(row["chunk_start_ms"] for row in selected)
+            last = max(row["chunk_end_ms"] for row in selected)
+            window = [position for position, row in enumerate(index.rows) if row["chunk"] == chunk
+                      and row["chunk_start_ms"] is not None
+                      and row["chunk_start_ms"] >= first and row["chunk_end_ms"] <= last]
+            clip_start = max(0, first - FIX_PADDING_MS)
+            clip_path = os.path.join(clip_dir, f"chunk_{chunk:02}_{clip_start}.wav")
+            _, seconds = cut_clip(chunk_paths[chunk], clip_path, clip_start, last + FIX_PADDING_MS - clip_start)
+            audio_seconds += seconds
+            print(f"🎯 Chunk {chunk:02}: re-transcribing {format_timestamp(first)}-{format_timestamp(last)} "
+                  f"({seconds:.1f}s, {len(window)} utterance(s))")
+
+            old_rows = [index.rows[position] for position in window]
+            new_rows = []
+            for utterance in transcribe_with_retry(transcriber, clip_path, rate_limiter, max_retries, retry_delay,
+                                                   uploads):
+                utterance = dict(utterance, start=utterance["start"] + clip_start, end=utterance["end"] + clip_start)
+                if not first <= (utterance["start"] + utterance["end"]) / 2 <= last:
+                    continue  # Mostly padding: belongs to a neighbouring utterance that is kept as it was
+                utterance["speaker"] = matched_speaker(utterance, old_rows)
+                new_rows.append(utterance_row(next_id, chunk, utterance, to_source_ms))
+                next_id += 1
+            replaced[window[0]] = new_rows
+            removed.update(window[1:])
+
+    rows = []
+    for position, row in enumerate(index.rows):
+        if position in replaced:
+            rows.extend(replaced[position])
+        elif position not in removed:
+            rows.append(row)
+    return UtteranceIndex(rows), audio_seconds
+
+def transcription_settings():
+    """
+    The .env settings that change the transcript: part of the transcription cache key and the manifest entry
+    """
+    settings = {"model": os.getenv("ASSEMBLYAI_MODEL", "best").lower(),
+                "speaker_labels": os.getenv("USE_SPEAKER_DIARIZATION", "true").lower() == "true"}
+    windows = WindowSettings.from_env()
+    if windows is not None:
+        settings.update(windows.config())
+    return settings
+
+def create_transcriber():
+    """
+    AssemblyAI transcriber configured from .env, plus the settings that belong in the transcription cache key
+    """
     aai.settings.api_key = os.getenv("ASSEMBLYAI_API_KEY")
     if not aai.settings.api_key:
         raise EnvironmentError("Missing AssemblyAI API key in .env")
 
     # === CONFIG ===
-    model_name = os.getenv("ASSEMBLYAI_MODEL", "best").lower()
+    settings = transcription_settings()
+    model_name = settings["model"]
 
     model_map = {
         "best": aai.SpeechModel.best,
@@ -36,8 +358,6 @@ def main():
         raise ValueError(f"Invalid ASSEMBLYAI_MODEL: '{model_name}'. Must be one of: {list(model_map.keys())}")
 
     speech_model = model_map[model_name]
-    
-    rate_limit_delay = float(os.getenv("TRANSCRIPTION_RATE_LIMIT_DELAY", "1"))
 
     '''
     Where the actual speaker determination happens:
@@ -49,37 +369,138 @@ def main():
     It does not carry memory across files. Each audio is processed in isolation.
     Does not track speaker identity across files.
     '''
-    use_diarization = os.getenv("USE_SPEAKER_DIARIZATION", "true").lower() == "true"
     config = aai.TranscriptionConfig(
         speech_model=speech_model,
-        speaker_labels=use_diarization
+        speaker_labels=settings["speaker_labels"]
     )
 
     transcriber = aai.Transcriber(config=config)
+    return transcriber, settings
 
-    # === TRANSCRIBE EACH CHUNK ===
-    chunk_files = sorted(glob.glob(str(PREPROCESS_AUDIO_CHUNKS_FOLDER / "chunk_*.wav")))
+def run_stage(manifest: StageManifest, transcriber=None, chunk_dir: Path = PREPROCESS_AUDIO_CHUNKS_FOLDER,
+              output_file: Path = EN_AUDIO_OUTPUT_TEXT_FILE, rate_limiter: TokenBucket = None,
+              cache: TranscriptionCache = None, selection: Selection = None):
+    """
+    Transcribe every chunk in chunk_dir into output_file (and its utterance index) unless the manifest says the
+    transcript is current. With a selection, only the audio under the selected utterances is transcribed again
+    and spliced into the transcript. `transcriber` replaces the AssemblyAI client (e.g.
+    fake_backends.FakeTranscriber). A batch run passes its shared client, rate limiter and cache so every episode
+    draws from the same budget; they are not closed here.
+    """
+    chunk_files = find_chunk_files(chunk_dir)
+    index_file = index_path_for(output_file)
+    spec = {"inputs": chunk_files, "config": transcription_settings(), "outputs": [output_file, index_file]}
+    if selection:
+        if manifest.dry_run:
+            manifest.note("transcript", f"would re-transcribe {selection}")
+            return
+        fix_transcript(manifest, spec, transcriber, chunk_dir, chunk_files, output_file, rate_limiter, selection)
+        return
+    reason = manifest.check("transcript", **spec)
+    if reason is None:
+        print(f"✅ Transcript is up to date: {output_file}. Skipping.")
+        return
+    if manifest.dry_run:
+        return
+    print(f"🔁 Transcribing ({reason})")
+
+    if transcriber is None:
+        transcriber, cache_config = create_transcriber()
+    else:
+        cache_config = transcription_settings()
+
+    rate_limit_delay = float(os.getenv("TRANSCRIPTION_RATE_LIMIT_DELAY", "1"))
+    max_in_flight = int(os.getenv("TRANSCRIPTION_MAX_IN_FLIGHT", "1"))
+    max_retries = int(os.getenv("TRANSCRIPTION_MAX_RETRIES", "3"))
+    retry_delay = float(os.getenv("TRANSCRIPTION_RETRY_DELAY", "5"))
+    use_cache = os.getenv("TRANSCRIPTION_CACHE_ENABLED", "true").lower() == "true"
+    cache_max_mb = float(os.getenv("TRANSCRIPTION_CACHE_MAX_MB", "512"))
 
+    # === TRANSCRIBE EACH CHUNK ===
     if not chunk_files:
         raise FileNotFoundError("No chunk files found in folder")
 
-    os.makedirs(os.path.dirname(EN_AUDIO_OUTPUT_TEXT_FILE), exist_ok=True)
-    with open(EN_AUDIO_OUTPUT_TEXT_FILE, "w", encoding="utf-8") as outfile:
-        for chunk_path in chunk_files:
-            print(f"🎙 Transcribing: {chunk_path}")
-            transcript = transcriber.transcribe(chunk_path)
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    # Job submissions share one token bucket: on average one per TRANSCRIPTION_RATE_LIMIT_DELAY seconds
+    rate_limiter = rate_limiter or TokenBucket.from_delay(rate_limit_delay, burst=max_in_flight)
+    windows = WindowSettings.from_env()
+    print(f"🔍 Chunks: {len(chunk_files)}, in flight: {max_in_flight}, retries: {max_retries}")
+    if windows is not None:
+        print(f"🪟 Low-latency mode: {windows.window_ms / 1000:.0f}s windows, {windows.overlap_ms / 1000:.0f}s overlap, "
+              f"{windows.workers} in flight")
+    shared_cache = cache is not None
+    if use_cache and not shared_cache:
+        cache = TranscriptionCache(
+            os.getenv("TRANSCRIPTION_CACHE_PATH", str(TRANSCRIPTION_CACHE_PATH)),
+            config=cache_config,
+            max_bytes=int(cache_max_mb * 1024 * 1024),
+        )
+    uploads = UploadTally()
+    try:
+        with open(output_file, "w", encoding="utf-8") as outfile, open(index_file, "w", encoding="utf-8") as index:
+            transcribe_chunks(transcriber, chunk_files, outfile, max_in_flight, rate_limiter, max_retries, retry_delay,
+                              cache=cache, index_file=index, to_source_ms=chunk_time_map(chunk_dir, chunk_files),
+                              uploads=uploads, windows=windows)
+    finally:
+        if cache is not None and not shared_cache:
+            print(cache.summary())
+            cache.close()
 
-            if transcript.status == "error":
-                print(f"❌ Transcription failed for {chunk_path}: {transcript.error}")
-                continue
+    audio_seconds = sum(chunk_durations_ms(chunk_dir, chunk_files).values()) / 1000
+    print(f"📤 Uploaded {uploads.uploads} chunk(s): {describe_bytes_per_hour(uploads.bytes, audio_seconds)}")
+    print(f"✅ Merged transcript saved to: {output_file}")
+    print(f"🗂 Utterance index saved to: {index_file}")
+    manifest.record("transcript", "transcribe", **spec)
+
+def fix_transcript(manifest: StageManifest, spec: dict, transcriber, chunk_dir, chunk_files, output_file,
+                   rate_limiter: TokenBucket, selection: Selection):
+    """
+    Re-transcribe the selected utterances only; the transcript and index are rewritten and recorded as current,
+    so the next full run keeps the fix until the chunks themselves change
+    """
+    index_file = index_path_for(output_file)
+    index = UtteranceIndex.load(index_file)
+    positions = index.select(selection)
+    if not positions:
+        print(f"⚠️ No utterances in {selection}; nothing to re-transcribe.")
+        return
+    if transcriber is None:
+        transcriber, _ = create_transcriber()
+    max_retries = int(os.getenv("TRANSCRIPTION_MAX_RETRIES", "3"))
+    retry_delay = float(os.getenv("TRANSCRIPTION_RETRY_DELAY", "5"))
+    rate_limiter = rate_limiter or TokenBucket.from_delay(float(os.getenv("TRANSCRIPTION_RATE_LIMIT_DELAY", "1")))
 
-            # Save each speaker-marked line
-            for utterance in transcript.utterances:
-                outfile.write(f"Speaker {utterance.speaker}: {utterance.text}\n")
+    index, audio_seconds = retranscribe_selection(transcriber, index, positions, chunk_files, rate_limiter,
+                                                  max_retries, retry_delay, chunk_time_map(chunk_dir, chunk_files))
+    temp_file = f"{output_file}.tmp"
+    with open(temp_file, "w", encoding="utf-8") as outfile:
+        outfile.writelines(transcript_line(row) for row in index.rows)
+    os.replace(temp_file, output_file)
+    index.save(index_file)
+    print(f"✅ Re-transcribed {len(positions)} selected utterance(s) from {audio_seconds:.1f}s of audio "
+          f"into {output_file}")
+    manifest.record("transcript", "transcribe", **spec)
 
-            time.sleep(rate_limit_delay)
+def main():
+    parser = argparse.ArgumentParser(description="Transcribe the preprocessed chunks with AssemblyAI")
+    parser.add_argument("--plan", action="store_true", help="List what would be rebuilt without running anything")
+    add_selection_arguments(parser)
+    args = parser.parse_args()
+
+    # === SETUP ===
+    # Load .env from parent of current file
+    env_path = Path(__file__).resolve().parent.parent / ".env"
+    load_dotenv(dotenv_path=env_path)
 
-    print(f"✅ Merged transcript saved to: {EN_AUDIO_OUTPUT_TEXT_FILE}")
+    manifest = open_manifest(dry_run=args.plan)
+    start_run("transcribe", enabled=not args.plan)
+    try:
+        run_stage(manifest, selection=selection_from_args(args))
+    finally:
+        manifest.save()
+        finish_run()
+    if args.plan:
+        manifest.print_plan()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
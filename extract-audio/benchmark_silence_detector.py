@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Silence Detector Benchmark
+- Times pydub's silence.detect_silence / detect_nonsilent against silence_detector.FrameEnergy
+- Checks that both return exactly the same range boundaries
+- Runs on joe-charlie-aa-js/test-data/*.mp3 plus a few synthetic edge cases
+
+Usage: python extract-audio/benchmark_silence_detector.py [--seconds 120] [--min-silence-len 300 500]
+"""
+
+import argparse
+import sys
+import time
+import numpy as np
+from pathlib import Path
+from pydub import AudioSegment, silence
+from preprocess_audio import decode_pcm_blocks, TARGET_SAMPLE_RATE
+from silence_detector import FrameEnergy
+
+# === CONFIGURATION ===
+SCRIPT_DIR = Path(__file__).resolve().parent
+TEST_DATA_GLOB = SCRIPT_DIR.parent / "joe-charlie-aa-js/test-data"
+SILENCE_THRESH_DB = -40
+
+def load_test_audio(path: Path, seconds: float) -> AudioSegment:
+    # Decode the same way the pipeline does (mono, 16 kHz), then wrap the PCM in an AudioSegment
+    max_samples = int(seconds * TARGET_SAMPLE_RATE) if seconds else None
+    blocks, total = [], 0
+    for block in decode_pcm_blocks(path, TARGET_SAMPLE_RATE):
+        blocks.append(block)
+        total += len(block)
+        if max_samples and total >= max_samples:
+            break
+    samples = np.concatenate(blocks)[:max_samples]
+    return AudioSegment(data=samples.tobytes(), sample_width=2, frame_rate=TARGET_SAMPLE_RATE, channels=1)
+
+def synthetic_cases():
+    """
+    Short signals that hit the boundary cases: silence at both ends, partial last ms, 44.1 kHz stereo
+    """
+    rng = np.random.default_rng(7)
+    speech = lambda n: rng.integers(-8000, 8000, n).astype(np.int16)
+    quiet = lambda n: rng.integers(-20, 20, n).astype(np.int16)
+
+    mono = np.concatenate([quiet(16000), speech(24000), quiet(8000), speech(4000), quiet(12008)])
+    yield "16k mono, partial ms tail", AudioSegment(data=mono.tobytes(), sample_width=2, frame_rate=16000, channels=1)
+
+    odd = np.concatenate([speech(3001), quiet(9000), speech(5000), quiet(4411)])
+    yield "16k mono, all-speech edges", AudioSegment(data=odd.tobytes(), sample_width=2, frame_rate=16000, channels=1)
+
+    stereo = np.concatenate([quiet(44100 * 2), speech(30000 * 2), quiet(22051 * 2)])
+    yield "44.1k stereo", AudioSegment(data=stereo.tobytes(), sample_width=2, frame_rate=44100, channels=2)
+
+    yield "all silence", AudioSegment(data=quiet(32000).tobytes(), sample_width=2, frame_rate=16000, channels=1)
+
+def compare(label: str, audio: AudioSegment, min_silence_lens, seek_steps=(1,)) -> bool:
+    print(f"\n🎧 {label} ({len(audio) / 1000:.1f} sec)")
+
+    start = time.perf_counter()
+    energy = FrameEnergy.from_audio_segment(audio)
+    numpy_setup = time.perf_counter() - start
+
+    all_match = True
+    for min_silence_len in min_silence_lens:
+        for seek_step in seek_steps:
+            start = time.perf_counter()
+            expected_silent = silence.detect_silence(audio, min_silence_len, SILENCE_THRESH_DB, seek_step)
+            expected_nonsilent = silence.detect_nonsilent(audio, min_silence_len, SILENCE_THRESH_DB, seek_step)
+            pydub_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            actual_silent = energy.detect_silence(min_silence_len, SILENCE_THRESH_DB, seek_step)
+            actual_nonsilent = energy.detect_nonsilent(min_silence_len, SILENCE_THRESH_DB, seek_step)
+            numpy_time = time.perf_counter() - start
+
+            match = expected_silent == actual_silent and expected_nonsilent == actual_nonsilent
+            all_match &= match
+            speedup = pydub_time / max(numpy_time + numpy_setup, 1e-9)
+            print(f"  min_silence_len={min_silence_len} seek_step={seek_step}: "
+                  f"pydub {pydub_time:.3f}s, numpy {numpy_time:.4f}s (+{numpy_setup:.4f}s setup), "
+                  f"x{speedup:.0f}, {len(actual_silent)} silent ranges {'✅' if match else '❌ MISMATCH'}")
+            if not match:
+                print(f"    pydub silent:    {expected_silent[:5]} ... {expected_silent[-3:]}")
+                print(f"    numpy silent:    {actual_silent[:5]} ... {actual_silent[-3:]}")
+    return all_match
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pydub vs vectorized silence detection")
+    parser.add_argument("--seconds", type=float, default=120,
+                        help="Only use the first N seconds of each test file (0 = whole file; pydub is slow)")
+    parser.add_argument("--min-silence-len", type=int, nargs="+", default=[300, 500])
+    args = parser.parse_args()
+
+    all_match = True
+    for label, audio in synthetic_cases():
+        all_match &= compare(label, audio, args.min_silence_len, seek_steps=(1, 7))
+
+    for path in sorted(TEST_DATA_GLOB.glob("*.mp3")):
+        audio = load_test_audio(path, args.seconds)
+        all_match &= compare(path.name, audio, args.min_silence_len)
+
+    if not all_match:
+        print("\n❌ Range boundaries differ from pydub.")
+        sys.exit(1)
+    print("\n🎉 All range boundaries match pydub.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Window Stitching Check
+- Transcribes the preprocessed chunks of joe-charlie-aa-js/test-data/*.mp3 twice with a FixtureTranscriber:
+  once chunk by chunk (the normal mode) and once as short overlapping windows stitched by window_stitch.py
+- The fixture is word timings for every chunk: the sample English transcript's words laid over the chunk's
+  non-silent audio (or --fixtures FILE, e.g. word timings saved from a real AssemblyAI job)
+- The fake drops words cut by a clip's edges, jitters timestamps and shuffles speaker labels per clip; a job takes
+  longer the more audio it holds, so time to first text and wall time compare like the real service
+- Reports word error rate and speaker agreement of the stitched transcript against the chunk-by-chunk one, and
+  exits with 1 when either is outside --max-wer / --min-speaker-agreement
+
+Usage: python extract-audio/benchmark_windows.py [--window-sec 45] [--overlap-sec 5] [--workers 16] [--jitter-ms 60]
+"""
+
+import argparse
+import contextlib
+import difflib
+import glob
+import json
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+TEST_DATA_DIR = SCRIPT_DIR.parent / "joe-charlie-aa-js/test-data"
+SAMPLE_TRANSCRIPT = SCRIPT_DIR.parent / "joe-charlie-aa-js/01-extracted-native-text/transcript_en_01.txt"
+
+sys.path.insert(0, str(SCRIPT_DIR.parent / "pipeline-common"))
+from assemblescript import transcribe_chunks
+from dialogue_format import parse_dialogue
+from fake_backends import FixtureTranscriber
+from preprocess_audio import decode_pcm_blocks, find_chunk_files, preprocess_audio_streaming
+from silence_detector import FrameEnergy
+from utterance_index import UtteranceIndex, index_path_for
+from window_stitch import WindowSettings, normalize_word, parse_clip_name
+
+MS_PER_CHAR = 55                          # Fixture words: duration grows with length, like speech
+MIN_WORD_MS = 120
+WORD_GAP_MS = 60
+
+# === FIXTURE ===
+def sample_words():
+    """
+    (speaker letter, word) of the sample transcript, cycling forever
+    """
+    with open(SAMPLE_TRANSCRIPT, "r", encoding="utf-8") as f:
+        turns = [(speaker[-1], text.split()) for speaker, text in parse_dialogue(f) if speaker]
+    while True:
+        for speaker, words in turns:
+            for word in words:
+                yield speaker, word
+
+def speech_ranges(chunk_path):
+    samples = np.concatenate(list(decode_pcm_blocks(chunk_path)))
+    energy = FrameEnergy(samples, 16000)
+    return energy.detect_nonsilent(min_silence_len=300, silence_thresh=min(-40, energy.dBFS - 10))
+
+def make_fixtures(chunk_files):
+    """
+    Chunk name -> words (text, start, end, speaker) laid one after another over the chunk's speech
+    """
+    words = sample_words()
+    fixtures = {}
+    for chunk_path in chunk_files:
+        chunk_words = []
+        for start_ms, end_ms in speech_ranges(chunk_path):
+            position = start_ms
+            while True:
+                speaker, text = next(words)
+                duration = max(MIN_WORD_MS, MS_PER_CHAR * len(text))
+                if position + duration > end_ms:
+                    break
+                chunk_words.append({"text": text, "start": position, "end": position + duration, "speaker": speaker})
+                position += duration + WORD_GAP_MS
+        fixtures[Path(chunk_path).stem] = chunk_words
+    return fixtures
+
+# === RUNS ===
+class FirstWrite:
+    """
+    Transcript file stand-in that remembers when the first line arrived
+    """
+    def __init__(self, path):
+        self.file = open(path, "w", encoding="utf-8")
+        self.started = time.perf_counter()
+        self.first_text = None
+
+    def write(self, text):
+        if self.first_text is None:
+            self.first_text = time.perf_counter() - self.started
+        self.file.write(text)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+def transcribe(transcriber, chunk_files, output_file, windows):
+    outfile = FirstWrite(output_file)
+    # The per-job progress lines go to a log next to the transcript
+    with open(f"{output_file}.log", "w", encoding="utf-8") as log, contextlib.redirect_stdout(log), \
+            open(index_path_for(output_file), "w", encoding="utf-8") as index_file:
+        try:
+            transcribe_chunks(transcriber, chunk_files, outfile, max_in_flight=len(chunk_files), windows=windows,
+                              max_retries=1, index_file=index_file)
+        finally:
+            outfile.close()
+    return outfile.first_text, time.perf_counter() - outfile.started
+
+def transcript_words(path):
+    """
+    (speaker, word) of a transcript, from its utterance index; labels are per chunk (every job diarizes on its
+    own, in both modes), so the speaker is (chunk, label)
+    """
+    rows = UtteranceIndex.load(index_path_for(path)).rows
+    return [((row["chunk"], row["speaker"]), normalize_word(word)) for row in rows for word in row["text"].split()]
+
+def compare(reference, stitched):
+    """
+    Word error rate (substitutions + deletions + insertions over reference words) and the share of matching
+    words whose speaker agrees under the best one-to-one renaming of labels
+    """
+    matcher = difflib.SequenceMatcher(None, [w for _, w in reference], [w for _, w in stitched], autojunk=False)
+    errors, pairs = 0, Counter()
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            pairs.update((reference[i][0], stitched[j][0]) for i, j in zip(range(i1, i2), range(j1, j2)))
+        else:
+            errors += max(i2 - i1, j2 - j1)
+    mapping, taken = {}, set()
+    for (ref, hyp), _ in pairs.most_common():
+        if hyp not in mapping and ref not in taken:
+            mapping[hyp] = ref
+            taken.add(ref)
+    agreeing = sum(n for (ref, hyp), n in pairs.items() if mapping.get(hyp) == ref)
+    matched = sum(pairs.values())
+    return errors / max(1, len(reference)), agreeing / max(1, matched)
+
+def check_file(audio, args, work_dir) -> bool:
+    print(f"\n🎧 {audio.name}")
+    chunk_dir = work_dir / audio.stem / "chunks"
+    preprocess_audio_streaming(audio, work_dir / audio.stem / "cleaned.wav", chunk_dir=chunk_dir,
+                               keep_cleaned_wav=False)
+    chunk_files = find_chunk_files(chunk_dir)
+    if args.fixtures:
+        with open(args.fixtures, "r", encoding="utf-8") as f:
+            fixtures = json.load(f)
+    else:
+        fixtures = make_fixtures(chunk_files)
+        with open(work_dir / audio.stem / "fixtures.json", "w", encoding="utf-8") as f:
+            json.dump(fixtures, f)
+
+    transcriber = FixtureTranscriber(fixtures, parse_clip_name, jitter_ms=args.jitter_ms, latency=args.latency,
+                                     seconds_per_audio_second=args.seconds_per_audio_second)
+    windows = WindowSettings(int(args.window_sec * 1000), int(args.overlap_sec * 1000), args.workers)
+    reference_file, stitched_file = work_dir / audio.stem / "chunks.txt", work_dir / audio.stem / "windows.txt"
+    chunk_first, chunk_wall = transcribe(transcriber, chunk_files, reference_file, None)
+    window_first, window_wall = transcribe(transcriber, chunk_files, stitched_file, windows)
+
+    reference, stitched = transcript_words(reference_file), transcript_words(stitched_file)
+    wer, agreement = compare(reference, stitched)
+    ok = wer <= args.max_wer and agreement >= args.min_speaker_agreement
+    print(f"  {len(chunk_files)} chunk(s), {sum(len(words) for words in fixtures.values())} fixture words")
+    print(f"  chunk by chunk: first text {chunk_first:6.2f}s, wall {chunk_wall:6.2f}s, {len(reference)} words")
+    print(f"  windows:        first text {window_first:6.2f}s, wall {window_wall:6.2f}s, {len(stitched)} words")
+    print(f"  WER {100 * wer:.2f}%, speaker agreement {100 * agreement:.2f}% {'✅' if ok else '❌'}")
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description="Check stitched window transcription against chunk-by-chunk output")
+    parser.add_argument("--audio", nargs="+", type=Path,
+                        default=sorted(Path(p) for p in glob.glob(str(TEST_DATA_DIR / "*.mp3"))))
+    parser.add_argument("--fixtures", type=Path, help="Word timings to replay instead of the generated ones")
+    parser.add_argument("--window-sec", type=float, default=45)
+    parser.add_argument("--overlap-sec", type=float, default=5)
+    parser.add_argument("--workers", type=int, default=16, help="Window jobs in flight")
+    parser.add_argument("--jitter-ms", type=int, default=60, help="Timestamp noise of the fake per word")
+    parser.add_argument("--latency", type=float, default=0.2, help="Fake seconds per job")
+    parser.add_argument("--seconds-per-audio-second", type=float, default=0.01,
+                        help="Fake job time added per second of audio sent")
+    parser.add_argument("--max-wer", type=float, default=0.005)
+    parser.add_argument("--min-speaker-agreement", type=float, default=0.99)
+    args = parser.parse_args()
+
+    all_ok = True
+    with tempfile.TemporaryDirectory(prefix="window-check-") as work_dir:
+        for audio in args.audio:
+            all_ok &= check_file(audio, args, Path(work_dir))
+    if not all_ok:
+        print("\n❌ Stitched transcripts differ from the chunk-by-chunk ones beyond the limits.")
+        sys.exit(1)
+    print("\n🎉 Stitched transcripts match the chunk-by-chunk ones.")
+
+if __name__ == "__main__":
+    main()
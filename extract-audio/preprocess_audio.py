@@ -4,17 +4,36 @@ Audio Preprocessing Script
 - Normalize audio to improve transcription accuracy
 - Remove silence and clean the audio
 - Perform smart silence-aware chunking (4-6 min)
+- Optional streaming mode for multi-hour inputs (PREPROCESS_STREAMING=true)
+- Skipped when the input audio and settings match the pipeline manifest (--plan lists what would run)
 """
 
-from pydub import AudioSegment, effects, silence
+from pydub import AudioSegment, effects
+from pydub.utils import db_to_float, ratio_to_db
+from dotenv import load_dotenv
+from silence_detector import FrameEnergy, StreamingSilenceDetector, nonsilent_from_silent
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import argparse
+import glob
+import json
 import os
+import sys
 import math
+import subprocess
+import tempfile
+import time
+import wave
 from pathlib import Path
 
 # === CONFIGURATION ===
 SCRIPT_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(SCRIPT_DIR.parent / "pipeline-common"))
+from stage_manifest import StageManifest, open_manifest
+from metrics import count, finish_run, record_span, span, start_run
 INPUT_AUDIO_PATH = SCRIPT_DIR.parent / "joe-charlie-aa-js/test-data/joe-charlie-first-5-minutes.mp3"
-# Output path for the cleaned WAV version of the audio (this is just final processed audio.wav.  This file will not be used for the further process)
+# Output path for the cleaned WAV version of the audio (only kept with PREPROCESS_KEEP_CLEANED_WAV=true.  This file will not be used for the further process)
 OUTPUT_FOLDER_PATH = SCRIPT_DIR.parent / "joe-charlie-aa-js/test-output/preprocess-audio"
 # Directory where audio chunks will be saved (this chunk data will be used for the next text extraction)
 CHUNK_DIR = SCRIPT_DIR.parent / "joe-charlie-aa-js/test-output/preprocess-audio/chunks"
@@ -27,8 +46,17 @@ PADDING_MS = 500                          # Add buffer before and after non-sile
 NORMALIZATION_TARGET_DBFS = -20           # Ideal volume level for clean voice audio
 MIN_CHUNK_MS = 4 * 60 * 1000              # Minimum chunk size: 4 minutes
 MAX_CHUNK_MS = 6 * 60 * 1000              # Maximum chunk size: 6 minutes
+STREAM_BLOCK_MS = 10 * 1000               # Streaming mode: decode 10 seconds of audio per block
+CHUNK_PLAN_FILENAME = "chunk_plan.json"   # Written next to the chunks: offsets, durations and source time map
+CHUNK_EXPORT_WORKERS = os.cpu_count() or 1  # Processes used to encode chunk files in parallel
+# Chunk file format -> extension: lossless FLAC (about half the size of WAV), Opus (smallest upload) or plain WAV
+CHUNK_FORMATS = {"flac": ".flac", "opus": ".opus", "wav": ".wav"}
+DEFAULT_CHUNK_FORMAT = "flac"
+DEFAULT_OPUS_BITRATE = "32k"              # Opus chunks: speech at 16 kHz stays clear for transcription
 
-def preprocess_audio(input_path: Path, output_path: Path, sample_rate: int = TARGET_SAMPLE_RATE):
+def preprocess_audio(input_path: Path, output_path: Path, sample_rate: int = TARGET_SAMPLE_RATE,
+                     chunk_dir: Path = CHUNK_DIR, chunk_format: str = DEFAULT_CHUNK_FORMAT,
+                     opus_bitrate: str = DEFAULT_OPUS_BITRATE, keep_cleaned_wav: bool = True):
     print(f"🔊 Loading audio from: {input_path}")
     
     # Load and downmix audio to mono with target sample rate
@@ -47,9 +75,9 @@ def preprocess_audio(input_path: Path, output_path: Path, sample_rate: int = TAR
     silence_thresh_db = min(-40, normalized_audio.dBFS - 10)
     print(f"🔍 Silence threshold set to: {silence_thresh_db:.2f} dBFS")
 
-    # Detect non-silent regions
-    nonsilent_ranges = silence.detect_nonsilent(
-        normalized_audio,
+    # Detect non-silent regions (frame energies are computed once and reused for chunking below)
+    energy = FrameEnergy.from_audio_segment(normalized_audio)
+    nonsilent_ranges = energy.detect_nonsilent(
         min_silence_len=500,
         silence_thresh=silence_thresh_db
     )
@@ -58,70 +86,599 @@ def preprocess_audio(input_path: Path, output_path: Path, sample_rate: int = TAR
     if not nonsilent_ranges:
         print("⚠️ No silent segments detected — processing full audio without trimming.")
         cleaned_audio = normalized_audio
+        cleaned_energy = energy
+        padded_ranges = [(0, len(normalized_audio))]
     else:   # Merge all non-silent regions with padding
         cleaned_audio = AudioSegment.silent(duration=0)
+        padded_ranges = []
         for start_ms, end_ms in nonsilent_ranges:
             start_ms = max(0, start_ms - PADDING_MS)
             end_ms = min(len(normalized_audio), end_ms + PADDING_MS)
             cleaned_audio += normalized_audio[start_ms:end_ms]
+            padded_ranges.append((start_ms, end_ms))
+        cleaned_energy = energy.subset(padded_ranges) if sample_rate % 1000 == 0 else None
 
     # Report final cleaned length
     cleaned_duration_sec = len(cleaned_audio) / 1000
     print(f"⏱ Cleaned duration: {cleaned_duration_sec:.2f} seconds")
 
-    # Save cleaned WAV file
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    cleaned_audio.export(output_path, format="wav")
-    print(f"✅ Exported cleaned audio to: {output_path}")
+    # Save cleaned WAV file (otherwise the chunks are cut from a temporary copy)
+    if keep_cleaned_wav:
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        cleaned_audio.export(output_path, format="wav")
+        print(f"✅ Exported cleaned audio to: {output_path}")
 
     # If short audio, save as single chunk
     if len(cleaned_audio) <= MAX_CHUNK_MS:
         print("🧩 Audio is short — saving as single chunk.")
-        os.makedirs(CHUNK_DIR, exist_ok=True)
-        cleaned_audio.export(os.path.join(CHUNK_DIR, "chunk_01.wav"), format="wav")
-    else:   # Perform smart silence-aware chunking  
-        smart_chunk_audio(cleaned_audio, CHUNK_DIR, MIN_CHUNK_MS, MAX_CHUNK_MS)
+    # Perform smart silence-aware chunking, cutting the chunks from the cleaned WAV just written
+    smart_chunk_audio(cleaned_audio, chunk_dir, MIN_CHUNK_MS, MAX_CHUNK_MS, energy=cleaned_energy,
+                      source_wav=output_path if keep_cleaned_wav else None, segments=kept_segments(padded_ranges),
+                      source_audio=input_path, chunk_format=chunk_format, opus_bitrate=opus_bitrate)
 
-def smart_chunk_audio(audio: AudioSegment, output_dir: Path, min_chunk_ms: int, max_chunk_ms: int):
+def smart_chunk_audio(audio: AudioSegment, output_dir: Path, min_chunk_ms: int, max_chunk_ms: int,
+                      energy: FrameEnergy = None, source_wav: Path = None, segments=None, source_audio: Path = None,
+                      chunk_format: str = DEFAULT_CHUNK_FORMAT, opus_bitrate: str = DEFAULT_OPUS_BITRATE):
     """
     Split audio intelligently on silence, aiming for chunks between min and max duration
     """
     os.makedirs(output_dir, exist_ok=True)
 
     # Detect silence ranges to find split points
-    silence_thresh_db = min(-40, audio.dBFS - 10)
-    silent_ranges = silence.detect_silence(
-        audio,
+    if energy is None:
+        energy = FrameEnergy.from_audio_segment(audio)
+    silence_thresh_db = min(-40, energy.dBFS - 10)
+    silent_ranges = energy.detect_silence(
         min_silence_len=300,
         silence_thresh=silence_thresh_db
     )
 
+    plan = ChunkPlan.from_split_points(
+        plan_chunks(len(audio), silent_ranges, min_chunk_ms, max_chunk_ms),
+        segments or kept_segments([(0, len(audio))]), audio.frame_rate,
+        source_audio=source_audio, cleaned_audio=source_wav, chunk_format=chunk_format, opus_bitrate=opus_bitrate,
+    )
+
+    # Chunks are cut from a WAV on disk so worker processes never receive the audio itself
+    if source_wav is None:
+        with tempfile.NamedTemporaryFile(suffix=".wav", dir=output_dir, delete=False) as tmp:
+            temp_wav = tmp.name
+        try:
+            audio.export(temp_wav, format="wav")
+            export_planned_chunks(temp_wav, plan, output_dir)
+        finally:
+            os.remove(temp_wav)
+    else:
+        export_planned_chunks(source_wav, plan, output_dir)
+
+def plan_chunks(total_ms: int, silent_ranges, min_chunk_ms: int, max_chunk_ms: int):
+    """
+    Return (start_ms, end_ms) pairs covering the audio. Each split lands on the start of the longest
+    silence that begins between min_chunk_ms and max_chunk_ms into the chunk, found by bisecting a
+    sorted index of silence starts; a tail that fits in one chunk is not split again.
+    """
+    silences = sorted(silent_ranges)
+    silence_starts = [start for start, _ in silences]
+    silence_lengths = [end - start for start, end in silences]
+
+    split_points = []
     current_pos = 0
-    chunk_index = 1
 
-    while current_pos < len(audio):
-        target_end = min(current_pos + max_chunk_ms, len(audio))
+    while current_pos < total_ms:
+        target_end = min(current_pos + max_chunk_ms, total_ms)
+        best_split = target_end
+
+        if total_ms - current_pos > max_chunk_ms:
+            first = bisect_left(silence_starts, current_pos + min_chunk_ms)
+            last = bisect_right(silence_starts, target_end)
+            if first < last:
+                # Longest silence wins; the earliest one breaks ties
+                best = max(range(first, last), key=lambda k: (silence_lengths[k], -k))
+                best_split = silence_starts[best]
+
+        split_points.append((current_pos, best_split))
+        current_pos = best_split
+
+    return split_points
 
-        # Find nearest silence point after min_chunk_ms
-        candidate_silences = [
-            s for s in silent_ranges if current_pos + min_chunk_ms <= s[0] <= target_end
+def kept_segments(kept_ranges_ms):
+    """
+    Map of the cleaned audio back to the source: one entry per kept (start_ms, end_ms) source range
+    """
+    segments = []
+    cleaned_ms = 0
+    for start_ms, end_ms in kept_ranges_ms:
+        segments.append({"cleaned_ms": cleaned_ms, "source_ms": start_ms, "duration_ms": end_ms - start_ms})
+        cleaned_ms += end_ms - start_ms
+    return segments
+
+class ChunkPlan:
+    """
+    Chunk offsets/durations in the cleaned audio plus the cleaned → source time map (chunk_plan.json)
+    """
+    def __init__(self, chunks, segments, sample_rate: int, source_audio=None, cleaned_audio=None,
+                 chunk_format: str = "wav", opus_bitrate: str = None):
+        self.chunks = chunks
+        self.segments = segments
+        self.sample_rate = sample_rate
+        self.source_audio = str(source_audio) if source_audio else None
+        self.cleaned_audio = str(cleaned_audio) if cleaned_audio else None
+        self.chunk_format = chunk_format
+        self.opus_bitrate = opus_bitrate if chunk_format == "opus" else None
+        self._segment_starts = [segment["cleaned_ms"] for segment in segments]
+
+    @classmethod
+    def from_split_points(cls, split_points, segments, sample_rate: int, source_audio=None, cleaned_audio=None,
+                          chunk_format: str = DEFAULT_CHUNK_FORMAT, opus_bitrate: str = DEFAULT_OPUS_BITRATE):
+        extension = CHUNK_FORMATS[chunk_format]
+        chunks = [
+            {"index": index, "file": f"chunk_{index:02}{extension}", "offset_ms": start_ms,
+             "duration_ms": end_ms - start_ms}
+            for index, (start_ms, end_ms) in enumerate(split_points, start=1)
         ]
+        return cls(chunks, segments, sample_rate, source_audio, cleaned_audio, chunk_format, opus_bitrate)
 
-        best_split = candidate_silences[0][0] if candidate_silences else target_end
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        # Plans written before chunks could be compressed have no chunk_format: their chunks are WAV
+        return cls(data["chunks"], data["segments"], data["sample_rate"], data.get("source_audio"),
+                   data.get("cleaned_audio"), data.get("chunk_format", "wav"), data.get("opus_bitrate"))
 
-        # Extract chunk and export
-        chunk = audio[current_pos:best_split]
-        chunk_filename = os.path.join(output_dir, f"chunk_{chunk_index:02}.wav")
-        chunk.export(chunk_filename, format="wav")
-        print(f"✅ Saved: {chunk_filename} ({len(chunk)/1000:.2f} sec)")
+    def save(self, path):
+        data = {
+            "source_audio": self.source_audio,
+            "cleaned_audio": self.cleaned_audio,
+            "sample_rate": self.sample_rate,
+            "chunk_format": self.chunk_format,
+            "opus_bitrate": self.opus_bitrate,
+            "chunks": self.chunks,
+            "segments": self.segments,
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
 
-        current_pos = best_split
-        chunk_index += 1
+    def to_source_ms(self, cleaned_ms: int) -> int:
+        """
+        Source-audio time of a position in the cleaned audio
+        """
+        if not self.segments:
+            return cleaned_ms
+        segment = self.segments[max(0, bisect_right(self._segment_starts, cleaned_ms) - 1)]
+        return segment["source_ms"] + min(max(0, cleaned_ms - segment["cleaned_ms"]), segment["duration_ms"])
+
+    def chunk_to_source_ms(self, chunk_index: int, chunk_ms: int) -> int:
+        """
+        Source-audio time of a position inside chunk `chunk_index` (1-based, as in chunk_NN.wav)
+        """
+        return self.to_source_ms(self.chunks[chunk_index - 1]["offset_ms"] + chunk_ms)
+
+def chunk_format_from_env():
+    """
+    PREPROCESS_CHUNK_FORMAT (flac / opus / wav) and PREPROCESS_OPUS_BITRATE
+    """
+    chunk_format = os.getenv("PREPROCESS_CHUNK_FORMAT", DEFAULT_CHUNK_FORMAT).lower()
+    if chunk_format not in CHUNK_FORMATS:
+        raise ValueError(f"❌ PREPROCESS_CHUNK_FORMAT must be one of {', '.join(CHUNK_FORMATS)}, got '{chunk_format}'")
+    return chunk_format, os.getenv("PREPROCESS_OPUS_BITRATE", DEFAULT_OPUS_BITRATE)
 
+def find_chunk_files(chunk_dir):
+    """
+    Chunk files of every format in chunk_dir, in chunk order
+    """
+    return sorted(path for extension in CHUNK_FORMATS.values()
+                  for path in glob.glob(str(Path(chunk_dir) / f"chunk_*{extension}")))
+
+def audio_duration_ms(path) -> int:
+    if str(path).lower().endswith(".wav"):
+        with wave.open(str(path), "rb") as wav_file:
+            return wav_file.getnframes() * 1000 // wav_file.getframerate()
+    return len(AudioSegment.from_file(path))
+
+def describe_bytes_per_hour(total_bytes: int, audio_seconds: float) -> str:
+    per_hour = total_bytes / (audio_seconds / 3600) if audio_seconds else 0
+    return (f"{total_bytes / 1024 / 1024:.1f} MB for {audio_seconds / 60:.1f} min of audio "
+            f"({per_hour / 1024 / 1024:.1f} MB per audio hour)")
+
+def encode_pcm(frames: bytes, params, chunk_path, opus_bitrate: str = DEFAULT_OPUS_BITRATE):
+    """
+    Write raw PCM frames to chunk_path through ffmpeg; the codec follows the extension (.flac or .opus)
+    """
+    if str(chunk_path).endswith(CHUNK_FORMATS["opus"]):
+        codec = ["-c:a", "libopus", "-b:a", opus_bitrate, "-application", "voip"]
+    else:
+        codec = ["-c:a", "flac"]
+    command = [
+        AudioSegment.converter, "-nostdin", "-v", "error", "-y",
+        "-f", f"s{params.sampwidth * 8}le", "-ar", str(params.framerate), "-ac", str(params.nchannels), "-i", "-",
+        *codec, str(chunk_path),
+    ]
+    result = subprocess.run(command, input=frames, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        message = result.stderr.decode("utf-8", errors="replace").strip()
+        raise RuntimeError(f"❌ ffmpeg failed to encode {chunk_path}: {message}")
+
+def export_chunk_from_wav(source_wav, chunk_path, offset_ms: int, duration_ms: int,
+                          opus_bitrate: str = DEFAULT_OPUS_BITRATE):
+    """
+    Copy one planned chunk out of the cleaned WAV (runs in a worker process).
+    A .flac or .opus chunk_path is encoded on the way out; .wav is copied as is.
+    """
+    with wave.open(str(source_wav), "rb") as source:
+        sample_rate = source.getframerate()
+        start_frame = offset_ms * sample_rate // 1000
+        frame_count = duration_ms * sample_rate // 1000
+        source.setpos(min(start_frame, source.getnframes()))
+        frames = source.readframes(frame_count)
+        params = source.getparams()
+
+    if str(chunk_path).lower().endswith(".wav"):
+        with wave.open(str(chunk_path), "wb") as chunk:
+            chunk.setparams(params)
+            chunk.writeframes(frames)
+    else:
+        encode_pcm(frames, params, chunk_path, opus_bitrate)
+    return str(chunk_path), len(frames) / (params.sampwidth * params.nchannels) / sample_rate
+
+def decode_to_wav(chunk_path, wav_path):
+    """
+    Decode a FLAC or Opus chunk to a WAV once, so many clips can be cut from it without decoding again
+    """
+    command = [AudioSegment.converter, "-nostdin", "-v", "error", "-y", "-i", str(chunk_path),
+               "-acodec", "pcm_s16le", str(wav_path)]
+    result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        message = result.stderr.decode("utf-8", errors="replace").strip()
+        raise RuntimeError(f"❌ ffmpeg failed to decode {chunk_path}: {message}")
+    return str(wav_path)
+
+def cut_clip(chunk_path, clip_path, offset_ms: int, duration_ms: int):
+    """
+    A WAV clip of any chunk file (WAV, FLAC or Opus); returns the clip's path and its seconds of audio
+    """
+    if str(chunk_path).lower().endswith(".wav"):
+        return export_chunk_from_wav(chunk_path, clip_path, offset_ms, duration_ms)
+    command = [
+        AudioSegment.converter, "-nostdin", "-v", "error", "-y",
+        "-ss", f"{offset_ms / 1000:.3f}", "-t", f"{duration_ms / 1000:.3f}", "-i", str(chunk_path),
+        "-acodec", "pcm_s16le", str(clip_path),
+    ]
+    result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        message = result.stderr.decode("utf-8", errors="replace").strip()
+        raise RuntimeError(f"❌ ffmpeg failed to cut {clip_path} from {chunk_path}: {message}")
+    return str(clip_path), audio_duration_ms(clip_path) / 1000
+
+def timed_export_chunk(source_wav, chunk_path, offset_ms: int, duration_ms: int, opus_bitrate: str):
+    # Worker processes do not share the parent's metrics, so the time is measured here and recorded there
+    start = time.perf_counter()
+    chunk_filename, seconds = export_chunk_from_wav(source_wav, chunk_path, offset_ms, duration_ms, opus_bitrate)
+    return chunk_filename, seconds, time.perf_counter() - start
+
+def export_planned_chunks(source_wav, plan: ChunkPlan, output_dir: Path, workers: int = CHUNK_EXPORT_WORKERS):
+    os.makedirs(output_dir, exist_ok=True)
+    plan.save(os.path.join(output_dir, CHUNK_PLAN_FILENAME))
+
+    # Each worker reads its slice of the WAV and runs its own encoder, so FLAC / Opus encoding is parallel too
+    total_bytes, total_seconds = 0, 0.0
+    with ProcessPoolExecutor(max_workers=max(1, min(workers, len(plan.chunks)))) as pool:
+        futures = [
+            pool.submit(timed_export_chunk, source_wav, os.path.join(output_dir, chunk["file"]),
+                        chunk["offset_ms"], chunk["duration_ms"], plan.opus_bitrate or DEFAULT_OPUS_BITRATE)
+            for chunk in plan.chunks
+        ]
+        for future in futures:
+            chunk_filename, seconds, elapsed = future.result()
+            chunk_bytes = os.path.getsize(chunk_filename)
+            total_bytes += chunk_bytes
+            total_seconds += seconds
+            record_span("preprocess", "export_chunk", elapsed, chunk=os.path.basename(chunk_filename),
+                        audio_seconds=round(seconds, 2), bytes=chunk_bytes, format=plan.chunk_format)
+            print(f"✅ Saved: {chunk_filename} ({seconds:.2f} sec, {chunk_bytes / 1024:.0f} KB)")
+
+    count("chunk_bytes_total", total_bytes, stage="preprocess", format=plan.chunk_format)
+    print(f"🗺 Chunk plan saved to: {os.path.join(output_dir, CHUNK_PLAN_FILENAME)}")
+    print(f"📦 {plan.chunk_format.upper()} chunks: {describe_bytes_per_hour(total_bytes, total_seconds)}")
     print("🎉 All smart chunks saved.")
 
+# === STREAMING MODE ===
+# Multi-hour inputs do not fit comfortably in memory as one AudioSegment, so the streaming mode
+# never holds more than one decoded block (plus a few seconds of history) at a time:
+#   pass 1: decode blocks through an ffmpeg pipe and collect peak / RMS statistics
+#   pass 2: decode again, apply the normalization gain and detect non-silent ranges incrementally
+#   pass 3: decode again and write the padded non-silent ranges straight into the cleaned WAV
+#   chunking: memory-map the cleaned WAV to detect split silences, then plan and export as usual
+# The results follow the in-memory path; gain is applied once instead of twice, so individual
+# samples may differ by one LSB.
+
+def decode_pcm_blocks(input_path: Path, sample_rate: int = TARGET_SAMPLE_RATE, block_ms: int = STREAM_BLOCK_MS):
+    """
+    Yield mono int16 blocks of the input, downmixed and resampled by ffmpeg
+    """
+    command = [
+        AudioSegment.converter, "-nostdin", "-v", "error",
+        "-i", str(input_path),
+        "-f", "s16le", "-acodec", "pcm_s16le", "-ac", "1", "-ar", str(sample_rate),
+        "-",
+    ]
+    block_bytes = sample_rate * block_ms // 1000 * 2
+
+    # stderr goes to a temp file so a chatty decoder can never fill the pipe and stall
+    with tempfile.TemporaryFile() as stderr_file:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=stderr_file)
+        try:
+            while True:
+                data = process.stdout.read(block_bytes)
+                if not data:
+                    break
+                yield np.frombuffer(data[:len(data) - len(data) % 2], dtype=np.int16)
+        finally:
+            process.stdout.close()
+            return_code = process.wait()
+
+        if return_code != 0:
+            stderr_file.seek(0)
+            message = stderr_file.read().decode("utf-8", errors="replace").strip()
+            raise RuntimeError(f"❌ ffmpeg failed to decode {input_path}: {message}")
+
+def apply_gain_block(samples: np.ndarray, gain_db: float) -> np.ndarray:
+    if not gain_db:
+        return samples
+    scaled = np.floor(samples * db_to_float(gain_db))
+    return np.clip(scaled, -2 ** 15, 2 ** 15 - 1).astype(np.int16)
+
+def rms_to_dbfs(sum_squares: int, sample_count: int) -> float:
+    # Mirrors AudioSegment.dBFS, which uses the integer RMS
+    rms = math.floor(math.sqrt(sum_squares / sample_count)) if sample_count else 0
+    return ratio_to_db(rms / 2 ** 15) if rms else -float("infinity")
+
+def measure_loudness(input_path: Path, sample_rate: int = TARGET_SAMPLE_RATE):
+    """
+    First streaming pass: peak amplitude, sum of squares and sample count
+    """
+    peak, sum_squares, sample_count = 0, 0, 0
+    for block in decode_pcm_blocks(input_path, sample_rate):
+        wide = block.astype(np.int64)
+        if len(wide):
+            peak = max(peak, int(np.abs(wide).max()))
+        sum_squares += int(np.dot(wide, wide))
+        sample_count += len(block)
+    return peak, sum_squares, sample_count
+
+def wav_data_offset(path) -> int:
+    """
+    Byte offset of the PCM payload in a RIFF/WAVE file (for memory-mapping)
+    """
+    with open(path, "rb") as f:
+        header = f.read(12)
+        if header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+            raise ValueError(f"Not a WAV file: {path}")
+        while True:
+            chunk_header = f.read(8)
+            if len(chunk_header) < 8:
+                raise ValueError(f"No data chunk in WAV file: {path}")
+            chunk_size = int.from_bytes(chunk_header[4:], "little")
+            if chunk_header[:4] == b"data":
+                return f.tell()
+            f.seek(chunk_size + chunk_size % 2, os.SEEK_CUR)
+
+def preprocess_audio_streaming(input_path: Path, output_path: Path, sample_rate: int = TARGET_SAMPLE_RATE,
+                               chunk_dir: Path = CHUNK_DIR, min_chunk_ms: int = MIN_CHUNK_MS,
+                               max_chunk_ms: int = MAX_CHUNK_MS, export: bool = True,
+                               chunk_format: str = DEFAULT_CHUNK_FORMAT, opus_bitrate: str = DEFAULT_OPUS_BITRATE,
+                               keep_cleaned_wav: bool = True):
+    """
+    Returns the ChunkPlan. With export=False only the plan is written, and the caller cuts the chunks itself
+    (the pipelined orchestrator exports them one at a time so transcription can start on the first one).
+    The cleaned WAV is always written, since silence detection and chunk cutting read it; without
+    keep_cleaned_wav it is removed once the chunks are exported.
+    """
+    print(f"🔊 Streaming audio from: {input_path}")
+
+    # Pass 1: loudness statistics for normalization
+    pass_start = time.perf_counter()
+    peak, sum_squares, sample_count = measure_loudness(input_path, sample_rate)
+    record_span("preprocess", "loudness_pass", time.perf_counter() - pass_start, samples=sample_count)
+    if not sample_count:
+        raise ValueError(f"❌ No audio decoded from {input_path}")
+
+    # Same gain decisions as effects.normalize + the dBFS boost in preprocess_audio
+    gain_db = ratio_to_db(2 ** 15 * db_to_float(-0.1) / peak) if peak else 0.0
+    normalized_dbfs = rms_to_dbfs(sum_squares, sample_count) + gain_db
+    if normalized_dbfs < NORMALIZATION_TARGET_DBFS:
+        print(f"📈 Boosting volume by {NORMALIZATION_TARGET_DBFS - normalized_dbfs:.2f} dB")
+        gain_db += NORMALIZATION_TARGET_DBFS - normalized_dbfs
+        normalized_dbfs = NORMALIZATION_TARGET_DBFS
+    print(f"📉 Volume after normalization: {normalized_dbfs:.2f} dBFS")
+
+    silence_thresh_db = min(-40, normalized_dbfs - 10)
+    print(f"🔍 Silence threshold set to: {silence_thresh_db:.2f} dBFS")
+
+    # Pass 2: non-silent ranges of the normalized audio
+    pass_start = time.perf_counter()
+    detector = StreamingSilenceDetector(sample_rate, 500, silence_thresh_db)
+    for block in decode_pcm_blocks(input_path, sample_rate):
+        detector.feed(apply_gain_block(block, gain_db))
+    length_ms = round(1000 * (sample_count / sample_rate))
+    nonsilent_ranges = nonsilent_from_silent(detector.finish(), length_ms)
+    record_span("preprocess", "silence_pass", time.perf_counter() - pass_start, ranges=len(nonsilent_ranges))
+
+    samples_per_ms = sample_rate // 1000
+    if not nonsilent_ranges:
+        print("⚠️ No silent segments detected — processing full audio without trimming.")
+        keep_ranges = [(0, sample_count)]
+    else:   # Padded ranges in samples; overlapping padding is kept twice, like the in-memory path
+        keep_ranges = [
+            (max(0, start_ms - PADDING_MS) * samples_per_ms,
+             min(sample_count, min(length_ms, end_ms + PADDING_MS) * samples_per_ms))
+            for start_ms, end_ms in nonsilent_ranges
+        ]
+
+    # Pass 3: stream the kept ranges into the cleaned WAV
+    pass_start = time.perf_counter()
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    cleaned_squares, cleaned_count = 0, 0
+    with wave.open(str(output_path), "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+
+        # `window` holds decoded samples from `window_start` on; only what pending ranges still need is kept
+        window = np.empty(0, dtype=np.int16)
+        window_start = 0
+        range_index = 0
+        cursor = keep_ranges[0][0]
+        for block in decode_pcm_blocks(input_path, sample_rate):
+            window = np.concatenate((window, apply_gain_block(block, gain_db)))
+            window_end = window_start + len(window)
+
+            while range_index < len(keep_ranges):
+                range_end = keep_ranges[range_index][1]
+                write_end = min(range_end, window_end)
+                if write_end > cursor:
+                    piece = window[cursor - window_start:write_end - window_start]
+                    wav_file.writeframes(piece.tobytes())
+                    wide = piece.astype(np.int64)
+                    cleaned_squares += int(np.dot(wide, wide))
+                    cleaned_count += len(piece)
+                    cursor = write_end
+                if cursor < range_end:
+                    break
+                range_index += 1
+                if range_index < len(keep_ranges):
+                    cursor = keep_ranges[range_index][0]
+
+            keep_from = cursor
+            if range_index + 1 < len(keep_ranges):
+                keep_from = min(keep_from, keep_ranges[range_index + 1][0])
+            keep_from = min(max(keep_from, window_start), window_end)
+            window = window[keep_from - window_start:].copy()
+            window_start = keep_from
+
+    cleaned_ms = round(1000 * (cleaned_count / sample_rate))
+    record_span("preprocess", "write_pass", time.perf_counter() - pass_start, cleaned_ms=cleaned_ms,
+                bytes=os.path.getsize(output_path))
+    print(f"⏱ Cleaned duration: {cleaned_ms / 1000:.2f} seconds")
+    print(f"✅ Exported cleaned audio to: {output_path}")
+
+    segments = kept_segments([(start // samples_per_ms, end // samples_per_ms) for start, end in keep_ranges])
+    plan = chunk_cleaned_wav(output_path, chunk_dir, rms_to_dbfs(cleaned_squares, cleaned_count),
+                             min_chunk_ms, max_chunk_ms, segments=segments, source_audio=input_path, export=export,
+                             chunk_format=chunk_format, opus_bitrate=opus_bitrate)
+    if export and not keep_cleaned_wav:
+        os.remove(output_path)
+        plan.cleaned_audio = None
+        plan.save(os.path.join(chunk_dir, CHUNK_PLAN_FILENAME))
+        print(f"🧹 Removed the cleaned WAV (set PREPROCESS_KEEP_CLEANED_WAV=true to keep it): {output_path}")
+    return plan
+
+def chunk_cleaned_wav(wav_path: Path, output_dir: Path, cleaned_dbfs: float, min_chunk_ms: int, max_chunk_ms: int,
+                      segments=None, source_audio: Path = None, export: bool = True,
+                      chunk_format: str = DEFAULT_CHUNK_FORMAT, opus_bitrate: str = DEFAULT_OPUS_BITRATE):
+    """
+    Streaming counterpart of smart_chunk_audio: silence is detected through a memory map of the cleaned WAV
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    with wave.open(str(wav_path), "rb") as wav_file:
+        sample_rate = wav_file.getframerate()
+        sample_count = wav_file.getnframes()
+    samples = np.memmap(wav_path, dtype="<i2", mode="r", offset=wav_data_offset(wav_path), shape=(sample_count,))
+    samples_per_ms = sample_rate // 1000
+    length_ms = round(1000 * (sample_count / sample_rate))
+
+    if length_ms <= max_chunk_ms:
+        print("🧩 Audio is short — saving as single chunk.")
+        split_points = [(0, length_ms)]
+    else:
+        silence_thresh_db = min(-40, cleaned_dbfs - 10)
+        detector = StreamingSilenceDetector(sample_rate, 300, silence_thresh_db)
+        block_samples = STREAM_BLOCK_MS * samples_per_ms
+        for block_start in range(0, sample_count, block_samples):
+            detector.feed(np.asarray(samples[block_start:block_start + block_samples]))
+        split_points = plan_chunks(length_ms, detector.finish(), min_chunk_ms, max_chunk_ms)
+    del samples
+
+    plan = ChunkPlan.from_split_points(split_points, segments or kept_segments([(0, length_ms)]), sample_rate,
+                                       source_audio=source_audio, cleaned_audio=wav_path,
+                                       chunk_format=chunk_format, opus_bitrate=opus_bitrate)
+    if export:
+        export_planned_chunks(wav_path, plan, output_dir)
+    else:
+        plan.save(os.path.join(output_dir, CHUNK_PLAN_FILENAME))
+    return plan
+
+def run_stage(manifest: StageManifest, streaming: bool = False, input_audio: Path = INPUT_AUDIO_PATH,
+              output_wav: Path = OUTPUT_AUDIO_PATH, chunk_dir: Path = CHUNK_DIR, chunk_format: str = None,
+              opus_bitrate: str = None, keep_cleaned_wav: bool = None):
+    """
+    Preprocess input_audio into chunks (and the cleaned WAV, if kept) unless the manifest says they are current.
+    The chunk format and keeping the cleaned WAV default to PREPROCESS_CHUNK_FORMAT / PREPROCESS_KEEP_CLEANED_WAV.
+    """
+    chunk_dir = Path(chunk_dir)
+    env_format, env_bitrate = chunk_format_from_env()
+    chunk_format = chunk_format or env_format
+    opus_bitrate = opus_bitrate or env_bitrate
+    if keep_cleaned_wav is None:
+        keep_cleaned_wav = os.getenv("PREPROCESS_KEEP_CLEANED_WAV", "false").lower() == "true"
+    plan_path = chunk_dir / CHUNK_PLAN_FILENAME
+    spec = {
+        "inputs": [input_audio],
+        "config": {"sample_rate": TARGET_SAMPLE_RATE, "padding_ms": PADDING_MS,
+                   "target_dbfs": NORMALIZATION_TARGET_DBFS, "min_chunk_ms": MIN_CHUNK_MS,
+                   "max_chunk_ms": MAX_CHUNK_MS, "streaming": streaming, "chunk_format": chunk_format,
+                   "opus_bitrate": opus_bitrate if chunk_format == "opus" else None,
+                   "keep_cleaned_wav": keep_cleaned_wav},
+        "outputs": [plan_path] + ([output_wav] if keep_cleaned_wav else []),
+    }
+    reason = manifest.check("preprocess", **spec)
+    if reason is None:
+        print("✅ Preprocessed audio and chunks are up to date. Skipping.")
+        return
+    if manifest.dry_run:
+        return
+
+    print(f"🔁 Preprocessing ({reason})")
+    # Chunks from an earlier, longer plan (or another format) would otherwise be picked up by the transcription step
+    for old_chunk in find_chunk_files(chunk_dir):
+        os.remove(old_chunk)
+    with span("preprocess", "run", streaming=streaming, input_bytes=os.path.getsize(input_audio),
+              chunk_format=chunk_format):
+        if streaming:
+            preprocess_audio_streaming(input_audio, output_wav, chunk_dir=chunk_dir, chunk_format=chunk_format,
+                                       opus_bitrate=opus_bitrate, keep_cleaned_wav=keep_cleaned_wav)
+        else:
+            preprocess_audio(input_audio, output_wav, chunk_dir=chunk_dir, chunk_format=chunk_format,
+                             opus_bitrate=opus_bitrate, keep_cleaned_wav=keep_cleaned_wav)
+    chunk_files = find_chunk_files(chunk_dir)
+    spec["outputs"] += chunk_files
+
+    # Bytes this step leaves on disk per hour of (cleaned) audio, to compare chunk formats
+    written = sum(os.path.getsize(path) for path in spec["outputs"])
+    audio_seconds = sum(chunk["duration_ms"] for chunk in ChunkPlan.load(plan_path).chunks) / 1000
+    count("bytes_written_total", written, stage="preprocess")
+    print(f"📦 Written: {describe_bytes_per_hour(written, audio_seconds)}"
+          + ("" if keep_cleaned_wav else " (cleaned WAV not kept)"))
+    manifest.record("preprocess", "preprocess", **spec)
+
 def main():
-    preprocess_audio(INPUT_AUDIO_PATH, OUTPUT_AUDIO_PATH)
+    parser = argparse.ArgumentParser(description="Clean the input audio and cut it into transcription chunks")
+    parser.add_argument("--plan", action="store_true", help="List what would be rebuilt without running anything")
+    args = parser.parse_args()
+
+    # Load .env from parent of current file
+    env_path = Path(__file__).resolve().parent.parent / ".env"
+    load_dotenv(dotenv_path=env_path)
+
+    manifest = open_manifest(dry_run=args.plan)
+    start_run("preprocess", enabled=not args.plan)
+    try:
+        run_stage(manifest, streaming=os.getenv("PREPROCESS_STREAMING", "false").lower() == "true")
+    finally:
+        manifest.save()
+        finish_run()
+    if args.plan:
+        manifest.print_plan()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Vectorized silence / speech detection
+- Drop-in replacement for pydub's silence.detect_silence / detect_nonsilent
+- Per-millisecond energies are computed once in a single NumPy pass, then every
+  silence query (any min_silence_len / threshold) is answered from that array
+- Results match pydub range-for-range (see benchmark_silence_detector.py)
+"""
+
+import math
+import numpy as np
+from pydub.utils import db_to_float, ratio_to_db
+
+MAX_AMPLITUDE = 2 ** 15                   # int16 full scale, as AudioSegment.max_possible_amplitude
+ENERGY_BLOCK_MS = 10 * 1000               # Square samples 10 seconds at a time to keep temporaries small
+
+class FrameEnergy:
+    """
+    Cumulative per-millisecond energy of an int16 signal, shared by every silence query
+    """
+    def __init__(self, samples: np.ndarray, frame_rate: int, channels: int = 1):
+        samples = np.asarray(samples, dtype=np.int16)
+        frame_count = len(samples) // channels
+        self.frame_rate = frame_rate
+        self.channels = channels
+        self.length_ms = round(1000 * (frame_count / frame_rate))
+
+        # Sample index where each millisecond starts, using the same truncation as AudioSegment slicing.
+        # Slices running past the end are zero-padded by pydub, so window sizes use the unclipped bounds.
+        ms_index = np.arange(self.length_ms + 1, dtype=np.int64)
+        bounds = (ms_index * (frame_rate / 1000.0)).astype(np.int64) * channels
+        data_bounds = np.minimum(bounds, len(samples))
+
+        energies = np.zeros(self.length_ms, dtype=np.int64)
+        for block_start in range(0, self.length_ms, ENERGY_BLOCK_MS):
+            block_end = min(block_start + ENERGY_BLOCK_MS, self.length_ms)
+            first, last = data_bounds[block_start], data_bounds[block_end]
+            if last <= first:
+                continue
+            block = samples[first:last].astype(np.int64)
+            block *= block
+            offsets = data_bounds[block_start:block_end] - first
+            # reduceat cannot express empty ms (only possible past the end of the data); they stay 0
+            non_empty = np.diff(data_bounds[block_start:block_end + 1]) > 0
+            energies[block_start:block_end][non_empty] = np.add.reduceat(block, offsets[non_empty])
+
+        self.sample_count = len(samples)
+        self._cumulative = np.concatenate(([0], np.cumsum(energies)))
+        self._bounds = bounds
+
+    @classmethod
+    def from_audio_segment(cls, audio_segment):
+        if audio_segment.sample_width != 2:
+            raise ValueError(f"FrameEnergy expects 16-bit audio, got sample_width={audio_segment.sample_width}")
+        samples = np.frombuffer(audio_segment.raw_data, dtype=np.int16)
+        return cls(samples, audio_segment.frame_rate, audio_segment.channels)
+
+    @classmethod
+    def _from_parts(cls, cumulative: np.ndarray, bounds: np.ndarray, frame_rate: int, channels: int):
+        energy = cls.__new__(cls)
+        energy.sample_count = int(bounds[-1])
+        energy.frame_rate = frame_rate
+        energy.channels = channels
+        energy.length_ms = len(cumulative) - 1
+        energy._cumulative = cumulative
+        energy._bounds = bounds
+        return energy
+
+    @property
+    def rms(self) -> int:
+        if not self.sample_count:
+            return 0
+        return math.floor(math.sqrt(int(self._cumulative[-1]) / self.sample_count))
+
+    @property
+    def dBFS(self) -> float:
+        rms = self.rms
+        return ratio_to_db(rms / MAX_AMPLITUDE) if rms else -float("infinity")
+
+    def subset(self, ranges_ms):
+        """
+        Energies of the concatenation of audio[start:end] for each range, without touching the samples again
+        (exact whenever a millisecond holds a whole number of frames, e.g. 16 kHz)
+        """
+        if self.frame_rate % 1000:
+            raise ValueError(f"FrameEnergy.subset needs a whole number of frames per ms, got {self.frame_rate} Hz")
+
+        energy_parts, count_parts = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)]
+        for start_ms, end_ms in ranges_ms:
+            start_ms, end_ms = max(0, start_ms), min(self.length_ms, end_ms)
+            if end_ms > start_ms:
+                energy_parts.append(np.diff(self._cumulative[start_ms:end_ms + 1]))
+                count_parts.append(np.diff(self._bounds[start_ms:end_ms + 1]))
+        energies, counts = np.concatenate(energy_parts), np.concatenate(count_parts)
+
+        # pydub zero-pads slices that run past the end, so every ms of the concatenation is complete
+        cumulative = np.concatenate(([0], np.cumsum(energies)))
+        bounds = np.concatenate(([0], np.cumsum(counts)))
+        return FrameEnergy._from_parts(cumulative, bounds, self.frame_rate, self.channels)
+
+    def window_rms(self, starts: np.ndarray, window_len: int) -> np.ndarray:
+        ends = starts + window_len
+        energy = self._cumulative[ends] - self._cumulative[starts]
+        counts = self._bounds[ends] - self._bounds[starts]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rms = np.floor(np.sqrt(energy / counts))
+        return np.where(counts > 0, rms, 0)
+
+    def detect_silence(self, min_silence_len: int = 1000, silence_thresh: float = -16, seek_step: int = 1):
+        """
+        Same contract as pydub.silence.detect_silence: list of [start_ms, end_ms] silent ranges
+        """
+        if self.length_ms < min_silence_len:
+            return []
+        threshold = db_to_float(silence_thresh) * MAX_AMPLITUDE
+
+        last_slice_start = self.length_ms - min_silence_len
+        slice_starts = np.arange(0, last_slice_start + 1, seek_step, dtype=np.int64)
+        if last_slice_start % seek_step:
+            slice_starts = np.append(slice_starts, last_slice_start)
+
+        silence_starts = slice_starts[self.window_rms(slice_starts, min_silence_len) <= threshold]
+        return merge_silence_starts(silence_starts, min_silence_len, seek_step)
+
+    def detect_nonsilent(self, min_silence_len: int = 1000, silence_thresh: float = -16, seek_step: int = 1):
+        """
+        Same contract as pydub.silence.detect_nonsilent: list of [start_ms, end_ms] non-silent ranges
+        """
+        silent_ranges = self.detect_silence(min_silence_len, silence_thresh, seek_step)
+        return nonsilent_from_silent(silent_ranges, self.length_ms)
+
+def merge_silence_starts(silence_starts: np.ndarray, min_silence_len: int, seek_step: int = 1):
+    """
+    Turn silent window starts into ranges; windows overlapping the previous one extend its range
+    """
+    if not len(silence_starts):
+        return []
+    gaps = np.diff(silence_starts)
+    breaks = np.flatnonzero((gaps != seek_step) & (gaps > min_silence_len))
+    range_starts = np.concatenate((silence_starts[:1], silence_starts[breaks + 1]))
+    range_ends = np.concatenate((silence_starts[breaks], silence_starts[-1:])) + min_silence_len
+    return [[int(start), int(end)] for start, end in zip(range_starts, range_ends)]
+
+def nonsilent_from_silent(silent_ranges, length_ms: int):
+    """
+    Invert silent ranges the same way silence.detect_nonsilent does
+    """
+    if not silent_ranges:
+        return [[0, length_ms]]
+    if silent_ranges[0][0] == 0 and silent_ranges[0][1] == length_ms:
+        return []
+
+    nonsilent_ranges = []
+    prev_end = 0
+    for start_ms, end_ms in silent_ranges:
+        nonsilent_ranges.append([prev_end, start_ms])
+        prev_end = end_ms
+    if prev_end != length_ms:
+        nonsilent_ranges.append([prev_end, length_ms])
+    if nonsilent_ranges[0] == [0, 0]:
+        nonsilent_ranges.pop(0)
+    return nonsilent_ranges
+
+def detect_silence(audio_segment, min_silence_len: int = 1000, silence_thresh: float = -16, seek_step: int = 1):
+    return FrameEnergy.from_audio_segment(audio_segment).detect_silence(min_silence_len, silence_thresh, seek_step)
+
+def detect_nonsilent(audio_segment, min_silence_len: int = 1000, silence_thresh: float = -16, seek_step: int = 1):
+    return FrameEnergy.from_audio_segment(audio_segment).detect_nonsilent(min_silence_len, silence_thresh, seek_step)
+
+class StreamingSilenceDetector:
+    """
+    Incremental version of pydub's silence.detect_silence for mono int16 blocks (seek_step=1)
+    """
+    def __init__(self, sample_rate: int, min_silence_len: int, silence_thresh: float):
+        if sample_rate % 1000:
+            raise ValueError(f"Streaming silence detection needs a whole number of samples per ms, got {sample_rate} Hz")
+        self.sample_rate = sample_rate
+        self.samples_per_ms = sample_rate // 1000
+        self.min_silence_len = min_silence_len
+        # Same comparison as pydub: integer RMS of the window <= threshold amplitude
+        self.rms_threshold = db_to_float(silence_thresh) * MAX_AMPLITUDE
+        self.silent_ranges = []
+        self._sample_count = 0
+        self._pending = np.empty(0, dtype=np.int16)   # Samples that do not fill a whole ms yet
+        self._energies = np.empty(0, dtype=np.int64)  # Per-ms energies of windows not evaluated yet
+        self._next_start = 0                          # First window start (ms) not evaluated yet
+        self._range_start = None
+        self._prev_start = None
+
+    def feed(self, samples: np.ndarray):
+        self._sample_count += len(samples)
+        samples = np.concatenate((self._pending, samples))
+        whole_ms = len(samples) // self.samples_per_ms
+        self._pending = samples[whole_ms * self.samples_per_ms:].copy()
+
+        frames = samples[:whole_ms * self.samples_per_ms].reshape(whole_ms, self.samples_per_ms).astype(np.int64)
+        energies = np.einsum("ij,ij->i", frames, frames)
+        self._evaluate(np.concatenate((self._energies, energies)))
+
+    def finish(self):
+        """
+        Flush the last window and return all silent ranges as [start_ms, end_ms] lists
+        """
+        length_ms = round(1000 * (self._sample_count / self.sample_rate))
+        window_len = self.min_silence_len
+
+        # pydub rounds the segment length up, so a trailing partial ms can add one last window (zero-padded)
+        last_start = length_ms - window_len
+        if len(self._pending) and last_start == self._next_start and len(self._energies) == window_len - 1:
+            tail = self._pending.astype(np.int64)
+            energy = int(self._energies.sum()) + int(np.dot(tail, tail))
+            if math.floor(math.sqrt(energy / (window_len * self.samples_per_ms))) <= self.rms_threshold:
+                self._merge(np.array([last_start], dtype=np.int64))
+
+        if self._range_start is not None:
+            self.silent_ranges.append([self._range_start, self._prev_start + window_len])
+            self._range_start = None
+        return self.silent_ranges
+
+    def _evaluate(self, energies: np.ndarray):
+        window_len = self.min_silence_len
+        window_count = len(energies) - window_len + 1
+        if window_count > 0:
+            cumulative = np.concatenate(([0], np.cumsum(energies)))
+            window_energy = cumulative[window_len:] - cumulative[:-window_len]
+            rms = np.floor(np.sqrt(window_energy / (window_len * self.samples_per_ms)))
+            self._merge(np.flatnonzero(rms <= self.rms_threshold) + self._next_start)
+            self._next_start += window_count
+            energies = energies[window_count:]
+        self._energies = energies.copy()
+
+    def _merge(self, starts: np.ndarray):
+        # Silent window starts closer than min_silence_len apart belong to the same range
+        if not len(starts):
+            return
+        if self._prev_start is None:
+            self._range_start = int(starts[0])
+        else:
+            starts = np.concatenate(([self._prev_start], starts))
+        for gap_index in np.flatnonzero(np.diff(starts) > self.min_silence_len):
+            self.silent_ranges.append([self._range_start, int(starts[gap_index]) + self.min_silence_len])
+            self._range_start = int(starts[gap_index + 1])
+        self._prev_start = int(starts[-1])
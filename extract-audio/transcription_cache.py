@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Transcription Cache
+- Persistent SQLite cache of AssemblyAI results, keyed on the chunk's PCM content + model config
+- Unchanged chunks are served from disk instead of being uploaded and transcribed again
+- Size-bounded with least-recently-used eviction; hit/miss statistics for the end-of-run report
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import wave
+from pathlib import Path
+
+HASH_BLOCK_FRAMES = 1024 * 1024           # Hash PCM 1M frames at a time
+
+def pcm_fingerprint(audio_path) -> str:
+    """
+    SHA-256 of the decoded PCM and its format, so re-encoding or renaming a chunk does not miss the cache
+    """
+    digest = hashlib.sha256()
+    if str(audio_path).lower().endswith(".wav"):
+        with wave.open(str(audio_path), "rb") as wav_file:
+            digest.update(f"{wav_file.getframerate()}:{wav_file.getnchannels()}:{wav_file.getsampwidth()}".encode())
+            while True:
+                frames = wav_file.readframes(HASH_BLOCK_FRAMES)
+                if not frames:
+                    break
+                digest.update(frames)
+    else:
+        from pydub import AudioSegment
+        audio = AudioSegment.from_file(audio_path)
+        digest.update(f"{audio.frame_rate}:{audio.channels}:{audio.sample_width}".encode())
+        digest.update(audio.raw_data)
+    return digest.hexdigest()
+
+def utterance_to_dict(utterance) -> dict:
+    if isinstance(utterance, dict):
+        return utterance
+    return {
+        "speaker": utterance.speaker,
+        "text": utterance.text,
+        "start": getattr(utterance, "start", None),
+        "end": getattr(utterance, "end", None),
+    }
+
+class TranscriptionCache:
+    """
+    SQLite-backed cache: key -> utterance list (speaker, text, start, end), evicted LRU beyond max_bytes.
+    `config` holds every setting that changes the transcript (model, diarization) and is part of each key.
+    """
+    def __init__(self, path, config: dict, max_bytes: int = 512 * 1024 * 1024):
+        self.path = Path(path)
+        self.config = json.dumps(config, sort_keys=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(self.path.parent, exist_ok=True)
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS transcripts (
+                key TEXT PRIMARY KEY,
+                utterances TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS transcripts_last_used ON transcripts(last_used)")
+        self._db.commit()
+
+    def key_for(self, audio_path) -> str:
+        return hashlib.sha256(f"{pcm_fingerprint(audio_path)}|{self.config}".encode()).hexdigest()
+
+    def get(self, key: str):
+        with self._lock:
+            row = self._db.execute("SELECT utterances FROM transcripts WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE transcripts SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key: str, utterances):
+        payload = json.dumps([utterance_to_dict(u) for u in utterances], ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO transcripts (key, utterances, size, created, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, payload, len(payload.encode("utf-8")), now, now),
+            )
+            self._evict()
+            self._db.commit()
+
+    def _evict(self):
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM transcripts").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._db.execute("SELECT key, size FROM transcripts ORDER BY last_used ASC").fetchall():
+            if total <= self.max_bytes:
+                break
+            self._db.execute("DELETE FROM transcripts WHERE key = ?", (key,))
+            total -= size
+            self.evictions += 1
+
+    def summary(self) -> str:
+        with self._lock:
+            entries, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM transcripts").fetchone()
+        lookups = self.hits + self.misses
+        hit_rate = 100 * self.hits / lookups if lookups else 0
+        return (f"📦 Transcription cache: {self.hits} hits, {self.misses} misses ({hit_rate:.0f}% hit rate), "
+                f"{self.evictions} evicted, {entries} entries / {size / 1024 / 1024:.1f} MB in {self.path}")
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Window Stitching
+- Low-latency transcription: every chunk is cut into short overlapping windows (TRANSCRIPTION_WINDOW_SEC, about
+  30-60 s, with TRANSCRIPTION_WINDOW_OVERLAP_SEC of overlap) that are transcribed at high fan-out, so no single
+  multi-minute job sits on the critical path
+- Neighbouring windows are stitched on their word timestamps: the words both windows heard in the overlap are
+  aligned (same text, start within ALIGN_TOLERANCE_MS) and the cut is made at the aligned pair nearest the middle
+  of the overlap, so each word is kept exactly once
+- Diarization labels are per job, so each window's labels are renamed to the previous window's by majority vote
+  over the aligned overlap words; a speaker silent in the overlap takes the most recently heard free label
+- The stitched words are grouped back into utterances (a new one at every speaker change)
+"""
+
+import os
+import re
+from collections import Counter
+from pathlib import Path
+
+DEFAULT_WINDOW_MS = 45 * 1000
+DEFAULT_OVERLAP_MS = 5 * 1000
+DEFAULT_WINDOW_WORKERS = 16
+ALIGN_TOLERANCE_MS = 400                  # Same word heard by two windows: starts at most this far apart
+SPEAKER_LABELS = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+class WindowSettings:
+    """
+    Window length, overlap and fan-out of the low-latency mode (off unless TRANSCRIPTION_WINDOW_SEC is set)
+    """
+    def __init__(self, window_ms: int = DEFAULT_WINDOW_MS, overlap_ms: int = DEFAULT_OVERLAP_MS,
+                 workers: int = DEFAULT_WINDOW_WORKERS):
+        if not 0 < overlap_ms < window_ms:
+            raise ValueError(f"❌ Window overlap must be shorter than the window: {overlap_ms} / {window_ms} ms")
+        self.window_ms = window_ms
+        self.overlap_ms = overlap_ms
+        self.workers = workers
+
+    @classmethod
+    def from_env(cls):
+        window_sec = float(os.getenv("TRANSCRIPTION_WINDOW_SEC", "0"))
+        if window_sec <= 0:
+            return None
+        return cls(int(window_sec * 1000), int(float(os.getenv("TRANSCRIPTION_WINDOW_OVERLAP_SEC", "5")) * 1000),
+                   int(os.getenv("TRANSCRIPTION_WINDOW_WORKERS", str(DEFAULT_WINDOW_WORKERS))))
+
+    def config(self) -> dict:
+        # Part of the transcription settings: stitched and whole-chunk transcripts are cached apart
+        return {"window_ms": self.window_ms, "overlap_ms": self.overlap_ms}
+
+def plan_windows(length_ms: int, window_ms: int, overlap_ms: int):
+    """
+    (start_ms, end_ms) windows covering length_ms, each starting window_ms - overlap_ms after the previous one.
+    The last window is moved back to end with the audio, so it is never a sliver.
+    """
+    if length_ms <= window_ms:
+        return [(0, length_ms)]
+    step = window_ms - overlap_ms
+    windows = []
+    start = 0
+    while start + window_ms < length_ms:
+        windows.append((start, start + window_ms))
+        start += step
+    windows.append((length_ms - window_ms, length_ms))
+    return windows
+
+def clip_name(chunk_path, start_ms: int, end_ms: int, extension: str) -> str:
+    return f"{Path(chunk_path).stem}@{start_ms}-{end_ms}{extension}"
+
+def parse_clip_name(audio_path):
+    """
+    (chunk stem, start_ms, end_ms) of a window clip; a whole chunk gives (stem, 0, None)
+    """
+    stem = Path(audio_path).stem
+    match = re.fullmatch(r"(.+)@(\d+)-(\d+)", stem)
+    if not match:
+        return stem, 0, None
+    return match.group(1), int(match.group(2)), int(match.group(3))
+
+def transcript_words(transcript):
+    """
+    Word dicts (text, start, end, speaker) of an AssemblyAI transcript; times are relative to the clip
+    """
+    return [{"text": word.text, "start": word.start, "end": word.end, "speaker": word.speaker}
+            for word in transcript.words or []]
+
+def normalize_word(text: str) -> str:
+    return re.sub(r"[^\w']", "", text.lower())
+
+def align_overlap(previous, following, tolerance_ms: int = ALIGN_TOLERANCE_MS):
+    """
+    (i, j) index pairs of the longest common subsequence of the two word lists, in order. Words match on their
+    normalized text, and only if their starts are within tolerance_ms of each other.
+    """
+    rows, cols = len(previous), len(following)
+    keys_a = [normalize_word(word["text"]) for word in previous]
+    keys_b = [normalize_word(word["text"]) for word in following]
+    lengths = [[0] * (cols + 1) for _ in range(rows + 1)]
+    for i in range(rows - 1, -1, -1):
+        for j in range(cols - 1, -1, -1):
+            if keys_a[i] == keys_b[j] and abs(previous[i]["start"] - following[j]["start"]) <= tolerance_ms:
+                lengths[i][j] = lengths[i + 1][j + 1] + 1
+            else:
+                lengths[i][j] = max(lengths[i + 1][j], lengths[i][j + 1])
+    pairs, i, j = [], 0, 0
+    while i < rows and j < cols:
+        if keys_a[i] == keys_b[j] and abs(previous[i]["start"] - following[j]["start"]) <= tolerance_ms:
+            pairs.append((i, j))
+            i, j = i + 1, j + 1
+        elif lengths[i + 1][j] >= lengths[i][j + 1]:
+            i += 1
+        else:
+            j += 1
+    return pairs
+
+def map_speakers(previous, following, pairs, window_words, known_labels) -> dict:
+    """
+    Label in the following window -> label of the stitched transcript. Each label takes the previous window's
+    label it shares most aligned words with (one to one). A label with no aligned words (its speaker was silent
+    in the overlap) takes the most recently heard known label still free, then an unused letter.
+    """
+    votes = Counter((following[j]["speaker"], previous[i]["speaker"]) for i, j in pairs)
+    mapping, taken = {}, set()
+    for (label, target), _ in votes.most_common():
+        if label not in mapping and target not in taken:
+            mapping[label] = target
+            taken.add(target)
+    candidates = [l for l in known_labels if l not in taken] + [l for l in SPEAKER_LABELS if l not in known_labels]
+    for word in window_words:
+        label = word["speaker"]
+        if label not in mapping:
+            free = next((l for l in candidates if l not in taken), label)
+            mapping[label] = free
+            taken.add(free)
+    return mapping
+
+def recent_labels(words) -> list:
+    """
+    Speaker labels of `words`, most recently heard first
+    """
+    labels = []
+    for word in reversed(words):
+        if word["speaker"] not in labels:
+            labels.append(word["speaker"])
+    return labels
+
+def stitch_windows(windows):
+    """
+    One word list from [(start_ms, end_ms, words), ...] in window order; word times are shifted by their window's
+    start. Returns (words, stats): how many overlap words were dropped as the second copy, and how many overlaps
+    had no aligned word (cut by time at the middle of the overlap instead).
+    """
+    stitched = []
+    stats = {"windows": len(windows), "words_dropped": 0, "unaligned_overlaps": 0}
+    previous_end = None
+    for start_ms, end_ms, words in windows:
+        words = [dict(word, start=word["start"] + start_ms, end=word["end"] + start_ms) for word in words]
+        if previous_end is None:
+            stitched.extend(words)
+            previous_end = end_ms
+            continue
+
+        # Words both windows may have heard: the overlap plus a tolerance at both edges
+        tail_from = len(stitched)
+        while tail_from > 0 and stitched[tail_from - 1]["end"] > start_ms - ALIGN_TOLERANCE_MS:
+            tail_from -= 1
+        tail = stitched[tail_from:]
+        head = [word for word in words if word["start"] < previous_end + ALIGN_TOLERANCE_MS]
+        pairs = align_overlap(tail, head)
+        mapping = map_speakers(tail, head, pairs, words, recent_labels(stitched))
+        words = [dict(word, speaker=mapping[word["speaker"]]) for word in words]
+
+        middle = (start_ms + previous_end) / 2
+        if pairs:
+            # Cut at the aligned word nearest the middle: the earlier window keeps it, this one drops it
+            i, j = min(pairs, key=lambda pair: abs(tail[pair[0]]["start"] - middle))
+            kept_previous, kept_from = tail_from + i + 1, j + 1
+        else:
+            stats["unaligned_overlaps"] += 1
+            kept_previous = tail_from + sum(1 for word in tail if (word["start"] + word["end"]) / 2 < middle)
+            kept_from = sum(1 for word in words if (word["start"] + word["end"]) / 2 < middle)
+        stats["words_dropped"] += len(stitched) - kept_previous + kept_from
+        del stitched[kept_previous:]
+        stitched.extend(words[kept_from:])
+        previous_end = end_ms
+    return stitched, stats
+
+def words_to_utterances(words):
+    """
+    Utterance dicts (speaker, text, start, end) from words: consecutive words of one speaker form one utterance
+    """
+    utterances = []
+    for word in words:
+        if utterances and utterances[-1]["speaker"] == word["speaker"]:
+            utterance = utterances[-1]
+            utterance["text"] += " " + word["text"]
+            utterance["end"] = word["end"]
+        else:
+            utterances.append({"speaker": word["speaker"], "text": word["text"],
+                               "start": word["start"], "end": word["end"]})
+    return utterances
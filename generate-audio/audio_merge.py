@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Streaming MP3 Merge
+- One ffmpeg encoder process writes the merged MP3; each segment is decoded by a short-lived ffmpeg and piped
+  straight into it, and pauses are written as zero PCM
+- Python only ever holds one PCM block, so peak memory does not depend on the episode length
+- Replaces AudioSegment concatenation (`combined += audio + pause`), which copied the growing buffer on every append
+- Frame mode: when every segment is Layer III MP3 with the same version, sample rate and channel count (always the
+  case for Google TTS output), frames are copied straight into the output and pauses are pre-built silent frames;
+  no decoding or re-encoding, so the merge is I/O-bound and adds no generation loss. Anything else falls back to
+  the decode path above.
+"""
+
+import os
+import subprocess
+import tempfile
+from pydub import AudioSegment
+from mp3_frames import gapless_samples, info_frame, iter_frames, silent_frame
+
+MERGE_SAMPLE_RATE = 24000                 # Google TTS MP3 output rate; other inputs are resampled by ffmpeg
+MERGE_CHANNELS = 1
+PCM_BLOCK_BYTES = 64 * 1024               # Bytes moved from a decoder to the encoder per read
+SAMPLE_WIDTH = 2                          # s16le
+MERGE_MODES = ("frames", "decode")
+
+class FrameMergeUnsupported(ValueError):
+    """
+    The segments cannot be joined frame by frame; the caller falls back to decoding
+    """
+
+def ffmpeg_error(stderr_file) -> str:
+    stderr_file.seek(0)
+    return stderr_file.read().decode("utf-8", errors="replace").strip()
+
+class StreamingMP3Writer:
+    """
+    Encode PCM to an MP3 file as it arrives. Written to `<output>.tmp` and renamed on close(), so an interrupted
+    merge never leaves a truncated episode behind.
+    """
+    def __init__(self, output_path, sample_rate: int = MERGE_SAMPLE_RATE, channels: int = MERGE_CHANNELS,
+                 bitrate: str = None):
+        self.output_path = str(output_path)
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.frames_written = 0
+        self._temp_path = f"{self.output_path}.tmp"
+        self._stderr = tempfile.TemporaryFile()
+
+        command = [
+            AudioSegment.converter, "-nostdin", "-y", "-v", "error",
+            "-f", "s16le", "-ar", str(sample_rate), "-ac", str(channels), "-i", "-",
+            "-c:a", "libmp3lame", "-f", "mp3",
+        ]
+        if bitrate:
+            command += ["-b:a", bitrate]
+        os.makedirs(os.path.dirname(os.path.abspath(self.output_path)), exist_ok=True)
+        self._process = subprocess.Popen(command + [self._temp_path], stdin=subprocess.PIPE, stderr=self._stderr)
+
+    @property
+    def duration_ms(self) -> float:
+        return 1000 * self.frames_written / self.sample_rate
+
+    def write_pcm(self, data: bytes):
+        self._process.stdin.write(data)
+        self.frames_written += len(data) // (SAMPLE_WIDTH * self.channels)
+
+    def write_silence(self, duration_ms: int):
+        remaining = int(self.sample_rate * duration_ms / 1000) * SAMPLE_WIDTH * self.channels
+        block = bytes(min(remaining, PCM_BLOCK_BYTES))
+        while remaining > 0:
+            self.write_pcm(block[:remaining])
+            remaining -= len(block)
+
+    def append_file(self, path):
+        """
+        Decode one audio file (any format ffmpeg reads) and stream its PCM into the encoder
+        """
+        command = [
+            AudioSegment.converter, "-nostdin", "-v", "error", "-i", str(path),
+            "-f", "s16le", "-acodec", "pcm_s16le", "-ac", str(self.channels), "-ar", str(self.sample_rate), "-",
+        ]
+        frame_bytes = SAMPLE_WIDTH * self.channels
+        with tempfile.TemporaryFile() as stderr_file:
+            decoder = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=stderr_file)
+            carry = b""
+            try:
+                while True:
+                    data = decoder.stdout.read(PCM_BLOCK_BYTES)
+                    if not data:
+                        break
+                    data = carry + data
+                    usable = len(data) - len(data) % frame_bytes
+                    carry = data[usable:]
+                    self.write_pcm(data[:usable])
+            finally:
+                decoder.stdout.close()
+                return_code = decoder.wait()
+            if return_code != 0:
+                raise RuntimeError(f"❌ ffmpeg failed to decode {path}: {ffmpeg_error(stderr_file)}")
+
+    def close(self):
+        self._process.stdin.close()
+        return_code = self._process.wait()
+        message = ffmpeg_error(self._stderr)
+        self._stderr.close()
+        if return_code != 0:
+            raise RuntimeError(f"❌ ffmpeg failed to encode {self.output_path}: {message}")
+        os.replace(self._temp_path, self.output_path)
+
+    def abort(self):
+        self._process.stdin.close()
+        self._process.wait()
+        self._stderr.close()
+        if os.path.exists(self._temp_path):
+            os.remove(self._temp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+def stream_merge(files, result_path, pause_ms: int, bitrate: str = None, sample_rate: int = MERGE_SAMPLE_RATE,
+                 channels: int = MERGE_CHANNELS) -> float:
+    """
+    Write files in the given order, each followed by pause_ms of silence; returns the merged duration in ms
+    """
+    with StreamingMP3Writer(result_path, sample_rate, channels, bitrate) as writer:
+        for path in files:
+            writer.append_file(path)
+            writer.write_silence(pause_ms)
+    return writer.duration_ms
+
+class MP3FrameWriter:
+    """
+    Join MP3 frames without decoding. The first segment's first frame fixes the stream parameters; a frame that
+    does not match them raises FrameMergeUnsupported. The leading Info/Xing frame is written as a placeholder
+    and filled in with the final frame and byte counts on close().
+    """
+    def __init__(self, output_path, bitrate: str = None):
+        self.output_path = str(output_path)
+        self.frames_written = 0
+        self.bitrates = set()
+        self._required_kbps = int(bitrate.lower().rstrip("k")) if bitrate else None
+        self._template = None
+        self._silence = None
+        self._pause_samples = 0
+        self._temp_path = f"{self.output_path}.tmp"
+        os.makedirs(os.path.dirname(os.path.abspath(self.output_path)), exist_ok=True)
+        self._file = open(self._temp_path, "wb")
+
+    @property
+    def duration_ms(self) -> float:
+        if self._template is None:
+            return 0.0
+        return 1000 * self.frames_written * self._template.samples / self._template.sample_rate
+
+    def _start(self, header):
+        self._template = header
+        self._silence = silent_frame(header)
+        self._file.write(info_frame(header, 0, 0))
+
+    def append_file(self, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        # Copy contiguous runs of frames in one write each; tags, the Info frame and junk fall in the gaps
+        run_start = run_end = None
+        for offset, header in iter_frames(data):
+            if self._template is None:
+                self._start(header)
+            elif header.signature != self._template.signature:
+                raise FrameMergeUnsupported(f"{path} is MPEG-{header.version} {header.sample_rate} Hz "
+                                            f"{header.channels}ch, expected MPEG-{self._template.version} "
+                                            f"{self._template.sample_rate} Hz {self._template.channels}ch")
+            if self._required_kbps and header.bitrate_kbps != self._required_kbps:
+                raise FrameMergeUnsupported(f"{path} is {header.bitrate_kbps} kbps, "
+                                            f"merged bitrate is {self._required_kbps} kbps")
+            self.bitrates.add(header.bitrate_kbps)
+            self.frames_written += 1
+            if offset != run_end:
+                if run_start is not None:
+                    self._file.write(data[run_start:run_end])
+                run_start = offset
+            run_end = offset + header.frame_bytes
+        if run_start is None:
+            raise FrameMergeUnsupported(f"{path} has no MP3 Layer III frames")
+        self._file.write(data[run_start:run_end])
+        # The encoder's delay/padding stays in the copied frames; take it out of the next pause instead
+        self._pause_samples -= gapless_samples(data)
+
+    def write_silence(self, duration_ms: int):
+        if self._template is None:
+            raise FrameMergeUnsupported("silence before the first segment has no frame format to match")
+        # Pauses are rounded to whole frames; the remainder carries over so long episodes do not drift
+        self._pause_samples += self._template.sample_rate * duration_ms / 1000
+        count = int(round(self._pause_samples / self._template.samples))
+        self._pause_samples -= count * self._template.samples
+        self._file.write(self._silence * count)
+        self.frames_written += count
+
+    def close(self):
+        if self._template is None:
+            self.abort()
+            raise FrameMergeUnsupported("no frames were written")
+        byte_count = self._file.tell()
+        self._file.seek(0)
+        self._file.write(info_frame(self._template, self.frames_written, byte_count, vbr=len(self.bitrates) > 1))
+        self._file.close()
+        os.replace(self._temp_path, self.output_path)
+
+    def abort(self):
+        self._file.close()
+        if os.path.exists(self._temp_path):
+            os.remove(self._temp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+def frame_merge(files, result_path, pause_ms: int, bitrate: str = None) -> float:
+    """
+    stream_merge without decoding; raises FrameMergeUnsupported (leaving no output) if the files do not allow it
+    """
+    with MP3FrameWriter(result_path, bitrate) as writer:
+        for path in files:
+            writer.append_file(path)
+            writer.write_silence(pause_ms)
+    return writer.duration_ms
+
+def merge_mp3_files(files, result_path, pause_ms: int, bitrate: str = None, mode: str = "frames"):
+    """
+    Merge with frame copying when possible, decoding otherwise; returns (duration in ms, mode actually used)
+    """
+    if mode not in MERGE_MODES:
+        raise ValueError(f"❌ Unknown merge mode {mode!r} (expected one of {MERGE_MODES})")
+    if mode == "frames":
+        try:
+            return frame_merge(files, result_path, pause_ms, bitrate), "frames"
+        except FrameMergeUnsupported as e:
+            print(f"⚠️ Frame-level merge not possible ({e}); decoding and re-encoding instead")
+    return stream_merge(files, result_path, pause_ms, bitrate), "decode"
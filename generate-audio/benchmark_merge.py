@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Audio Merge Benchmark
+- Times the previous AudioSegment merge (`combined += audio + pause`) against the streaming decode/re-encode merge
+  and the frame-copy merge in audio_merge.py
+- Reports wall time, peak Python memory (tracemalloc) and output duration for both
+- Segments are synthetic tones shaped like TTS output (24 kHz mono MP3), written to a temp directory
+
+Usage: python generate-audio/benchmark_merge.py [--segments 200 1000] [--segment-sec 3] [--skip-legacy-above 1000]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+from pydub import AudioSegment
+from pydub.generators import Sine
+from audio_merge import MERGE_SAMPLE_RATE, frame_merge, stream_merge
+
+PAUSE_MS = 1000
+
+def legacy_merge(files, result_path, pause_ms: int) -> float:
+    # The merge_audio_files implementation this benchmark replaces
+    combined = AudioSegment.empty()
+    pause = AudioSegment.silent(duration=pause_ms)
+    for f in files:
+        audio = AudioSegment.from_mp3(f)
+        combined += audio + pause
+    combined.export(result_path, format="mp3")
+    return len(combined)
+
+def make_segments(directory, count: int, segment_sec: float):
+    """
+    A handful of distinct tone MP3s, reused under `count` per-line file names like generate_audio_chunks writes
+    """
+    templates = []
+    for n in range(5):
+        tone = Sine(220 + 110 * n).to_audio_segment(duration=segment_sec * 1000 * (0.6 + 0.2 * n), volume=-12)
+        path = os.path.join(directory, f"template_{n}.mp3")
+        tone.set_frame_rate(MERGE_SAMPLE_RATE).set_channels(1).export(path, format="mp3")
+        templates.append(path)
+
+    files = []
+    for i in range(count):
+        path = os.path.join(directory, f"{i:02d}_Speaker_{'AB'[i % 2]}_1.mp3")
+        os.link(templates[i % len(templates)], path)
+        files.append(path)
+    return files
+
+def measure(label: str, merge, files, result_path):
+    tracemalloc.start()
+    start = time.perf_counter()
+    duration_ms = merge(files, result_path, PAUSE_MS)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    size_mb = os.path.getsize(result_path) / 1024 / 1024
+    print(f"  {label:<9} {elapsed:8.2f}s  peak {peak / 1024 / 1024:8.1f} MB  "
+          f"output {duration_ms / 1000:8.1f}s / {size_mb:.1f} MB")
+    return elapsed, duration_ms
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark AudioSegment concatenation vs streaming and frame-copy MP3 merges")
+    parser.add_argument("--segments", type=int, nargs="+", default=[200, 1000])
+    parser.add_argument("--segment-sec", type=float, default=3.0)
+    parser.add_argument("--skip-legacy-above", type=int, default=1000,
+                        help="Only run the quadratic legacy merge up to this many segments")
+    args = parser.parse_args()
+
+    for count in args.segments:
+        with tempfile.TemporaryDirectory() as directory:
+            files = make_segments(directory, count, args.segment_sec)
+            print(f"\n🎧 {count} segments (~{count * (args.segment_sec + PAUSE_MS / 1000) / 60:.0f} min of output)")
+            frames_time, frames_ms = measure("frames", frame_merge, files, os.path.join(directory, "frames.mp3"))
+            streaming_time, streaming_ms = measure("streaming", stream_merge, files,
+                                                   os.path.join(directory, "streaming.mp3"))
+            print(f"  frames vs streaming x{streaming_time / max(frames_time, 1e-9):.1f}, "
+                  f"duration difference {abs(frames_ms - streaming_ms):.0f} ms")
+            if count > args.skip_legacy_above:
+                print("  legacy    skipped")
+                continue
+            legacy_time, legacy_ms = measure("legacy", legacy_merge, files, os.path.join(directory, "legacy.mp3"))
+            print(f"  streaming vs legacy x{legacy_time / max(streaming_time, 1e-9):.1f}, "
+                  f"duration difference {abs(legacy_ms - streaming_ms):.0f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+MP3 Frame Parsing
+- Reads MPEG-1/2/2.5 Layer III frame headers so MP3 files can be joined frame by frame, with no decode or re-encode
+- Skips ID3v2 (leading), ID3v1 and APEv2 (trailing) tags and the Xing/Info/VBRI header frame encoders put first
+- Builds silent frames (header + all-zero side info, which decodes to silence) and the Info/Xing frame for a merged file
+"""
+
+import struct
+
+BITRATES_KBPS = {
+    1: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),   # MPEG-1 Layer III
+    2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),       # MPEG-2 / 2.5 Layer III
+}
+SAMPLE_RATES = {1: (44100, 48000, 32000), 2: (22050, 24000, 16000), 2.5: (11025, 12000, 8000)}
+VERSION_BITS = {3: 1, 2: 2, 0: 2.5}
+ID3V2_HEADER_BYTES = 10
+ID3V1_BYTES = 128
+APE_FOOTER_BYTES = 32
+XING_FLAGS = 0x3                          # Frame count + byte count fields present
+
+class FrameHeader:
+    """
+    One decoded 4-byte Layer III frame header
+    """
+    def __init__(self, raw: bytes):
+        b1, b2, b3 = raw[1], raw[2], raw[3]
+        self.raw = bytes(raw[:4])
+        self.version = VERSION_BITS[(b1 >> 3) & 0x3]
+        self.has_crc = not (b1 & 0x1)
+        self.bitrate_index = b2 >> 4
+        self.bitrate_kbps = BITRATES_KBPS[1 if self.version == 1 else 2][self.bitrate_index]
+        self.sample_rate = SAMPLE_RATES[self.version][(b2 >> 2) & 0x3]
+        self.padding = (b2 >> 1) & 0x1
+        self.channels = 1 if (b3 >> 6) == 3 else 2
+        self.samples = 1152 if self.version == 1 else 576
+        self.frame_bytes = (self.samples // 8) * self.bitrate_kbps * 1000 // self.sample_rate + self.padding
+        if self.version == 1:
+            self.side_info_bytes = 17 if self.channels == 1 else 32
+        else:
+            self.side_info_bytes = 9 if self.channels == 1 else 17
+
+    @property
+    def signature(self):
+        """
+        What has to match for frames from different files to share one stream
+        """
+        return (self.version, self.sample_rate, self.channels)
+
+    @property
+    def data_offset(self) -> int:
+        # Offset of the side information (and of a Xing/Info tag) from the start of the frame
+        return 4 + (2 if self.has_crc else 0)
+
+def parse_frame_header(data, offset: int = 0):
+    """
+    FrameHeader for the bytes at `offset`, or None if they are not a Layer III frame header this module supports
+    """
+    if offset + 4 > len(data):
+        return None
+    b0, b1, b2, b3 = data[offset], data[offset + 1], data[offset + 2], data[offset + 3]
+    if b0 != 0xFF or (b1 & 0xE0) != 0xE0:
+        return None
+    if (b1 >> 3) & 0x3 == 1 or (b1 >> 1) & 0x3 != 1:    # Reserved version, or not Layer III
+        return None
+    if b2 >> 4 in (0, 15) or (b2 >> 2) & 0x3 == 3:      # Free-format/invalid bitrate, reserved sample rate
+        return None
+    return FrameHeader(bytes((b0, b1, b2, b3)))
+
+def id3v2_size(data) -> int:
+    """
+    Bytes taken by a leading ID3v2 tag (0 if there is none)
+    """
+    if len(data) < ID3V2_HEADER_BYTES or data[:3] != b"ID3":
+        return 0
+    size = 0
+    for byte in data[6:10]:                  # Syncsafe integer: 7 bits per byte
+        size = (size << 7) | (byte & 0x7F)
+    footer = ID3V2_HEADER_BYTES if data[5] & 0x10 else 0
+    return ID3V2_HEADER_BYTES + size + footer
+
+def audio_end(data) -> int:
+    """
+    End of the frame data, before any trailing ID3v1 / APEv2 tags
+    """
+    end = len(data)
+    if end >= ID3V1_BYTES and data[end - ID3V1_BYTES:end - ID3V1_BYTES + 3] == b"TAG":
+        end -= ID3V1_BYTES
+    if end >= APE_FOOTER_BYTES and data[end - APE_FOOTER_BYTES:end - APE_FOOTER_BYTES + 8] == b"APETAGEX":
+        tag_size = struct.unpack("<I", data[end - APE_FOOTER_BYTES + 12:end - APE_FOOTER_BYTES + 16])[0]
+        has_header = struct.unpack("<I", data[end - APE_FOOTER_BYTES + 20:end - APE_FOOTER_BYTES + 24])[0] >> 31
+        end -= tag_size + (APE_FOOTER_BYTES if has_header else 0)
+    return max(end, 0)
+
+def is_info_frame(data, offset: int, header: FrameHeader) -> bool:
+    """
+    True for the Xing/Info (LAME, ffmpeg) or VBRI (Fraunhofer) header frame, which carries no audio
+    """
+    tag_offset = offset + header.data_offset + header.side_info_bytes
+    if bytes(data[tag_offset:tag_offset + 4]) in (b"Xing", b"Info"):
+        return True
+    return bytes(data[offset + 36:offset + 40]) == b"VBRI"
+
+def gapless_samples(data) -> int:
+    """
+    Encoder delay + padding from the LAME tag in a file's Info/Xing frame (0 if absent): the silent samples the
+    encoder added around the audio, which decoders trim and a frame copy keeps
+    """
+    offset = id3v2_size(data)
+    header = parse_frame_header(data, offset)
+    if header is None or not is_info_frame(data, offset, header):
+        return 0
+    xing = offset + header.data_offset + header.side_info_bytes
+    if bytes(data[xing:xing + 4]) not in (b"Xing", b"Info"):
+        return 0
+    flags = struct.unpack(">I", data[xing + 4:xing + 8])[0]
+    lame = xing + 8 + 4 * bool(flags & 0x1) + 4 * bool(flags & 0x2) + 100 * bool(flags & 0x4) + 4 * bool(flags & 0x8)
+    if bytes(data[lame:lame + 4]) not in (b"LAME", b"Lavf", b"Lavc") or lame + 24 > len(data):
+        return 0
+    packed = int.from_bytes(data[lame + 21:lame + 24], "big")    # 12 bits delay, 12 bits padding
+    return (packed >> 12) + (packed & 0xFFF)
+
+def iter_frames(data):
+    """
+    Yield (offset, header) for every audio frame in an MP3 file's bytes. Tags and the leading Xing/Info/VBRI frame
+    are skipped; junk between frames is skipped by scanning for the next header that is followed by another
+    frame (or by the end of the data). A truncated last frame is dropped.
+    """
+    offset = id3v2_size(data)
+    end = audio_end(data)
+    first = True
+    while offset + 4 <= end:
+        header = parse_frame_header(data, offset)
+        if header is not None and offset + header.frame_bytes <= end:
+            following = offset + header.frame_bytes
+            if following + 4 > end or parse_frame_header(data, following) is not None:
+                if not (first and is_info_frame(data, offset, header)):
+                    yield offset, header
+                first = False
+                offset = following
+                continue
+        offset = data.find(b"\xff", offset + 1, end)
+        if offset < 0:
+            return
+
+def silent_frame(template: FrameHeader) -> bytes:
+    """
+    One frame of silence with the template's version, sample rate, channel mode and bitrate: no CRC, no padding,
+    and all-zero side information (no Huffman data, so every spectral line decodes to 0)
+    """
+    raw = bytearray(template.raw)
+    raw[1] |= 0x01           # No CRC
+    raw[2] &= ~0x02 & 0xFF   # No padding
+    header = FrameHeader(bytes(raw))
+    return bytes(raw) + bytes(header.frame_bytes - 4)
+
+def info_frame(template: FrameHeader, frame_count: int, byte_count: int, vbr: bool = False) -> bytes:
+    """
+    Xing ("Xing" for VBR, "Info" for CBR) header frame with frame and byte counts, so players get the duration and
+    seek positions of the merged file without scanning it. Same size as silent_frame(template) when that size fits
+    the tag; otherwise the smallest bitrate that does.
+    """
+    raw = bytearray(template.raw)
+    raw[1] |= 0x01
+    raw[2] &= ~0x02 & 0xFF
+    header = FrameHeader(bytes(raw))
+    tag = (b"Xing" if vbr else b"Info") + struct.pack(">III", XING_FLAGS, frame_count, byte_count)
+    needed = header.data_offset + header.side_info_bytes + len(tag)
+    for bitrate_index in range(header.bitrate_index, 15):
+        raw[2] = (raw[2] & 0x0F) | (bitrate_index << 4)
+        header = FrameHeader(bytes(raw))
+        if header.frame_bytes >= needed:
+            break
+    frame = bytearray(header.frame_bytes)
+    frame[:4] = raw
+    tag_offset = header.data_offset + header.side_info_bytes
+    frame[tag_offset:tag_offset + len(tag)] = tag
+    return bytes(frame)
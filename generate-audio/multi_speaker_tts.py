@@ -1,13 +1,29 @@
 from google.cloud import texttospeech  # Google Cloud Text-to-Speech API
-from pydub import AudioSegment         # For audio merging and silence insertion
+import argparse                        # For the --plan flag
 import glob                            # For listing audio files
+import json                            # For the per-line segment manifest
 import os                              # For file and directory operations
 import sys                             # For exiting early
 import time                            # For delaying between retries or API calls
 import re                              # For filtering files with patterns
+import threading                       # For serializing progress output from TTS workers
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "pipeline-common"))
+from rate_limit import TokenBucket
+from hedging import HedgingPolicy
+from retry import is_overload_error, jittered_backoff, retry_after_seconds
+from tts_cache import TTSCache, link_or_copy, tts_cache_key
+from audio_merge import merge_mp3_files
+from progressive_output import ProgressiveStream, merge_from_stream, stream_dir_for
+from dialogue_format import parse_dialogue
+from utterance_index import (Selection, UtteranceIndex, add_selection_arguments, chunks_for_lines, index_path_for,
+                             load_chunk_lines, selection_from_args)
+from stage_manifest import StageManifest, open_manifest
+from metrics import count, finish_run, span, start_run
+
 
 # === SETUP ===
 # Load .env from parent of current file
@@ -18,9 +34,16 @@ TTS_SPEAKING_RATE = float(os.getenv("TTS_SPEAKING_RAT", "1.2"))
 TTS_MAX_LENGTH = float(os.getenv("TTS_MAX_LENGTH", "2000"))          # Character limit per TTS call (Google's max is ~5000 bytes)
 TTS_MAX_RETRIES = int(os.getenv("TTS_MAX_RETRIES", "3"))             # Max retries for failed TTS calls
 GOOGLE_APPLICATION_CREDENTIALS = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")  # Your Google Cloud credential JSON
-TTS_REQUESTS_PER_MINUTE = int(os.getenv("TTS_REQUESTS_PER_MINUTE", "120"))
-TTS_DELAY = 60 / TTS_REQUESTS_PER_MINUTE  # seconds between API calls
+TTS_REQUESTS_PER_MINUTE = int(os.getenv("TTS_REQUESTS_PER_MINUTE", "120"))  # Shared by all workers as one token bucket
+TTS_MAX_WORKERS = int(os.getenv("TTS_MAX_WORKERS", "1"))             # Parallel synthesize_speech calls
+TTS_REQUEST_TIMEOUT = float(os.getenv("TTS_REQUEST_TIMEOUT", "15"))  # Give up on a single call after this many seconds
 TTS_RETRY_BASE_DELAY=float(os.getenv("TTS_RETRY_BASE_DELAY", "2"))  
+TTS_CACHE_ENABLED = os.getenv("TTS_CACHE_ENABLED", "true").lower() == "true"  # Reuse audio for identical text + voice
+TTS_CACHE_MAX_MB = float(os.getenv("TTS_CACHE_MAX_MB", "1024"))      # Least recently used audio is evicted beyond this
+TTS_AUDIO_BITRATE = os.getenv("TTS_AUDIO_BITRATE")                 # Bitrate of the merged MP3 (ffmpeg default if unset)
+TTS_MERGE_MODE = os.getenv("TTS_MERGE_MODE", "frames")               # frames = copy MP3 frames, decode = re-encode
+TTS_LANGUAGE_CODE = "ja-JP"
+TTS_AUDIO_ENCODING = "MP3"
 PAUSE_MS = 1000                                # Silence (ms) between merged chunks
 
 # === CONFIGURATION ===
@@ -28,26 +51,30 @@ SCRIPT_DIR = Path(__file__).resolve().parent
 INPUT_FILE  = SCRIPT_DIR.parent / "joe-charlie-aa-js/test-output/JP-text-translation/clean-JP-joe-charlie-first-5-minutes.txt" # Input dialogue text file
 OUTPUT_DIR = SCRIPT_DIR.parent / "joe-charlie-aa-js/test-output/JP-audio-output/chunks" # Where each MP3 chunk is saved
 MERGED_FILE = SCRIPT_DIR.parent / "joe-charlie-aa-js/test-output/JP-audio-output/JP-joe-charlie-first-5-minutes.mp3" # Final merged MP3 output
-
-# Exit early if not run as a script
-if __name__ != "__main__":
-    sys.exit(0)
+TRANSLATION_CHUNK_DIR = SCRIPT_DIR.parent / "joe-charlie-aa-js/test-output/JP-text-translation/chunks" # Maps utterances to dialogue lines
+TTS_CACHE_DIR = SCRIPT_DIR.parent / "joe-charlie-aa-js/test-output/cache/tts" # Content-addressed MP3s shared by all runs
+SEGMENT_MANIFEST = "segments.json"             # Written next to the per-line MP3s: file -> cache key, speaker, text
+LINE_FILE_PATTERN = re.compile(r"^(\d+)_Speaker_[A-Z]_(\d+)\.mp3$")
+
+# Map each speaker label to a Japanese voice model
+SPEAKER_VOICES = {
+    "Speaker A": "ja-JP-Wavenet-C",
+    "Speaker B": "ja-JP-Wavenet-D",
+    "Speaker C": "ja-JP-Wavenet-A",
+}
 
 # === FUNCTION: Load speaker-tagged dialogue from file ===
 def load_dialogue_from_file(filepath):
     if not os.path.exists(filepath):
-        print(f"❌ File not found: {filepath}")
-        sys.exit(1)
+        raise FileNotFoundError(f"❌ File not found: {filepath}")
 
-    dialogue = []
     with open(filepath, "r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if not line or ":" not in line:
-                continue  # Skip lines without "Speaker: text"
-            speaker, text = line.split(":", 1)
-            dialogue.append((speaker.strip(), text.strip()))
-    return dialogue
+        return parse_dialogue_lines(f)
+
+# === FUNCTION: (speaker, text) pairs from "Speaker X: text" lines ===
+def parse_dialogue_lines(lines):
+    # Parsed in one streaming pass; text without a speaker tag is skipped
+    return [(speaker, text) for speaker, text in parse_dialogue(lines) if speaker]
 
 # Helper function to clean text before sending to TTS API
 def sanitize_input(text):
@@ -58,145 +85,381 @@ def sanitize_input(text):
     text = text.encode("utf-8", errors="ignore").decode("utf-8")  # Remove invalid UTF-8 characters
     return text.strip()                                        # Remove leading/trailing whitespace
 
-# Main function to generate audio MP3s from dialogue lines
-def generate_audio_chunks(dialogue):
-    from google.api_core.exceptions import GoogleAPICallError, RetryError
-
-    # Initialize Google Text-to-Speech client with your service account
-    client = texttospeech.TextToSpeechClient.from_service_account_file(GOOGLE_APPLICATION_CREDENTIALS)
+def voice_for(speaker):
+    return SPEAKER_VOICES.get(speaker, "ja-JP-Wavenet-C")
 
-    # Map each speaker label to a Japanese voice model
-    SPEAKER_VOICES = {
-        "Speaker A": "ja-JP-Wavenet-C",
-        "Speaker B": "ja-JP-Wavenet-D",
-        "Speaker C": "ja-JP-Wavenet-A",
-    }
+def audio_cache_key(speaker, chunk):
+    return tts_cache_key(chunk, voice_for(speaker), TTS_LANGUAGE_CODE, TTS_SPEAKING_RATE, TTS_AUDIO_ENCODING)
 
-    os.makedirs(OUTPUT_DIR, exist_ok=True)  # Create output directory if it doesn't exist
-    failed_chunks = []  # List to collect failed audio chunks for retry/reporting
-
-    # Loop through each line of speaker dialogue
-    for i, (speaker, text) in enumerate(dialogue):
-        print(f"[INFO] Processing {speaker}, entry {i + 1}/{len(dialogue)}")
-
-        # Sanitize the text and split into smaller chunks if too long
-        sanitized = sanitize_input(text)
-        def split_text_by_bytes(text, byte_limit=TTS_MAX_LENGTH):
-            chunks = []
-            current_chunk = ""
-            for sentence in re.split(r'(?<=[。！？\n])', text):
-                sentence = sentence.strip()
-                if not sentence:
-                    continue
-
-                test_chunk = current_chunk + sentence
-                if len(test_chunk.encode("utf-8")) > byte_limit:
-                    if current_chunk:
-                        chunks.append(current_chunk.strip())
-                    current_chunk = sentence
-                else:
-                    current_chunk = test_chunk
+# Split text on Japanese sentence ends so each piece stays under the TTS byte limit
+def split_text_by_bytes(text, byte_limit=TTS_MAX_LENGTH):
+    chunks = []
+    current_chunk = ""
+    for sentence in re.split(r'(?<=[。！？\n])', text):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
 
+        test_chunk = current_chunk + sentence
+        if len(test_chunk.encode("utf-8")) > byte_limit:
             if current_chunk:
                 chunks.append(current_chunk.strip())
+            current_chunk = sentence
+        else:
+            current_chunk = test_chunk
 
-            return chunks
+    if current_chunk:
+        chunks.append(current_chunk.strip())
 
-        chunks = split_text_by_bytes(text)
+    return chunks
 
-        # Process each chunk individually (most often there is only one)
+# Every per-line MP3 the dialogue maps to: (line index, part, part count, speaker, text, filename)
+def dialogue_segments(dialogue, output_dir=OUTPUT_DIR):
+    for i, (speaker, text) in enumerate(dialogue):
+        # Sanitize the text and split into smaller chunks if too long
+        chunks = split_text_by_bytes(sanitize_input(text))
         for j, chunk in enumerate(chunks):
-            filename = f"{OUTPUT_DIR}/{i:02d}_{speaker.replace(' ', '_')}_{j + 1}.mp3"
+            yield i, j, len(chunks), speaker, chunk, f"{output_dir}/{i:02d}_{speaker.replace(' ', '_')}_{j + 1}.mp3"
+
+# Manifest entry of one per-line MP3: its text plus everything that changes the synthesized audio
+# (source_file, the dialogue the line came from, only matters to plan mode)
+def line_spec(speaker, chunk, filename, source_file=INPUT_FILE):
+    return {
+        "content": f"{speaker}|{chunk}",
+        "config": {"voice": voice_for(speaker), "language": TTS_LANGUAGE_CODE, "speaking_rate": TTS_SPEAKING_RATE,
+                   "encoding": TTS_AUDIO_ENCODING},
+        "outputs": [filename],
+        "upstream": [source_file],
+    }
 
-            # Skip if file already exists (resume safe)
-            if os.path.exists(filename):
-                print(f"    ⏩ Skipping existing: {filename}")
-                continue
+def line_artifact(filename):
+    return f"tts/{os.path.basename(filename)}"
+
+def merge_spec(files, result_path, pause_ms):
+    return {"inputs": files, "config": {"pause_ms": pause_ms, "bitrate": TTS_AUDIO_BITRATE, "mode": TTS_MERGE_MODE},
+            "outputs": [result_path]}
 
-            print(f"    [CHUNK] {speaker} chunk {j + 1}/{len(chunks)} (Length: {len(chunk)})")
-            voice_name = SPEAKER_VOICES.get(speaker, "ja-JP-Wavenet-C")
-            print(f"    [VOICE] Using voice: {voice_name}")
-
-            # Prepare input parameters for the TTS API
-            synthesis_input = texttospeech.SynthesisInput(text=chunk)
-            voice = texttospeech.VoiceSelectionParams(
-                language_code="ja-JP",
-                name=voice_name
-            )
-            audio_config = texttospeech.AudioConfig(
-                audio_encoding=texttospeech.AudioEncoding.MP3,
-                speaking_rate=TTS_SPEAKING_RATE  # You can adjust speed here
-            )
-
-            # Try up to MAX_RETRIES times if there's an error
-            for attempt in range(1, TTS_MAX_RETRIES + 1):
-                try:
-                    print(f"    [API] Sending request (attempt {attempt})...")
-                    response = client.synthesize_speech(
+def create_tts_client():
+    # Initialize Google Text-to-Speech client with your service account
+    return texttospeech.TextToSpeechClient.from_service_account_file(GOOGLE_APPLICATION_CREDENTIALS)
+
+# Synthesize one text chunk into an MP3 file, retrying up to max_retries times; returns True on success
+# (hedging: a call slower than the recent p95 gets a duplicate and the first audio wins)
+def synthesize_to_file(client, speaker, chunk, filename, max_retries=TTS_MAX_RETRIES, rate_limiter=None,
+                       timeout=TTS_REQUEST_TIMEOUT, hedging: HedgingPolicy = None):
+    from google.api_core.exceptions import GoogleAPICallError, RetryError
+
+    rate_limiter = rate_limiter or TokenBucket()
+    voice_name = voice_for(speaker)
+    print(f"    [VOICE] Using voice: {voice_name}")
+
+    # Prepare input parameters for the TTS API
+    synthesis_input = texttospeech.SynthesisInput(text=chunk)
+    voice = texttospeech.VoiceSelectionParams(
+        language_code=TTS_LANGUAGE_CODE,
+        name=voice_name
+    )
+    audio_config = texttospeech.AudioConfig(
+        audio_encoding=texttospeech.AudioEncoding[TTS_AUDIO_ENCODING],
+        speaking_rate=TTS_SPEAKING_RATE  # You can adjust speed here
+    )
+
+    # Try up to MAX_RETRIES times if there's an error
+    for attempt in range(1, max_retries + 1):
+        try:
+            rate_limiter.acquire()  # Every attempt, retries included, spends a token from the shared budget
+            print(f"    [API] Sending request (attempt {attempt})...")
+            with span("tts", "api_call", file=os.path.basename(filename), attempt=attempt, characters=len(chunk),
+                      request_bytes=len(chunk.encode("utf-8"))) as call:
+                def request():
+                    return client.synthesize_speech(
                         input=synthesis_input,
                         voice=voice,
                         audio_config=audio_config,
-                        timeout=15  # Give up after 15 seconds if unresponsive
+                        timeout=timeout  # Give up on this attempt if unresponsive
                     )
+                response = hedging.call(request, rate_limiter) if hedging is not None else request()
+                call.set(response_bytes=len(response.audio_content))
+            count("tts_characters_total", len(chunk), stage="tts")
+            count("request_bytes_total", len(chunk.encode("utf-8")), stage="tts")
+            count("response_bytes_total", len(response.audio_content), stage="tts")
+
+            # Save the response audio content to file (atomically, so resume never skips a half-written MP3)
+            temp_file = f"{filename}.tmp"
+            with open(temp_file, "wb") as out:
+                out.write(response.audio_content)
+            os.replace(temp_file, filename)
+            print(f"    ✅ Saved: {filename}")
+            return True
+
+        except (GoogleAPICallError, RetryError, Exception) as e:
+            print(f"    ❌ Error on try {attempt}/{max_retries} — {e.__class__.__name__}: {e}")
+            if attempt < max_retries:
+                count("retries_total", stage="tts")
+                # Wait before retrying: jittered exponential backoff, at least what a quota error asks for
+                delay = jittered_backoff(attempt, TTS_RETRY_BASE_DELAY)
+                if is_overload_error(e):
+                    delay = max(delay, retry_after_seconds(e) or 0)
+                time.sleep(delay)
+    return False
+
+# Produce `filename` from the TTS cache, synthesizing into the cache only on a miss; returns True on success
+# (force: synthesize again and replace the cached audio, e.g. to fix a selected line)
+def synthesize_cached(client, speaker, chunk, filename, cache: TTSCache = None, rate_limiter=None, force=False,
+                      hedging: HedgingPolicy = None):
+    if cache is None:
+        return synthesize_to_file(client, speaker, chunk, filename, rate_limiter=rate_limiter, hedging=hedging)
+
+    key = audio_cache_key(speaker, chunk)
+    with cache.key_lock(key):  # The same text requested twice at once is synthesized once
+        cached = None if force else cache.get(key)
+        if cached is not None:
+            try:
+                link_or_copy(cached, filename)
+                print(f"    📦 Cached: {filename}")
+                return True
+            except FileNotFoundError:
+                pass  # Evicted between lookup and link: synthesize again
+        part_file = str(cache.path_for(key)) + ".part"
+        if not synthesize_to_file(client, speaker, chunk, part_file, rate_limiter=rate_limiter, hedging=hedging):
+            return False
+        link_or_copy(cache.put(key, part_file), filename)
+    return True
+
+# Line files from an older version of the transcript (e.g. past the new end) must not reach the merge
+def remove_stale_line_files(output_dir, current):
+    for name in os.listdir(output_dir):
+        if LINE_FILE_PATTERN.match(name) and name not in current:
+            os.remove(os.path.join(output_dir, name))
+
+# Main function to generate audio MP3s from dialogue lines
+def generate_audio_chunks(dialogue, client=None, workers=TTS_MAX_WORKERS, rate_limiter=None, output_dir=OUTPUT_DIR,
+                          failed_log="failed_audio_chunks.log", cache: TTSCache = None, manifest: StageManifest = None,
+                          selected=None, hedging: HedgingPolicy = None, progressive: ProgressiveStream = None):
+    """
+    Synthesize every dialogue line with up to `workers` requests in flight. All workers share one token bucket
+    sized from TTS_REQUESTS_PER_MINUTE, so throughput follows the quota instead of a fixed sleep per call;
+    hedged duplicates of slow calls (with a hedging policy) only go out when that bucket has a token to spare.
+    With a manifest, line files whose text and voice settings are unchanged are skipped and all others rebuilt;
+    otherwise, with a cache, per-line files are rebuilt from content-addressed audio on every run, and without
+    either, existing MP3s are skipped (resume safe). Line files that no longer belong to the dialogue are removed.
+    With `selected` (dialogue line indexes), exactly those lines are synthesized again and all others are left alone.
+    Lines that still fail are written to failed_log. With a progressive stream, every line is published there in
+    order as soon as it and all lines before it are written.
+    """
+    client = client or create_tts_client()
+    rate_limiter = rate_limiter or TokenBucket.per_minute(TTS_REQUESTS_PER_MINUTE, burst=max(1, workers))
+
+    os.makedirs(output_dir, exist_ok=True)  # Create output directory if it doesn't exist
+    jobs = []  # (sort key, label, speaker, chunk, filename) for every MP3 still to synthesize
+    segments = []  # With a cache: which cache entry each per-line file refers to
+    current = set()  # Every per-line file name the dialogue maps to
+    ordered_files = []  # Every per-line file in dialogue order, for the progressive stream
+
+    # Loop through each line of speaker dialogue; most lines are a single chunk
+    for i, j, part_count, speaker, chunk, filename in dialogue_segments(dialogue, output_dir):
+        if j == 0:
+            print(f"[INFO] Processing {speaker}, entry {i + 1}/{len(dialogue)}")
+        current.add(os.path.basename(filename))
+        ordered_files.append(filename)
+        if cache is not None:
+            segments.append({"file": os.path.basename(filename), "key": audio_cache_key(speaker, chunk),
+                             "speaker": speaker, "text": chunk})
+        if selected is not None:
+            if i not in selected:
+                continue
+        elif manifest is not None:
+            if manifest.check(line_artifact(filename), **line_spec(speaker, chunk, filename)) is None:
+                print(f"    ⏩ Up to date: {filename}")
+                continue
+        elif cache is None and os.path.exists(filename):
+            # Skip if file already exists (resume safe)
+            print(f"    ⏩ Skipping existing: {filename}")
+            continue
 
-                    # Save the response audio content to file
-                    with open(filename, "wb") as out:
-                        out.write(response.audio_content)
-                    print(f"    ✅ Saved: {filename}")
-                    break  # Exit retry loop if successful
-
-                except (GoogleAPICallError, RetryError, Exception) as e:
-                    print(f"    ❌ Error on try {attempt}/{TTS_MAX_RETRIES} — {e.__class__.__name__}: {e}")
-                    if attempt == TTS_MAX_RETRIES:
-                        # Give up after max attempts
-                        failed_chunks.append(f"{i:02d}_{speaker}_{j + 1}")
-                    else:
-                        # Wait before retrying
-                        time.sleep(TTS_RETRY_BASE_DELAY ** attempt)
-            # TTS_REQUESTS_PER_MINUTE
-            time.sleep(TTS_DELAY)  # Delay between calls to avoid hitting API rate limits
+        print(f"    [CHUNK] {speaker} chunk {j + 1}/{part_count} (Length: {len(chunk)})")
+        jobs.append(((i, j), f"{i:02d}_{speaker}_{j + 1}", speaker, chunk, filename))
+
+    failed_chunks = []  # List to collect failed audio chunks for retry/reporting
+    print_lock = threading.Lock()
+
+    def synthesize_job(job):
+        _, label, speaker, chunk, filename = job
+        with span("tts", "line", file=os.path.basename(filename), characters=len(chunk)) as line_span:
+            ok = synthesize_cached(client, speaker, chunk, filename, cache, rate_limiter, force=selected is not None,
+                                   hedging=hedging)
+            if not ok:
+                line_span.fail("GaveUp")
+        if ok and manifest is not None:
+            manifest.record(line_artifact(filename), "tts", **line_spec(speaker, chunk, filename))
+        with print_lock:
+            print(f"    {'✅' if ok else '💥'} {label}")
+        return ok
+
+    if cache is not None or manifest is not None:
+        remove_stale_line_files(output_dir, current)
+    if manifest is not None:
+        manifest.prune("tts", {f"tts/{name}" for name in current})
+    if cache is not None:
+        with open(os.path.join(output_dir, SEGMENT_MANIFEST), "w", encoding="utf-8") as f:
+            json.dump(segments, f, ensure_ascii=False, indent=2)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(synthesize_job, job): job for job in jobs}
+        if progressive is not None:
+            # Lines that are already there go out while the first requests are in flight
+            progressive.start(ordered_files, pending=[filename for *_, filename in jobs])
+        for future in as_completed(futures):
+            if not future.result():
+                # Give up after max attempts
+                failed_chunks.append(futures[future])
+            elif progressive is not None:
+                progressive.mark_ready(futures[future][-1])
+    if progressive is not None:
+        progressive.finish()
+    if hedging is not None:
+        print(hedging.summary())
 
     # Log any failed chunks to a file so you can retry them later
     if failed_chunks:
-        with open("failed_audio_chunks.log", "w", encoding="utf-8") as f:
-            for item in failed_chunks:
+        with open(failed_log, "w", encoding="utf-8") as f:
+            for _, item, *_ in sorted(failed_chunks):
                 f.write(f"{item}\n")
-        print("⚠️ Some chunks failed. See 'failed_audio_chunks.log'.")
+        print(f"⚠️ Some chunks failed. See '{failed_log}'.")
+    return [label for _, label, *_ in sorted(failed_chunks)]
 
 # === FUNCTION: Merge all MP3 chunks into a final single audio file ===
-def merge_audio_chunks(output_dir=OUTPUT_DIR, result_path=MERGED_FILE, pause_ms=PAUSE_MS):
-    combined = AudioSegment.empty()
-    pause = AudioSegment.silent(duration=pause_ms)  # Insert silence between parts
-
-    # Only include files that match our naming pattern
-    def extract_sort_key(filename):
-        # Example: output/07_Speaker_A_1.mp3 → 7
-        basename = os.path.basename(filename)
-        match = re.match(r"(\d+)_Speaker_[A-Z]_(\d+)\.mp3", basename)
-        return int(match.group(1)) if match else float('inf')
-
-    files = sorted([
-        f for f in glob.glob(os.path.join(output_dir, "*.mp3"))
-        if re.search(r"\d+_Speaker_[A-Z]_\d+\.mp3$", f)
-    ], key=extract_sort_key)
+def line_file_sort_key(filename):
+    # Example: output/07_Speaker_A_1.mp3 → (7, 1); None for files that are not per-line TTS output
+    match = LINE_FILE_PATTERN.match(os.path.basename(filename))
+    return (int(match.group(1)), int(match.group(2))) if match else None
+
+def merge_audio_chunks(output_dir=OUTPUT_DIR, result_path=MERGED_FILE, pause_ms=PAUSE_MS,
+                       manifest: StageManifest = None):
+    # Only include files that match our naming pattern; each name is parsed once
+    keyed_files = []
+    for f in glob.glob(os.path.join(output_dir, "*.mp3")):
+        key = line_file_sort_key(f)
+        if key is not None:
+            keyed_files.append((key, f))
+    files = [f for _, f in sorted(keyed_files)]
     print(f"[DEBUG] Found {len(files)} files to merge.")
+    stream_dir = stream_dir_for(output_dir)
+    if manifest is None:
+        merge_audio_files(files, result_path, pause_ms, stream_dir)
+        return
+    spec = merge_spec(files, result_path, pause_ms)
+    if manifest.check("tts-merge", **spec) is None:
+        print(f"✅ Merged audio is up to date: {result_path}. Skipping.")
+        return
+    merge_audio_files(files, result_path, pause_ms, stream_dir)
+    if files:
+        manifest.record("tts-merge", "tts-merge", **spec)
 
+# === FUNCTION: Merge an ordered list of MP3 files with a pause after each one ===
+def merge_audio_files(files, result_path=MERGED_FILE, pause_ms=PAUSE_MS, stream_dir=None):
     if not files:
         print("❌ No MP3 files found to merge.")
         return
 
-    print("🔊 Merging audio chunks...")
-    for f in files:
-        print(f"  Adding {f}")
-        audio = AudioSegment.from_mp3(f)
-        combined += audio + pause  # Append with silence
-
-    combined.export(result_path, format="mp3")
-    print(f"✅ Merged audio saved as '{result_path}'")
+    # Frames are copied as-is when all segments share one MP3 format; otherwise segments and pauses are decoded
+    # and streamed into one encoder. Either way memory stays flat however long the episode is.
+    # A finished progressive stream of exactly these files already holds the joined frames: those are reused.
+    print(f"🔊 Merging {len(files)} audio chunks...")
+    with span("tts", "merge", segments=len(files)) as merge_span:
+        duration_ms = None
+        if stream_dir is not None and TTS_MERGE_MODE == "frames":
+            duration_ms, mode = merge_from_stream(stream_dir, files, result_path, pause_ms, TTS_AUDIO_BITRATE), "stream"
+        if duration_ms is None:
+            duration_ms, mode = merge_mp3_files(files, result_path, pause_ms, TTS_AUDIO_BITRATE, TTS_MERGE_MODE)
+        merge_span.set(mode=mode, audio_seconds=round(duration_ms / 1000, 1))
+    print(f"✅ Merged audio saved as '{result_path}' ({duration_ms / 1000:.1f} sec, {mode} merge)")
+
+# === FUNCTION: Dialogue lines that came from the selected utterances ===
+def selected_dialogue_lines(selection: Selection, dialogue, translation_chunk_dir=TRANSLATION_CHUNK_DIR):
+    # utterances -> transcript lines -> translation chunks (chunk_lines.json) -> their turns in the cleaned dialogue
+    transcript, spans = load_chunk_lines(translation_chunk_dir)
+    chunks = chunks_for_lines(spans, UtteranceIndex.load(index_path_for(transcript)).select(selection))
+    lines, first = set(), 0
+    for idx in range(1, len(spans) + 1):
+        with open(os.path.join(translation_chunk_dir, f"chunk_{idx:03}.txt"), "r", encoding="utf-8") as f:
+            turns = parse_dialogue_lines(f)
+        if idx in chunks:
+            lines.update(range(first, first + len(turns)))
+        first += len(turns)
+    if first != len(dialogue):
+        raise ValueError(f"❌ The translation chunks hold {first} dialogue lines but the cleaned transcript has "
+                         f"{len(dialogue)}; re-run merge_chunks.py and clean_japanese_dialogue.py")
+    return lines
 
 # === MAIN EXECUTION ===
+def run_stage(manifest: StageManifest, client=None, input_file=INPUT_FILE, output_dir=OUTPUT_DIR,
+              merged_file=MERGED_FILE, rate_limiter: TokenBucket = None, cache: TTSCache = None, merge: bool = True,
+              failed_log="failed_audio_chunks.log", selection: Selection = None,
+              translation_chunk_dir=TRANSLATION_CHUNK_DIR, hedging: HedgingPolicy = None):
+    """
+    Synthesize and merge input_file; in plan mode (manifest.dry_run) only list the lines and merge that would run.
+    With a selection, only the dialogue lines translated from the selected utterances are synthesized again.
+    `client` replaces the Google TTS client (e.g. fake_backends.FakeTTSClient). A batch run passes its shared
+    client, rate limiter, cache (not closed here) and hedging policy, and merges on its own process pool
+    (merge=False).
+    """
+    if manifest.dry_run and selection:
+        manifest.note("tts", f"would re-synthesize the lines of {selection}")
+        return
+    if manifest.dry_run:
+        if not os.path.exists(input_file):
+            manifest.note("tts", f"input {input_file} does not exist yet")
+            return
+        files = []
+        for _, _, _, speaker, chunk, filename in dialogue_segments(load_dialogue_from_file(input_file), output_dir):
+            manifest.check(line_artifact(filename), **line_spec(speaker, chunk, filename, input_file))
+            files.append(filename)
+        manifest.prune("tts", {line_artifact(filename) for filename in files})
+        manifest.check("tts-merge", **merge_spec(files, merged_file, PAUSE_MS))
+        return
+
+    dialogue = load_dialogue_from_file(input_file)  # Load speaker-tagged text
+    selected = None
+    if selection:
+        selected = selected_dialogue_lines(selection, dialogue, translation_chunk_dir)
+        print(f"🎯 {selection}: dialogue line(s) {sorted(selected) or 'none'}")
+    shared_cache = cache is not None
+    if TTS_CACHE_ENABLED and not shared_cache:
+        cache = TTSCache(os.getenv("TTS_CACHE_DIR", str(TTS_CACHE_DIR)), int(TTS_CACHE_MAX_MB * 1024 * 1024))
+    # TTS_HEDGE_ENABLED=true: duplicate calls slower than the recent p95, within TTS_REQUESTS_PER_MINUTE
+    hedging = hedging or HedgingPolicy.from_env("TTS", "tts", initial_delay=TTS_REQUEST_TIMEOUT / 3)
+    # TTS_PROGRESSIVE_ENABLED=true: publish finished lines in order as an HLS playlist while the rest synthesize
+    progressive = ProgressiveStream.from_env(output_dir, PAUSE_MS)
+    try:
+        # Convert each changed line to MP3
+        generate_audio_chunks(dialogue, client=client, rate_limiter=rate_limiter, output_dir=output_dir,
+                              failed_log=failed_log, cache=cache, manifest=manifest, selected=selected,
+                              hedging=hedging, progressive=progressive)
+    finally:
+        if cache is not None and not shared_cache:
+            print(cache.summary())
+            cache.close()
+    if merge:
+        merge_audio_chunks(output_dir, merged_file, manifest=manifest)   # Merge all MP3s into one
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthesize the cleaned Japanese dialogue and merge it into one MP3")
+    parser.add_argument("--plan", action="store_true", help="List what would be rebuilt without running anything")
+    add_selection_arguments(parser)
+    args = parser.parse_args()
+
+    manifest = open_manifest(dry_run=args.plan)
+    start_run("tts", enabled=not args.plan)
+    try:
+        run_stage(manifest, selection=selection_from_args(args))
+    finally:
+        manifest.save()
+        finish_run()
+    if args.plan:
+        manifest.print_plan()
+    else:
+        print("🎉 Done!")
+
 if __name__ == "__main__":
-    dialogue = load_dialogue_from_file(INPUT_FILE)  # Load speaker-tagged text
-    generate_audio_chunks(dialogue)                 # Convert each line to MP3
-    merge_audio_chunks()                            # Merge all MP3s into one
-    print("🎉 Done!")
+    main()
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Progressive Output
+- Opt-in (TTS_PROGRESSIVE_ENABLED=true): while the TTS step runs, finished lines are published in dialogue order
+  as an HLS playlist of MP3 segments (stream/index.m3u8 next to the per-line MP3 folder), each line followed by
+  PAUSE_MS of silence, so a reviewer can start listening as soon as the first line is synthesized
+- A line is published only once every line before it is there; the playlist is an EVENT playlist and gets
+  #EXT-X-ENDLIST when the last line is in
+- Segments are the lines' MP3 frames, copied without decoding and cut at frame boundaries into pieces of at most
+  TTS_PROGRESSIVE_SEGMENT_SEC; each starts with the ID3 timestamp tag HLS requires of packed audio segments
+- stream.json records the line files (size and mtime) the finished stream was built from; while they are
+  unchanged, the final merge concatenates the segments instead of joining the line files again
+"""
+
+import json
+import math
+import os
+import shutil
+import struct
+import threading
+import time
+from pathlib import Path
+
+from audio_merge import FrameMergeUnsupported, MP3FrameWriter
+from mp3_frames import gapless_samples, iter_frames, silent_frame
+
+DEFAULT_SEGMENT_SEC = 6
+PLAYLIST_NAME = "index.m3u8"
+STREAM_MANIFEST = "stream.json"
+HLS_TIMESTAMP_OWNER = b"com.apple.streaming.transportStreamTimestamp\x00"
+HLS_CLOCK_HZ = 90000
+
+def stream_dir_for(output_dir) -> Path:
+    # JP-audio-output/chunks -> JP-audio-output/stream
+    return Path(output_dir).parent / "stream"
+
+def syncsafe(size: int) -> bytes:
+    return bytes((size >> shift) & 0x7F for shift in (21, 14, 7, 0))
+
+def hls_timestamp_tag(seconds: float) -> bytes:
+    """
+    ID3v2.4 tag with the PRIV frame that carries a packed audio segment's start time (33-bit, 90 kHz)
+    """
+    payload = HLS_TIMESTAMP_OWNER + struct.pack(">Q", int(round(seconds * HLS_CLOCK_HZ)) & 0x1FFFFFFFF)
+    frame = b"PRIV" + syncsafe(len(payload)) + b"\x00\x00" + payload
+    return b"ID3\x04\x00\x00" + syncsafe(len(frame)) + frame
+
+def source_entry(path) -> dict:
+    stat = os.stat(path)
+    return {"file": os.path.basename(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+def write_atomically(path, data: bytes):
+    temp_file = f"{path}.tmp"
+    with open(temp_file, "wb") as f:
+        f.write(data)
+    os.replace(temp_file, path)
+
+class ProgressiveStream:
+    """
+    Publishes per-line MP3s as they finish; start() with every line file in order, mark_ready() as each one is
+    written, finish() at the end of the step
+    """
+    def __init__(self, stream_dir, pause_ms: int, segment_sec: float = DEFAULT_SEGMENT_SEC):
+        self.stream_dir = Path(stream_dir)
+        self.pause_ms = pause_ms
+        self.segment_sec = segment_sec
+        self.files = []
+        self.published = 0
+        self.segments = []                # (name, seconds)
+        self.first_audio = None           # Seconds from start() to the first published segment
+        self.disabled = None              # Why publishing stopped (the lines cannot be joined frame by frame)
+        self._ready = set()
+        self._template = None
+        self._silence = None
+        self._pause_samples = 0
+        self._samples_written = 0
+        self._started = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, output_dir, pause_ms: int):
+        """
+        The stream next to output_dir configured by TTS_PROGRESSIVE_* in .env, or None unless
+        TTS_PROGRESSIVE_ENABLED=true
+        """
+        if os.getenv("TTS_PROGRESSIVE_ENABLED", "false").lower() != "true":
+            return None
+        return cls(stream_dir_for(output_dir), pause_ms,
+                   float(os.getenv("TTS_PROGRESSIVE_SEGMENT_SEC", str(DEFAULT_SEGMENT_SEC))))
+
+    @property
+    def playlist(self) -> Path:
+        return self.stream_dir / PLAYLIST_NAME
+
+    def start(self, files, pending=()):
+        """
+        files: every line file of the dialogue in order; pending: those still being synthesized. The others
+        already exist and are published right away.
+        """
+        self._started = time.perf_counter()
+        self.files = [str(path) for path in files]
+        # A stream from an earlier run may hold other lines: start over
+        shutil.rmtree(self.stream_dir, ignore_errors=True)
+        os.makedirs(self.stream_dir, exist_ok=True)
+        self._write_playlist(ended=False)
+        print(f"📡 Progressive output: {self.playlist}")
+        pending = {str(path) for path in pending}
+        for path in self.files:
+            if path not in pending and os.path.exists(path):
+                self.mark_ready(path)
+
+    def mark_ready(self, filename):
+        with self._lock:
+            self._ready.add(str(filename))
+            while self.disabled is None and self.published < len(self.files) \
+                    and self.files[self.published] in self._ready:
+                try:
+                    self._append_line(self.files[self.published])
+                except FrameMergeUnsupported as e:
+                    self.disabled = str(e)
+                    print(f"⚠️ Progressive output stopped ({e}); the merged MP3 is still written at the end")
+                    return
+                self.published += 1
+
+    def _append_line(self, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        frames = []
+        for offset, header in iter_frames(data):
+            if self._template is None:
+                self._template = header
+                self._silence = silent_frame(header)
+            elif header.signature != self._template.signature:
+                raise FrameMergeUnsupported(f"{path} does not match the stream's MPEG-{self._template.version} "
+                                            f"{self._template.sample_rate} Hz {self._template.channels}ch frames")
+            frames.append(data[offset:offset + header.frame_bytes])
+        if not frames:
+            raise FrameMergeUnsupported(f"{path} has no MP3 Layer III frames")
+        # Same pause arithmetic as audio_merge.MP3FrameWriter, so the stream matches a frame merge sample for sample
+        self._pause_samples -= gapless_samples(data)
+        self._pause_samples += self._template.sample_rate * self.pause_ms / 1000
+        pause_frames = int(round(self._pause_samples / self._template.samples))
+        self._pause_samples -= pause_frames * self._template.samples
+        self._publish(frames + [self._silence] * max(0, pause_frames))
+
+    def _publish(self, frames):
+        # Cut into equal segments of at most segment_sec, at frame boundaries
+        max_frames = max(1, int(self.segment_sec * self._template.sample_rate / self._template.samples))
+        per_segment = math.ceil(len(frames) / math.ceil(len(frames) / max_frames))
+        for first in range(0, len(frames), per_segment):
+            piece = frames[first:first + per_segment]
+            name = f"segment_{len(self.segments):05}.mp3"
+            start = self._samples_written / self._template.sample_rate
+            write_atomically(self.stream_dir / name, hls_timestamp_tag(start) + b"".join(piece))
+            self._samples_written += len(piece) * self._template.samples
+            self.segments.append((name, len(piece) * self._template.samples / self._template.sample_rate))
+        if self.first_audio is None and self.segments:
+            self.first_audio = time.perf_counter() - self._started
+        self._write_playlist(ended=False)
+
+    def _write_playlist(self, ended: bool):
+        lines = ["#EXTM3U", "#EXT-X-VERSION:3", f"#EXT-X-TARGETDURATION:{math.ceil(self.segment_sec)}",
+                 "#EXT-X-MEDIA-SEQUENCE:0", "#EXT-X-PLAYLIST-TYPE:EVENT"]
+        for name, seconds in self.segments:
+            lines += [f"#EXTINF:{seconds:.3f},", name]
+        if ended:
+            lines.append("#EXT-X-ENDLIST")
+        write_atomically(self.playlist, ("\n".join(lines) + "\n").encode("utf-8"))
+
+    def finish(self) -> bool:
+        """
+        End the playlist if every line is in and record what the stream was built from; False if it stops short
+        """
+        with self._lock:
+            complete = self.disabled is None and self.published == len(self.files) and bool(self.segments)
+            if complete:
+                self._write_playlist(ended=True)
+                manifest = {"pause_ms": self.pause_ms, "sources": [source_entry(path) for path in self.files],
+                            "segments": [name for name, _ in self.segments]}
+                write_atomically(self.stream_dir / STREAM_MANIFEST,
+                                 json.dumps(manifest, ensure_ascii=False, indent=1).encode("utf-8"))
+        audio_seconds = sum(seconds for _, seconds in self.segments)
+        first = f", first audio after {self.first_audio:.1f}s" if self.first_audio is not None else ""
+        if complete:
+            print(f"📡 Stream complete: {len(self.segments)} segments, {audio_seconds:.1f}s of audio{first}")
+        elif self.disabled is None:
+            stop = os.path.basename(self.files[self.published]) if self.published < len(self.files) else "the start"
+            print(f"⏸ Stream stops before {stop} ({self.published}/{len(self.files)} lines published{first})")
+        return complete
+
+def merge_from_stream(stream_dir, files, result_path, pause_ms: int, bitrate: str = None):
+    """
+    Join the finished stream's segments into result_path when it was built from exactly these line files (same
+    size and mtime) with the same pause; returns the merged duration in ms, or None if the stream cannot be used
+    """
+    manifest_path = Path(stream_dir) / STREAM_MANIFEST
+    if not manifest_path.exists():
+        return None
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    try:
+        current = [source_entry(path) for path in files]
+    except FileNotFoundError:
+        return None
+    if manifest["pause_ms"] != pause_ms or manifest["sources"] != current:
+        return None
+    try:
+        with MP3FrameWriter(result_path, bitrate) as writer:
+            for name in manifest["segments"]:
+                writer.append_file(Path(stream_dir) / name)
+    except (FrameMergeUnsupported, FileNotFoundError) as e:
+        print(f"⚠️ Cannot merge from the stream ({e}); joining the line files instead")
+        return None
+    return writer.duration_ms
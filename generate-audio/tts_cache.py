@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+TTS Audio Cache
+- Content-addressed store of synthesized MP3s, keyed on (sanitized text, voice, language, speaking rate, encoding)
+- Per-line output files are hard links (or copies) of cache entries, so inserting or fixing a line in the
+  transcript never reuses the wrong audio and only the changed lines hit the API
+- Identical utterances (short acknowledgements, repeated mottos) are synthesized once, even when requested concurrently
+- Size-bounded with least-recently-used eviction; hit/miss/API-calls-saved statistics for the end-of-run report
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+def tts_cache_key(text: str, voice_name: str, language_code: str, speaking_rate: float, encoding: str) -> str:
+    payload = json.dumps({"text": text, "voice": voice_name, "language": language_code,
+                          "speaking_rate": float(speaking_rate), "encoding": encoding}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def link_or_copy(source, destination):
+    """
+    Atomically point `destination` at the cached audio: a hard link when possible, a copy otherwise
+    """
+    temp_file = f"{destination}.tmp"
+    if os.path.exists(temp_file):
+        os.remove(temp_file)
+    try:
+        os.link(source, temp_file)
+    except OSError:
+        shutil.copyfile(source, temp_file)
+    os.replace(temp_file, destination)
+
+class TTSCache:
+    """
+    Audio files live in `directory` as <key>.mp3; a SQLite index tracks their size and last use for LRU eviction.
+    Evicting an entry never breaks per-line outputs that were linked from it.
+    """
+    def __init__(self, directory, max_bytes: int = 1024 * 1024 * 1024):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._db = sqlite3.connect(str(self.directory / "index.sqlite"), check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS audio (
+                key TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS audio_last_used ON audio(last_used)")
+        self._db.commit()
+
+    def path_for(self, key: str) -> Path:
+        return self.directory / f"{key}.mp3"
+
+    def key_lock(self, key: str) -> threading.Lock:
+        """
+        One lock per key: a second request for the same audio waits for the first and then hits the cache
+        """
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def get(self, key: str):
+        """
+        Path of the cached MP3, or None (counted as a miss)
+        """
+        path = self.path_for(key)
+        with self._lock:
+            row = self._db.execute("SELECT 1 FROM audio WHERE key = ?", (key,)).fetchone()
+            if row is None or not path.exists():
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE audio SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+            self.hits += 1
+        return path
+
+    def put(self, key: str, audio_file) -> Path:
+        """
+        Move a freshly synthesized MP3 into the cache and return its cache path
+        """
+        path = self.path_for(key)
+        os.replace(audio_file, path)
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO audio (key, size, created, last_used) VALUES (?, ?, ?, ?)",
+                (key, path.stat().st_size, now, now),
+            )
+            self._evict(keep=key)
+            self._db.commit()
+        return path
+
+    def _evict(self, keep: str):
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM audio").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._db.execute("SELECT key, size FROM audio ORDER BY last_used ASC").fetchall():
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            self._db.execute("DELETE FROM audio WHERE key = ?", (key,))
+            try:
+                os.remove(self.path_for(key))
+            except FileNotFoundError:
+                pass
+            total -= size
+            self.evictions += 1
+
+    def summary(self) -> str:
+        with self._lock:
+            entries, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM audio").fetchone()
+        lookups = self.hits + self.misses
+        hit_rate = 100 * self.hits / lookups if lookups else 0
+        return (f"🔊 TTS cache: {self.hits} hits, {self.misses} misses ({hit_rate:.0f}% hit rate), "
+                f"{self.hits} API calls saved, {self.evictions} evicted, "
+                f"{entries} entries / {size / 1024 / 1024:.1f} MB in {self.directory}")
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Dialogue Format
+- One parser for the "Speaker X: text" transcripts the stages pass along: translated chunks, the merged and the
+  cleaned Japanese transcript, and the TTS input
+- Patterns are compiled once and run over batches of whole lines (BATCH_CHARS); parse_dialogue() only holds one
+  batch and the turn it is building, so a transcript of any size parses in constant memory
+- Chunk headers are dropped, characters TTS cannot speak are removed and a turn's continuation lines are joined
+- Everything is a generator, so merge -> clean -> TTS loading chain without intermediate files:
+    parse_dialogue(merged_lines(chunk_paths)) yields the (speaker, text) records the TTS stage reads
+"""
+
+import os
+import re
+
+BATCH_CHARS = 256 * 1024                       # Characters of whole lines parsed per regex pass
+
+# A tag anywhere in a line starts a new turn (models sometimes put two turns on one line)
+SPEAKER_TAG = re.compile(r"(Speaker [A-Z])[:：]")
+SPEAKER_LINE = re.compile(r"^\s*(Speaker [A-Z])[:：]")
+CHUNK_HEADER = re.compile(r"^=== TRANSLATION CHUNK chunk_\d{3,}\.txt ===\s*", re.MULTILINE)
+# Everything but ASCII, Japanese punctuation / kana / kanji and whitespace (safe for TTS)
+UNSPEAKABLE = re.compile(r'[^\x20-\x7E\u3000-\u303F\u3040-\u309F\u30A0-\u30FF\u4E00-\u9FFF。、「」！？\sA-Za-z0-9:：]')
+# Labels the model writes instead of "Speaker X:"; "Speaker 1" style labels become Speaker A as before
+TAG_VARIANT = re.compile(r"(?:話者\s*([A-E])|スピーカー\s*([A-E])|Speaker([A-E])|Speaker\s*\d)[:：]?")
+
+def speaker_of(line):
+    """
+    "Speaker X" if the line starts with a speaker tag, else None
+    """
+    match = SPEAKER_LINE.match(line)
+    return match.group(1) if match else None
+
+def normalize_tags(text: str) -> str:
+    """
+    Rewrite 話者A / スピーカーA / SpeakerA / Speaker 1 labels (and the colon after them) as "Speaker X:"
+    """
+    return TAG_VARIANT.sub(lambda m: f"Speaker {m.group(1) or m.group(2) or m.group(3) or 'A'}:", text)
+
+def separate_speakers(lines):
+    """
+    The lines unchanged, with two blank lines inserted wherever the speaker changes
+    """
+    last_speaker = None
+    for line in lines:
+        speaker = speaker_of(line)
+        if speaker:
+            if last_speaker and speaker != last_speaker:
+                yield ""
+                yield ""
+            last_speaker = speaker
+        yield line
+
+def merged_lines(chunk_paths):
+    """
+    The merged transcript's lines: a header per chunk file, then its lines with speaker switches separated
+    """
+    for chunk_path in chunk_paths:
+        yield ""
+        yield ""
+        yield f"=== TRANSLATION CHUNK {os.path.basename(chunk_path)} ==="
+        with open(chunk_path, "r", encoding="utf-8") as f:
+            yield from separate_speakers(line.rstrip("\r\n") for line in f)
+
+def line_batches(lines, batch_chars: int = BATCH_CHARS):
+    """
+    Whole lines joined into strings of about batch_chars; an open file is read with readlines() directly
+    """
+    if hasattr(lines, "readlines"):
+        while True:
+            batch = lines.readlines(batch_chars)
+            if not batch:
+                return
+            yield "".join(batch)
+    batch, size = [], 0
+    for line in lines:
+        batch.append(line)
+        size += len(line)
+        if size >= batch_chars:
+            yield "\n".join(batch)
+            batch, size = [], 0
+    if batch:
+        yield "\n".join(batch)
+
+def join_turn(parts) -> str:
+    # A turn's lines are joined without a separator (the text is Japanese); a list join, not `merged += line`
+    return "".join(line.strip() for part in parts for line in part.split("\n"))
+
+def parse_dialogue(lines):
+    """
+    (speaker, text) for every turn in `lines` (an open file or any iterable of lines).
+    Text before the first speaker tag is yielded with speaker None; turns without text are dropped.
+    """
+    speaker, parts = None, []
+    for batch in line_batches(lines):
+        # [text before the first tag, speaker, text, speaker, text, ...]
+        pieces = SPEAKER_TAG.split(UNSPEAKABLE.sub("", CHUNK_HEADER.sub("", batch)))
+        parts.append(pieces[0])
+        for i in range(1, len(pieces), 2):
+            text = join_turn(parts)
+            if text:
+                yield speaker, text
+            speaker, parts = pieces[i], [pieces[i + 1]]
+    text = join_turn(parts)
+    if text:
+        yield speaker, text
+
+def format_turn(speaker, text) -> str:
+    return f"{speaker}: {text}" if speaker else text
+
+def write_dialogue(turns, output_path) -> int:
+    """
+    Write the turns one per line with a blank line between them; returns how many were written.
+    The file is replaced atomically, and left untouched if there were no turns.
+    """
+    temp_file = f"{output_path}.tmp"
+    written = 0
+    with open(temp_file, "w", encoding="utf-8") as f:
+        for speaker, text in turns:
+            f.write(("\n\n" if written else "") + format_turn(speaker, text))
+            written += 1
+    if written:
+        os.replace(temp_file, output_path)
+    else:
+        os.remove(temp_file)
+    return written
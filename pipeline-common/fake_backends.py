@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+Local fake service backends
+- Stand-ins for the AssemblyAI, OpenAI and Google TTS clients so stages can be exercised without network or quota
+- Configurable latency, failure rate and 429 behavior; every call is counted
+"""
+
+import json
+import os
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+# One MPEG-2 Layer III frame (24 kHz mono, 32 kbps, 576 samples = 24 ms) with all-zero side info: decodes to silence
+SILENT_MP3_FRAME = bytes((0xFF, 0xF3, 0x44, 0xC4)) + bytes(92)
+SILENT_MP3_FRAME_MS = 24
+
+class QuotaWindow:
+    """
+    At most `per_second` calls within any one-second window (None = unlimited), like a per-minute API quota
+    """
+    def __init__(self, per_second: int = None):
+        self.per_second = per_second
+        self._recent_calls = []
+
+    def admit(self) -> bool:
+        # Callers hold their own lock
+        if self.per_second is None:
+            return True
+        now = time.monotonic()
+        self._recent_calls = [t for t in self._recent_calls if now - t < 1.0]
+        if len(self._recent_calls) >= self.per_second:
+            return False
+        self._recent_calls.append(now)
+        return True
+
+class FakeTranscriber:
+    """
+    Mimics aai.Transcriber.transcribe(): returns an object with status, error and utterances.
+    More than `quota_per_second` submissions within one second fail with 429 + Retry-After.
+    """
+    def __init__(self, latency: float = 0.0, failure_rate: float = 0.0, utterances_per_chunk: int = 3, seed: int = 0,
+                 quota_per_second: int = None, retry_after: float = 1.0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.utterances_per_chunk = utterances_per_chunk
+        self.retry_after = retry_after
+        self.quota = QuotaWindow(quota_per_second)
+        self.quota_errors = 0
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def transcribe(self, audio_path):
+        with self._lock:
+            self.calls += 1
+            if not self.quota.admit():
+                self.quota_errors += 1
+                raise FakeAPIStatusError("Too many requests (fake)", 429, {"retry-after": str(self.retry_after)})
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            fail = self._random.random() < self.failure_rate
+        try:
+            time.sleep(self.latency + self.job_seconds(audio_path))
+            if fail:
+                return SimpleNamespace(status="error", error="fake transcription failure", utterances=None,
+                                       words=None)
+            return self.result(audio_path)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def job_seconds(self, audio_path) -> float:
+        return 0.0
+
+    def result(self, audio_path):
+        name = os.path.splitext(os.path.basename(str(audio_path)))[0]
+        utterances = [
+            SimpleNamespace(
+                speaker="AB"[i % 2],
+                text=f"Utterance {i + 1} of {name}.",
+                start=i * 5000,
+                end=i * 5000 + 4000,
+            )
+            for i in range(self.utterances_per_chunk)
+        ]
+        # Words spread evenly over each utterance, for callers that read transcript.words
+        words = []
+        for utterance in utterances:
+            texts = utterance.text.split()
+            step = (utterance.end - utterance.start) // len(texts)
+            words += [SimpleNamespace(text=text, start=utterance.start + k * step,
+                                      end=utterance.start + (k + 1) * step, speaker=utterance.speaker)
+                      for k, text in enumerate(texts)]
+        return SimpleNamespace(status="completed", error=None, utterances=utterances, words=words)
+
+class FixtureTranscriber(FakeTranscriber):
+    """
+    Replays fixture word timings instead of made-up utterances. `fixtures` maps a chunk name to its words
+    (text, start, end, speaker; ms in the chunk); `locate(audio_path)` gives (chunk name, start_ms, end_ms) of
+    the clip sent, with end_ms None for a whole chunk. Like a real job on a clip: words cut by the clip edges are
+    lost, times are relative to the clip and jittered by up to jitter_ms, and the speaker labels are shuffled
+    per clip. A call takes latency + seconds_per_audio_second for every second of the clip.
+    """
+    def __init__(self, fixtures: dict, locate, jitter_ms: int = 0, seconds_per_audio_second: float = 0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.fixtures = fixtures
+        self.locate = locate
+        self.jitter_ms = jitter_ms
+        self.seconds_per_audio_second = seconds_per_audio_second
+
+    def clip(self, audio_path):
+        name, start_ms, end_ms = self.locate(audio_path)
+        words = self.fixtures[name]
+        if end_ms is None:
+            end_ms = max((word["end"] for word in words), default=0)
+        return name, start_ms, end_ms, words
+
+    def job_seconds(self, audio_path) -> float:
+        _, start_ms, end_ms, _ = self.clip(audio_path)
+        return self.seconds_per_audio_second * (end_ms - start_ms) / 1000
+
+    def result(self, audio_path):
+        name, start_ms, end_ms, fixture_words = self.clip(audio_path)
+        rng = random.Random(f"{name}@{start_ms}")
+        speakers = sorted({word["speaker"] for word in fixture_words})
+        relabel = dict(zip(speakers, rng.sample(speakers, len(speakers))))
+        words = []
+        for word in fixture_words:
+            if word["start"] < start_ms or word["end"] > end_ms:
+                continue
+            start = max(0, word["start"] - start_ms + rng.randint(-self.jitter_ms, self.jitter_ms))
+            end = max(start + 1, word["end"] - start_ms + rng.randint(-self.jitter_ms, self.jitter_ms))
+            words.append(SimpleNamespace(text=word["text"], start=start, end=end, speaker=relabel[word["speaker"]]))
+
+        utterances = []
+        for word in words:
+            if utterances and utterances[-1].speaker == word.speaker:
+                utterances[-1].text += " " + word.text
+                utterances[-1].end = word.end
+            else:
+                utterances.append(SimpleNamespace(speaker=word.speaker, text=word.text, start=word.start, end=word.end))
+        return SimpleNamespace(status="completed", error=None, utterances=utterances, words=words)
+
+class FakeHTTPResponse:
+    def __init__(self, status_code: int, headers: dict = None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+class FakeAPIStatusError(Exception):
+    """
+    Shaped like openai.APIStatusError: status_code plus a response carrying headers (e.g. retry-after)
+    """
+    def __init__(self, message: str, status_code: int, headers: dict = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.response = FakeHTTPResponse(status_code, headers)
+
+class FakeOpenAI:
+    """
+    OpenAI-compatible stand-in for client.chat.completions.create().
+    "Translates" by tagging each line, keeping speaker labels intact. Once more than `rate_limit_concurrency`
+    calls are in flight, further calls fail with 429 and a Retry-After header, like a real rate limit.
+    A `straggler_rate` share of calls takes `straggler_latency` instead of `latency` (capped by the timeout).
+    """
+    def __init__(self, latency: float = 0.0, failure_rate: float = 0.0, rate_limit_concurrency: int = None,
+                 retry_after: float = 1.0, seed: int = 0, straggler_rate: float = 0.0, straggler_latency: float = 0.0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.straggler_rate = straggler_rate
+        self.straggler_latency = straggler_latency
+        self.rate_limit_concurrency = rate_limit_concurrency
+        self.retry_after = retry_after
+        self.calls = 0
+        self.rate_limited = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    @staticmethod
+    def fake_translate(text: str) -> str:
+        lines = []
+        for line in text.splitlines():
+            label, sep, body = line.partition(":")
+            if sep and label.startswith("Speaker "):
+                lines.append(f"{label}: 【訳】{body.strip()}")
+            else:
+                lines.append(f"【訳】{line}" if line.strip() else line)
+        return "\n".join(lines)
+
+    def _create(self, model=None, messages=None, temperature=None, timeout=None, **kwargs):
+        with self._lock:
+            self.calls += 1
+            if self.rate_limit_concurrency is not None and self.in_flight >= self.rate_limit_concurrency:
+                self.rate_limited += 1
+                raise FakeAPIStatusError("Rate limit reached (fake)", 429, {"retry-after": str(self.retry_after)})
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            fail = self._random.random() < self.failure_rate
+            stall = self.straggler_rate > 0 and self._random.random() < self.straggler_rate
+            latency = self.straggler_latency if stall else self.latency
+        try:
+            if timeout is not None and latency > timeout:
+                time.sleep(timeout)
+                raise TimeoutError(f"Request timed out after {timeout}s (fake)")
+            time.sleep(latency)
+            if fail:
+                raise FakeAPIStatusError("Internal server error (fake)", 500)
+
+            user_text = messages[-1]["content"]
+            content = self.fake_translate(user_text)
+            prompt_tokens = sum(len(m["content"]) for m in messages) // 4
+            completion_tokens = len(content) // 2
+            with self._lock:
+                self.prompt_tokens += prompt_tokens
+                self.completion_tokens += completion_tokens
+            return SimpleNamespace(
+                choices=[SimpleNamespace(message=SimpleNamespace(content=content), finish_reason="stop")],
+                usage=SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                                      total_tokens=prompt_tokens + completion_tokens),
+            )
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+class FakeTTSClient:
+    """
+    Mimics texttospeech.TextToSpeechClient.synthesize_speech(): returns real (silent) MP3 bytes whose
+    duration grows with the text length, so merge steps downstream get valid audio.
+    Quota errors: more than `quota_per_second` calls within one second fail with 429 + Retry-After,
+    like Google's per-minute quota. `timeouts` are honored: a latency above the timeout raises a timeout error.
+    A `straggler_rate` share of calls takes `straggler_latency` instead of `latency`.
+    """
+    def __init__(self, latency: float = 0.0, failure_rate: float = 0.0, ms_per_char: int = 120,
+                 quota_per_second: int = None, retry_after: float = 1.0, seed: int = 0, straggler_rate: float = 0.0,
+                 straggler_latency: float = 0.0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.straggler_rate = straggler_rate
+        self.straggler_latency = straggler_latency
+        self.ms_per_char = ms_per_char
+        self.quota = QuotaWindow(quota_per_second)
+        self.retry_after = retry_after
+        self.quota_errors = 0
+        self.timeouts = 0
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def silent_mp3(duration_ms: int) -> bytes:
+        # Repeated silent frames: valid MP3 of any length without running an encoder
+        return SILENT_MP3_FRAME * max(1, round(duration_ms / SILENT_MP3_FRAME_MS))
+
+    def synthesize_speech(self, input=None, voice=None, audio_config=None, timeout=None, **kwargs):
+        with self._lock:
+            self.calls += 1
+            if not self.quota.admit():
+                self.quota_errors += 1
+                raise FakeAPIStatusError("Quota exceeded (fake)", 429, {"retry-after": str(self.retry_after)})
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            fail = self._random.random() < self.failure_rate
+            stall = self.straggler_rate > 0 and self._random.random() < self.straggler_rate
+            latency = self.straggler_latency if stall else self.latency
+        try:
+            if timeout is not None and latency > timeout:
+                time.sleep(timeout)
+                with self._lock:
+                    self.timeouts += 1
+                raise TimeoutError(f"Deadline of {timeout}s exceeded (fake)")
+            time.sleep(latency)
+            if fail:
+                raise FakeAPIStatusError("Service unavailable (fake)", 503)
+            duration_ms = len(input.text) * self.ms_per_char
+            return SimpleNamespace(audio_content=self.silent_mp3(duration_ms))
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+def write_fake_batch_results(requests_file, results_file, skip_custom_ids=(), fail_custom_ids=()):
+    """
+    Answer an OpenAI batch-request JSONL offline, in the Batch API's output format.
+    skip_custom_ids leaves requests unanswered (partial batch); fail_custom_ids returns a 500 error for them.
+    """
+    with open(requests_file, "r", encoding="utf-8") as f:
+        requests = [json.loads(line) for line in f if line.strip()]
+    with open(results_file, "w", encoding="utf-8") as f:
+        for number, request in enumerate(requests, start=1):
+            custom_id = request["custom_id"]
+            if custom_id in skip_custom_ids:
+                continue
+            if custom_id in fail_custom_ids:
+                result = {"id": f"batch_req_{number}", "custom_id": custom_id,
+                          "response": {"status_code": 500, "body": {"error": {"message": "Internal error (fake)"}}},
+                          "error": None}
+            else:
+                content = FakeOpenAI.fake_translate(request["body"]["messages"][-1]["content"])
+                body = {"model": request["body"]["model"],
+                        "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                                     "finish_reason": "stop"}]}
+                result = {"id": f"batch_req_{number}", "custom_id": custom_id,
+                          "response": {"status_code": 200, "body": body}, "error": None}
+            f.write(json.dumps(result, ensure_ascii=False) + "\n")
+    return len(requests)
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Hedged Requests
+- Opt-in tail-latency cut for the translation and TTS calls: a call that has not returned after the stage's
+  recent p95 latency (HEDGE_QUANTILE of the last LATENCY_WINDOW successful calls) gets one duplicate, and the
+  first successful response wins
+- The loser is abandoned: its response is dropped when it arrives, and its thread ends at the request's own
+  timeout. Neither the OpenAI nor the Google client can abort a call that is already on the wire.
+- Extra requests are capped twice: at most max_extra hedges per call on average (with a small burst), and a
+  hedge only goes out if the stage's shared token bucket has a token right now, so hedging never pushes past
+  TTS_REQUESTS_PER_MINUTE or TRANSLATION_RATE_LIMIT_DELAY; without budget the call just keeps waiting
+- With an AIMD controller (rate_limit.AdaptiveConcurrency), a hedge also needs a free slot right now and holds it
+  until the last of the call's requests has ended, so an abandoned loser still counts against the limit; a 429 or
+  timeout the caller never sees (a loser's, or a failed attempt when the other one won) is passed to on_throttle()
+- Metrics: hedges_total{stage, outcome=issued|won|skipped}
+"""
+
+import contextvars
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+from metrics import count, percentile
+from retry import is_overload_error
+
+DEFAULT_QUANTILE = 0.95
+DEFAULT_MAX_EXTRA = 0.05                  # At most 5 hedges per 100 calls
+HEDGE_BURST = 2.0                         # Hedges that may go out back to back after a quiet period
+MIN_SAMPLES = 20                          # Below this many observed calls, initial_delay is the threshold
+LATENCY_WINDOW = 200                      # Recent successful calls the threshold is computed from
+MIN_DELAY = 0.05
+
+class HedgingPolicy:
+    """
+    Hedging threshold, budget and counters of one stage; shared by all of the stage's workers
+    """
+    def __init__(self, stage: str, initial_delay: float, quantile: float = DEFAULT_QUANTILE,
+                 max_extra: float = DEFAULT_MAX_EXTRA, burst: float = HEDGE_BURST, window: int = LATENCY_WINDOW):
+        self.stage = stage
+        self.initial_delay = initial_delay
+        self.quantile = quantile
+        self.max_extra = max_extra
+        self.burst = burst
+        self.calls = 0
+        self.issued = 0
+        self.won = 0
+        self.skipped = 0
+        self._latencies = deque(maxlen=window)
+        self._credit = burst
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, prefix: str, stage: str, initial_delay: float):
+        """
+        The policy configured by {prefix}_HEDGE_* in .env, or None unless {prefix}_HEDGE_ENABLED=true
+        """
+        if os.getenv(f"{prefix}_HEDGE_ENABLED", "false").lower() != "true":
+            return None
+        return cls(stage, float(os.getenv(f"{prefix}_HEDGE_INITIAL_DELAY", str(initial_delay))),
+                   float(os.getenv(f"{prefix}_HEDGE_QUANTILE", str(DEFAULT_QUANTILE))),
+                   float(os.getenv(f"{prefix}_HEDGE_MAX_EXTRA", str(DEFAULT_MAX_EXTRA))))
+
+    def delay(self) -> float:
+        """
+        Seconds to wait for a call before hedging it: the quantile of recent latencies once there are enough
+        """
+        with self._lock:
+            if len(self._latencies) < MIN_SAMPLES:
+                return self.initial_delay
+            latencies = sorted(self._latencies)
+        return max(MIN_DELAY, percentile(latencies, self.quantile))
+
+    def observe(self, seconds: float):
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def _take_hedge(self, rate_limiter, concurrency) -> bool:
+        with self._lock:
+            if self._credit < 1:
+                return False
+            if concurrency is not None and not concurrency.try_acquire():
+                return False
+            # The shared bucket is checked last, so a refused hedge does not use up a token
+            if rate_limiter is not None and not rate_limiter.try_acquire():
+                if concurrency is not None:
+                    concurrency.release()
+                return False
+            self._credit -= 1
+            return True
+
+    def call(self, request, rate_limiter=None, concurrency=None):
+        """
+        Run request() and return the first successful result; the caller has already spent the primary's token
+        and holds its slot in `concurrency`. Raises the first error only if every attempt failed.
+        """
+        results = queue.SimpleQueue()
+        state_lock = threading.Lock()
+        in_flight = 0
+        hedge_slot = False                # The hedge's slot, released when the last request ends
+        decided = False                   # Set when call() stops reading results
+
+        def unseen_error(error):
+            if concurrency is not None and is_overload_error(error):
+                concurrency.on_throttle()
+
+        def attempt(kind):
+            nonlocal in_flight
+            start = time.perf_counter()
+            try:
+                value = request()
+                ok = True
+                self.observe(time.perf_counter() - start)
+            except Exception as e:
+                value, ok = e, False
+            with state_lock:
+                in_flight -= 1
+                release = hedge_slot and not in_flight
+                abandoned = decided
+                if not abandoned:
+                    results.put((kind, ok, value))
+            if release:
+                concurrency.release()
+            if abandoned and not ok:
+                unseen_error(value)
+
+        def launch(kind):
+            nonlocal in_flight
+            # Copy the context so spans opened by the request keep the caller's span as their parent
+            context = contextvars.copy_context()
+            in_flight += 1
+            threading.Thread(target=context.run, args=(attempt, kind), daemon=True).start()
+
+        def finish():
+            # Errors still queued will never be read by the caller
+            nonlocal decided
+            with state_lock:
+                decided = True
+            while True:
+                try:
+                    _, ok, value = results.get_nowait()
+                except queue.Empty:
+                    return
+                if not ok:
+                    unseen_error(value)
+
+        with self._lock:
+            self.calls += 1
+            self._credit = min(self.burst, self._credit + self.max_extra)
+        with state_lock:
+            launch("primary")
+        running = 1
+        try:
+            kind, ok, value = results.get(timeout=self.delay())
+        except queue.Empty:
+            with state_lock:
+                # Taken under state_lock, so a primary ending now cannot miss the hedge's slot
+                hedged = self._take_hedge(rate_limiter, concurrency)
+                if hedged:
+                    hedge_slot = concurrency is not None
+                    launch("hedge")
+            if hedged:
+                running += 1
+                self._record("issued")
+            else:
+                self._record("skipped")
+            kind, ok, value = results.get()
+        running -= 1
+
+        error = None
+        while not ok:
+            if error is None:
+                error = value
+            else:
+                unseen_error(value)
+            if not running:
+                finish()
+                raise error
+            kind, ok, value = results.get()
+            running -= 1
+        if error is not None:
+            unseen_error(error)
+        finish()
+        if kind == "hedge":
+            self._record("won")
+        return value
+
+    def _record(self, outcome: str):
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+        count("hedges_total", stage=self.stage, outcome=outcome)
+
+    def summary(self) -> str:
+        return (f"🪁 Hedging ({self.stage}): {self.issued} of {self.calls} calls hedged ({self.won} won, "
+                f"{self.skipped} skipped for budget), threshold now {self.delay():.2f}s")
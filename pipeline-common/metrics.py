@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Pipeline Metrics
+- Spans: timed pieces of work (a chunk, one API call, a preprocessing pass) with attributes such as sizes,
+  token counts and the attempt number; nested spans in the same thread record their parent
+- Counters: retries, errors, bytes sent and received, OpenAI tokens, TTS characters
+- Every finished span is appended to a JSONL trace; finish_run() writes a Prometheus text-format snapshot and
+  prints p50/p95/p99 latency per stage and span
+- The stage scripts record through the module-level span() / record_span() / count(); until start_run() is
+  called they only aggregate in memory (e.g. inside the benchmark or a worker process)
+"""
+
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+
+METRICS_DIR = Path(__file__).resolve().parent.parent / "joe-charlie-aa-js/test-output/metrics"
+TRACE_FILENAME = "trace.jsonl"            # Appended by every run; records carry the run id and script name
+QUANTILES = (0.5, 0.95, 0.99)
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+def percentile(sorted_values, q: float) -> float:
+    """
+    Linear-interpolated quantile of an already sorted list
+    """
+    if not sorted_values:
+        return 0.0
+    position = (len(sorted_values) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+def prometheus_labels(labels) -> str:
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + "}"
+
+class Span:
+    """
+    One timed piece of work. Use as a context manager; an exception leaving the block marks it failed.
+    fail() marks it failed without raising (e.g. an API call whose error the caller retries).
+    """
+    def __init__(self, metrics, stage: str, name: str, attrs: dict):
+        self.metrics = metrics
+        self.stage = stage
+        self.name = name
+        self.attrs = attrs
+        self.id = uuid.uuid4().hex[:16]
+        self.parent = None
+        self.status = "ok"
+        self.error = None
+        self.started = None
+        self.seconds = None
+        self._start = None
+        self._token = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def fail(self, error):
+        self.status = "error"
+        self.error = error if isinstance(error, str) else type(error).__name__
+
+    def __enter__(self):
+        parent = _current_span.get()
+        self.parent = parent.id if parent is not None else None
+        self._token = _current_span.set(self)
+        self.started = time.time()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.seconds = time.perf_counter() - self._start
+        _current_span.reset(self._token)
+        if exc is not None:
+            self.fail(exc)
+        self.metrics.finish_span(self)
+        return False
+
+class Metrics:
+    """
+    Thread-safe span and counter store. Span durations are kept per (stage, span name) for exact percentiles;
+    with a trace_path every finished span is also written there as one JSON line.
+    """
+    def __init__(self, trace_path=None, script: str = None):
+        self.script = script
+        self.run_id = uuid.uuid4().hex[:12]
+        self.durations = {}                 # (stage, name) -> [seconds]
+        self.errors = {}                    # (stage, name) -> failed span count
+        self.counters = {}                  # (metric, ((label, value), ...)) -> total
+        self._lock = threading.Lock()
+        self._trace = None
+        if trace_path is not None:
+            os.makedirs(os.path.dirname(trace_path), exist_ok=True)
+            self._trace = open(trace_path, "a", encoding="utf-8", buffering=1)
+
+    def span(self, stage: str, name: str, **attrs) -> Span:
+        return Span(self, stage, name, attrs)
+
+    def record_span(self, stage: str, name: str, seconds: float, error=None, **attrs):
+        """
+        Record work timed elsewhere (e.g. in a worker process) as a finished span
+        """
+        span = Span(self, stage, name, attrs)
+        parent = _current_span.get()
+        span.parent = parent.id if parent is not None else None
+        span.started = time.time() - seconds
+        span.seconds = seconds
+        if error is not None:
+            span.fail(error)
+        self.finish_span(span)
+
+    def finish_span(self, span: Span):
+        key = (span.stage, span.name)
+        with self._lock:
+            self.durations.setdefault(key, []).append(span.seconds)
+            if span.status != "ok":
+                self.errors[key] = self.errors.get(key, 0) + 1
+        if span.status != "ok":
+            self.count("errors_total", stage=span.stage, span=span.name, error=span.error)
+        if self._trace is not None:
+            record = {"run": self.run_id, "script": self.script, "span": span.id, "parent": span.parent,
+                      "stage": span.stage, "name": span.name, "start": round(span.started, 6),
+                      "seconds": round(span.seconds, 6), "status": span.status}
+            if span.error is not None:
+                record["error"] = span.error
+            record.update(span.attrs)
+            line = json.dumps(record, ensure_ascii=False, default=str)
+            with self._lock:
+                self._trace.write(line + "\n")
+
+    def count(self, metric: str, value: float = 1, **labels):
+        key = (metric, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def prometheus_text(self) -> str:
+        """
+        Snapshot in the Prometheus text exposition format (for node_exporter's textfile collector or a push)
+        """
+        lines = ["# HELP pipeline_span_seconds Duration of pipeline spans (chunks, API calls, passes)",
+                 "# TYPE pipeline_span_seconds summary"]
+        with self._lock:
+            durations = {key: sorted(values) for key, values in self.durations.items()}
+            counters = dict(self.counters)
+        for (stage, name), values in sorted(durations.items()):
+            labels = (("stage", stage), ("span", name))
+            for q in QUANTILES:
+                lines.append(f"pipeline_span_seconds{prometheus_labels(labels + (('quantile', q),))} "
+                             f"{percentile(values, q):.6f}")
+            lines.append(f"pipeline_span_seconds_sum{prometheus_labels(labels)} {sum(values):.6f}")
+            lines.append(f"pipeline_span_seconds_count{prometheus_labels(labels)} {len(values)}")
+
+        typed = set()
+        for (metric, labels), value in sorted(counters.items(), key=lambda item: (item[0][0], str(item[0][1]))):
+            name = f"pipeline_{metric}"
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            lines.append(f"{name}{prometheus_labels(labels)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def write_snapshot(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_file = f"{path}.tmp"
+        with open(temp_file, "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text())
+        os.replace(temp_file, path)
+
+    def summary(self) -> str:
+        """
+        Latency percentiles per stage and span, followed by the counter totals
+        """
+        with self._lock:
+            durations = {key: sorted(values) for key, values in self.durations.items()}
+            errors = dict(self.errors)
+            counters = dict(self.counters)
+        lines = ["📊 Metrics:", f"  {'stage':<11} {'span':<16} {'count':>6} {'errors':>6} "
+                                f"{'p50':>8} {'p95':>8} {'p99':>8} {'total':>9}"]
+        for (stage, name), values in sorted(durations.items()):
+            p50, p95, p99 = (percentile(values, q) for q in QUANTILES)
+            lines.append(f"  {stage:<11} {name:<16} {len(values):>6} {errors.get((stage, name), 0):>6} "
+                         f"{p50:>7.2f}s {p95:>7.2f}s {p99:>7.2f}s {sum(values):>8.1f}s")
+        totals = {}
+        for (metric, labels), value in counters.items():
+            if metric == "errors_total":
+                continue
+            stage = dict(labels).get("stage", "")
+            totals[(metric, stage)] = totals.get((metric, stage), 0) + value
+        for (metric, stage), value in sorted(totals.items()):
+            lines.append(f"  {stage:<11} {metric:<28} {value:>12g}")
+        return "\n".join(lines)
+
+    def close(self):
+        if self._trace is not None:
+            self._trace.close()
+            self._trace = None
+
+_metrics = Metrics()
+
+def get_metrics() -> Metrics:
+    return _metrics
+
+def span(stage: str, name: str, **attrs) -> Span:
+    return _metrics.span(stage, name, **attrs)
+
+def record_span(stage: str, name: str, seconds: float, error=None, **attrs):
+    _metrics.record_span(stage, name, seconds, error, **attrs)
+
+def count(metric: str, value: float = 1, **labels):
+    _metrics.count(metric, value, **labels)
+
+def start_run(script: str, enabled: bool = True) -> Metrics:
+    """
+    Start recording for one script run: spans go to PIPELINE_METRICS_DIR/trace.jsonl unless `enabled` is False
+    (e.g. plan mode) or PIPELINE_METRICS_ENABLED=false
+    """
+    global _metrics
+    enabled = enabled and os.getenv("PIPELINE_METRICS_ENABLED", "true").lower() == "true"
+    metrics_dir = Path(os.getenv("PIPELINE_METRICS_DIR", str(METRICS_DIR)))
+    _metrics.close()
+    _metrics = Metrics(metrics_dir / TRACE_FILENAME if enabled else None, script=script)
+    return _metrics
+
+def finish_run(print_summary: bool = True):
+    """
+    Print the latency summary, write PIPELINE_METRICS_DIR/<script>.prom and close the trace.
+    A run that recorded nothing (plan mode, everything up to date) prints and writes nothing.
+    """
+    if not _metrics.durations and not _metrics.counters:
+        _metrics.close()
+        return
+    if print_summary:
+        print(_metrics.summary())
+    if _metrics._trace is not None:
+        metrics_dir = Path(os.getenv("PIPELINE_METRICS_DIR", str(METRICS_DIR)))
+        snapshot = metrics_dir / f"{_metrics.script or 'pipeline'}.prom"
+        _metrics.write_snapshot(snapshot)
+        print(f"📈 Trace appended to {metrics_dir / TRACE_FILENAME}, metrics snapshot written to {snapshot}")
+    _metrics.close()
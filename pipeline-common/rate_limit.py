@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Rate limiting shared by the pipeline stages
+- TokenBucket: thread-safe request budget (N requests per second/minute, with a burst size)
+"""
+
+import threading
+import time
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled at `rate` tokens per second, holding at most `capacity` tokens.
+    A rate of None means unlimited. Callers that have to wait reserve their token first, so waiting
+    threads are served in arrival order instead of racing each other.
+    """
+    def __init__(self, rate: float = None, capacity: float = 1.0, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def per_minute(cls, requests_per_minute: float, burst: float = 1.0, **kwargs):
+        return cls(requests_per_minute / 60 if requests_per_minute > 0 else None, burst, **kwargs)
+
+    @classmethod
+    def from_delay(cls, delay_seconds: float, burst: float = 1.0, **kwargs):
+        # Equivalent budget to "sleep(delay_seconds) after every request"
+        return cls(1 / delay_seconds if delay_seconds > 0 else None, burst, **kwargs)
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        """
+        Take tokens only if they are available right now
+        """
+        if self.rate is None:
+            return True
+        with self._lock:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """
+        Block until tokens are available; returns the seconds spent waiting
+        """
+        if self.rate is None:
+            return 0.0
+        with self._lock:
+            self._refill()
+            self._tokens -= tokens
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait > 0:
+            self._sleep(wait)
+        return wait
+
+class AdaptiveConcurrency:
+    """
+    AIMD concurrency limit shared by worker threads: the limit grows by one slot per round of
+    successful calls (additive increase) and is multiplied by `decrease_factor` on 429s / timeouts
+    (multiplicative decrease). Decreases closer together than `cooldown` seconds count as one event,
+    since every call in flight tends to fail at the same time.
+    """
+    def __init__(self, initial: int = 1, minimum: int = 1, maximum: int = 8, decrease_factor: float = 0.5,
+                 cooldown: float = 1.0, clock=time.monotonic):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.decrease_factor = decrease_factor
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self.increases = 0
+        self.decreases = 0
+        self._clock = clock
+        self._last_decrease = None
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+
+    def try_acquire(self) -> bool:
+        """
+        Take a slot only if one is free right now
+        """
+        with self._condition:
+            if self.in_flight >= int(self.limit):
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self):
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def on_success(self):
+        with self._condition:
+            previous = int(self.limit)
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            if int(self.limit) > previous:
+                self.increases += 1
+                self._condition.notify_all()
+
+    def on_throttle(self):
+        with self._condition:
+            now = self._clock()
+            if self._last_decrease is not None and now - self._last_decrease < self.cooldown:
+                return
+            self._last_decrease = now
+            self.limit = max(self.minimum, self.limit * self.decrease_factor)
+            self.decreases += 1
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+        return False
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Retry helpers shared by the pipeline stages
+- Jittered exponential backoff
+- Classification of overload errors (429 / 503 / timeouts) across the OpenAI, Google and AssemblyAI clients
+- Retry-After header parsing
+"""
+
+import random
+import time
+from email.utils import parsedate_to_datetime
+
+OVERLOAD_STATUS_CODES = {429, 503, 504}
+
+def jittered_backoff(attempt: int, base: float, cap: float = 60.0, rng=random) -> float:
+    """
+    Exponential backoff with "equal jitter": half of base * 2^(attempt-1) is fixed, the other half random,
+    so retries from many workers spread out instead of hitting the API in lockstep
+    """
+    delay = min(cap, base * (2 ** (attempt - 1)))
+    return delay / 2 + rng.uniform(0, delay / 2)
+
+def error_status_code(exc):
+    # openai.APIStatusError -> status_code; google.api_core exceptions -> code; httpx errors -> response.status_code
+    for attribute in ("status_code", "code"):
+        value = getattr(exc, attribute, None)
+        if isinstance(value, int):
+            return value
+    response = getattr(exc, "response", None)
+    return getattr(response, "status_code", None)
+
+def is_timeout_error(exc) -> bool:
+    return isinstance(exc, TimeoutError) or "Timeout" in type(exc).__name__ or type(exc).__name__ == "DeadlineExceeded"
+
+def is_overload_error(exc) -> bool:
+    """
+    True for errors that mean "slow down": rate limiting, service overload and timeouts
+    """
+    return error_status_code(exc) in OVERLOAD_STATUS_CODES or is_timeout_error(exc)
+
+def retry_after_seconds(exc):
+    """
+    Seconds requested by a Retry-After / retry-after-ms response header, or None
+    """
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return max(0.0, float(retry_after_ms) / 1000)
+        except ValueError:
+            pass
+
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
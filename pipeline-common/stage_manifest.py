@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Stage Manifest
+- One JSON file recording, for every artifact the pipeline stages produce (chunks, transcript, per-chunk
+  translations, merged and cleaned text, TTS segments, the final MP3), the hashes of its inputs, its settings
+  and the hashes of its outputs
+- A stage rebuilds an artifact only when one of those changed or an output went missing / was edited by hand;
+  everything else is reused, so a small edit to a long episode only redoes the affected pieces
+- Plan mode (dry_run) records nothing: it lists what would be rebuilt and why. An artifact that would be rebuilt
+  marks its outputs dirty, so dependents later in the same run are listed too.
+- File hashes are cached by (size, mtime), so checking a multi-hour WAV that did not change costs one stat
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+PIPELINE_MANIFEST_PATH = Path(__file__).resolve().parent.parent / "joe-charlie-aa-js/test-output/pipeline_manifest.json"
+HASH_BLOCK_BYTES = 1024 * 1024
+
+def file_digest(path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_BYTES), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def text_digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def config_digest(config) -> str:
+    return text_digest(json.dumps(config or {}, sort_keys=True, ensure_ascii=False, default=str))
+
+def open_manifest(dry_run: bool = False):
+    """
+    The manifest the stage scripts share (PIPELINE_MANIFEST_PATH in .env overrides the location)
+    """
+    return StageManifest(os.getenv("PIPELINE_MANIFEST_PATH", str(PIPELINE_MANIFEST_PATH)), dry_run=dry_run)
+
+class StageManifest:
+    """
+    artifact name -> {stage, inputs {path: sha}, content sha, config sha, outputs {path: sha}, updated}.
+    Paths are stored relative to the manifest's directory. Thread-safe: stage workers record concurrently.
+    """
+    def __init__(self, path, dry_run: bool = False):
+        self.path = Path(path)
+        self.root = self.path.parent
+        self.dry_run = dry_run
+        self.planned = []                 # (artifact, reason) for everything found stale
+        self.checked = 0
+        self._dirty = set()               # Outputs of stale artifacts: their dependents are stale too
+        self._lock = threading.RLock()
+        self.artifacts = {}
+        self._files = {}                  # path -> [size, mtime_ns, sha]
+        if self.path.exists():
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.artifacts = data.get("artifacts", {})
+            self._files = data.get("files", {})
+
+    def _key(self, path) -> str:
+        return os.path.relpath(os.path.abspath(path), self.root)
+
+    def digest(self, path):
+        """
+        SHA-256 of a file, or None if it does not exist; unchanged files (same size and mtime) are not re-read
+        """
+        key = self._key(path)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            cached = self._files.get(key)
+            if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+                return cached[2]
+        sha = file_digest(path)
+        with self._lock:
+            self._files[key] = [stat.st_size, stat.st_mtime_ns, sha]
+        return sha
+
+    def check(self, artifact: str, inputs=(), config=None, content: str = None, outputs=(), upstream=()):
+        """
+        Why `artifact` has to be rebuilt, or None if it is up to date.
+        inputs: files whose content the artifact depends on; content: an in-memory input (e.g. one chunk's
+        text); upstream: files it is derived from but not hashed against (only used to propagate plan-mode
+        dirtiness); outputs: files it produces. A stale artifact marks its outputs dirty.
+        """
+        reason = self._reason(artifact, inputs, config, content, outputs, upstream)
+        with self._lock:
+            self.checked += 1
+            if reason is not None:
+                self.planned.append((artifact, reason))
+                recorded = self.artifacts.get(artifact, {}).get("outputs", {})
+                self._dirty.update(self._key(path) for path in outputs)
+                self._dirty.update(recorded)
+        return reason
+
+    def _reason(self, artifact, inputs, config, content, outputs, upstream):
+        entry = self.artifacts.get(artifact)
+        if entry is None:
+            return "not built yet"
+        # A real run compares the rebuilt upstream files themselves; only a plan has to assume they change
+        for path in (list(inputs) + list(upstream)) if self.dry_run else ():
+            if self._key(path) in self._dirty:
+                return f"upstream {self._key(path)} is rebuilt"
+        recorded_inputs = entry.get("inputs", {})
+        if set(recorded_inputs) != {self._key(path) for path in inputs}:
+            return "input files changed"
+        for path in inputs:
+            if self.digest(path) != recorded_inputs[self._key(path)]:
+                return f"input {self._key(path)} changed"
+        if content is not None and entry.get("content") != text_digest(content):
+            return "input text changed"
+        if entry.get("config") != config_digest(config):
+            return "settings changed"
+        for path in outputs:
+            if self._key(path) not in entry.get("outputs", {}):
+                return f"output {self._key(path)} not recorded"
+        for key, sha in entry.get("outputs", {}).items():
+            actual = self.digest(self.root / key)
+            if actual is None:
+                return f"output {key} missing"
+            if actual != sha:
+                return f"output {key} modified"
+        return None
+
+    def record(self, artifact: str, stage: str, inputs=(), config=None, content: str = None, outputs=(), upstream=()):
+        """
+        Store the state an artifact was just built from (ignored in plan mode). `upstream` is accepted so the
+        same keyword arguments can be passed to check() and record().
+        """
+        if self.dry_run:
+            return
+        entry = {
+            "stage": stage,
+            "inputs": {self._key(path): self.digest(path) for path in inputs},
+            "content": text_digest(content) if content is not None else None,
+            "config": config_digest(config),
+            "outputs": {self._key(path): self.digest(path) for path in outputs},
+            "updated": time.time(),
+        }
+        with self._lock:
+            self.artifacts[artifact] = entry
+
+    def note(self, artifact: str, reason: str):
+        """
+        Plan entry for work that cannot be checked yet (e.g. its input is produced by an earlier stage)
+        """
+        with self._lock:
+            self.checked += 1
+            self.planned.append((artifact, reason))
+
+    def prune(self, stage: str, keep):
+        """
+        Forget artifacts of `stage` that are no longer produced (e.g. chunks past the new end of a transcript)
+        """
+        keep = set(keep)
+        with self._lock:
+            stale = [name for name, entry in self.artifacts.items() if entry["stage"] == stage and name not in keep]
+            self.checked += len(stale)
+            for name in stale:
+                self.planned.append((name, "no longer produced"))
+                if not self.dry_run:
+                    del self.artifacts[name]
+        return stale
+
+    def save(self):
+        if self.dry_run:
+            return
+        os.makedirs(self.root, exist_ok=True)
+        with self._lock:
+            data = {"version": 1, "artifacts": self.artifacts, "files": self._files}
+            temp_file = f"{self.path}.tmp"
+            with open(temp_file, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=1, sort_keys=True)
+            os.replace(temp_file, self.path)
+
+    def print_plan(self):
+        for artifact, reason in self.planned:
+            print(f"  🔁 {artifact}: {reason}")
+        print(f"📋 Plan: {len(self.planned)} to rebuild, {self.checked - len(self.planned)} of {self.checked} "
+              f"checked artifacts up to date ({self.path})")
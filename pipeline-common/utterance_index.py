@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Utterance Index
+- One JSON line per transcript line: id, speaker, chunk of origin, start/end inside that chunk, absolute start/end
+  in the source audio (through the preprocessing chunk plan) and the text
+- Written by the transcription step next to the transcript as <transcript>.utterances.jsonl, in transcript order
+- UtteranceIndex sorts the rows by start and keeps a running maximum of their end times, so the rows overlapping a
+  time range are found by bisection (an interval index) instead of a scan
+- The stages take a selection (--range 12:30-13:00 and/or --utterances 17 18) and reprocess only those rows
+"""
+
+import json
+import os
+from bisect import bisect_left
+from pathlib import Path
+
+INDEX_SUFFIX = ".utterances.jsonl"
+CHUNK_LINES_FILENAME = "chunk_lines.json"   # Written next to the translation chunks: transcript lines per chunk
+
+def index_path_for(transcript) -> Path:
+    return Path(transcript).with_suffix(INDEX_SUFFIX)
+
+def parse_timestamp(text: str) -> int:
+    """
+    Milliseconds from "SS", "MM:SS" or "HH:MM:SS" (seconds may have a fraction)
+    """
+    seconds = 0.0
+    for part in text.strip().split(":"):
+        seconds = seconds * 60 + float(part)
+    return int(round(seconds * 1000))
+
+def parse_time_range(text: str):
+    start, separator, end = text.partition("-")
+    if not separator:
+        raise ValueError(f"Time range must look like START-END (e.g. 12:30-13:00), got '{text}'")
+    start_ms, end_ms = parse_timestamp(start), parse_timestamp(end)
+    if end_ms <= start_ms:
+        raise ValueError(f"Time range ends before it starts: '{text}'")
+    return start_ms, end_ms
+
+def format_timestamp(ms) -> str:
+    minutes, seconds = divmod(ms / 1000, 60)
+    hours, minutes = divmod(int(minutes), 60)
+    return f"{hours}:{minutes:02}:{seconds:06.3f}" if hours else f"{minutes:02}:{seconds:06.3f}"
+
+def format_row(row: dict) -> str:
+    return json.dumps(row, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+class Selection:
+    """
+    Which utterances to reprocess: a source-audio time range, utterance ids, or both (their union)
+    """
+    def __init__(self, time_range=None, ids=None):
+        self.time_range = time_range
+        self.ids = set(ids or ())
+
+    def __bool__(self):
+        return self.time_range is not None or bool(self.ids)
+
+    def __str__(self):
+        parts = []
+        if self.time_range is not None:
+            parts.append(f"{format_timestamp(self.time_range[0])}-{format_timestamp(self.time_range[1])}")
+        if self.ids:
+            parts.append(f"utterances {', '.join(str(i) for i in sorted(self.ids))}")
+        return " + ".join(parts)
+
+def add_selection_arguments(parser):
+    parser.add_argument("--range", type=parse_time_range, metavar="START-END",
+                        help="Only reprocess utterances overlapping this source-audio time range (e.g. 12:30-13:00)")
+    parser.add_argument("--utterances", type=int, nargs="+", metavar="ID",
+                        help="Only reprocess these utterance ids (from the .utterances.jsonl index)")
+
+def selection_from_args(args) -> Selection:
+    return Selection(args.range, args.utterances)
+
+class UtteranceIndex:
+    """
+    The rows of one transcript in transcript order, plus an interval index over their source-audio times
+    """
+    def __init__(self, rows):
+        self.rows = list(rows)
+        self._position = {row["id"]: position for position, row in enumerate(self.rows)}
+        timed = sorted((row["start_ms"], row["end_ms"], position) for position, row in enumerate(self.rows)
+                       if row.get("start_ms") is not None and row.get("end_ms") is not None)
+        self._starts = [start for start, _, _ in timed]
+        self._timed = timed
+        self._max_end = []                       # Largest end among the rows sorted up to here
+        for _, end, _ in timed:
+            self._max_end.append(max(end, self._max_end[-1]) if self._max_end else end)
+
+    @classmethod
+    def load(cls, path):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"❌ No utterance index at {path}; transcribe first")
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.loads(line) for line in f if line.strip())
+
+    def save(self, path):
+        temp_file = f"{path}.tmp"
+        with open(temp_file, "w", encoding="utf-8") as f:
+            f.writelines(format_row(row) for row in self.rows)
+        os.replace(temp_file, path)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def next_id(self) -> int:
+        return max(self._position, default=0) + 1
+
+    def overlapping(self, start_ms: int, end_ms: int):
+        """
+        Positions (transcript lines, 0-based) of the rows with start < end_ms and end > start_ms
+        """
+        positions = []
+        k = bisect_left(self._starts, end_ms) - 1
+        # Once the running maximum end is at or before start_ms, no earlier row can reach into the range
+        while k >= 0 and self._max_end[k] > start_ms:
+            _, end, position = self._timed[k]
+            if end > start_ms:
+                positions.append(position)
+            k -= 1
+        return sorted(positions)
+
+    def select(self, selection: Selection):
+        """
+        Transcript positions (0-based) of the selected rows, in transcript order
+        """
+        positions = set()
+        if selection.time_range is not None:
+            positions.update(self.overlapping(*selection.time_range))
+        unknown = sorted(i for i in selection.ids if i not in self._position)
+        if unknown:
+            raise ValueError(f"❌ Unknown utterance id(s): {unknown}")
+        positions.update(self._position[i] for i in selection.ids)
+        return sorted(positions)
+
+    def check_transcript(self, transcript_lines: int, transcript):
+        if transcript_lines != len(self.rows):
+            raise ValueError(f"❌ {transcript} has {transcript_lines} lines but its utterance index has "
+                             f"{len(self.rows)} rows; re-run transcription")
+
+def save_chunk_lines(chunk_dir, transcript, spans):
+    """
+    Record which transcript lines (first, last; 0-based) each translation chunk was built from
+    """
+    path = os.path.join(chunk_dir, CHUNK_LINES_FILENAME)
+    temp_file = f"{path}.tmp"
+    with open(temp_file, "w", encoding="utf-8") as f:
+        json.dump({"transcript": str(transcript), "chunks": spans}, f)
+    os.replace(temp_file, path)
+
+def load_chunk_lines(chunk_dir):
+    path = os.path.join(chunk_dir, CHUNK_LINES_FILENAME)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"❌ No {CHUNK_LINES_FILENAME} in {chunk_dir}; run the translation step first")
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return data["transcript"], [tuple(span) for span in data["chunks"]]
+
+def chunks_for_lines(spans, positions):
+    """
+    1-based translation chunk numbers whose transcript lines include any of `positions`
+    """
+    wanted = sorted(positions)
+    chunks = set()
+    for idx, (first, last) in enumerate(spans, start=1):
+        k = bisect_left(wanted, first)
+        if k < len(wanted) and wanted[k] <= last:
+            chunks.add(idx)
+    return chunks
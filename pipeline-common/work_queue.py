@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+Work Queue
+- Durable per-unit tasks (preprocess an episode, transcribe chunk K, translate chunk K, synthesize line K, ...)
+  shared by any number of worker threads, processes and hosts. Tasks are grouped by job (one episode) and stage,
+  and a task may wait until every task of another stage of its job is done (`after`)
+- A worker claims a task under a lease and renews it with heartbeats while it works; when a worker dies or hangs,
+  its lease runs out and the next worker takes the task over
+- A failed task goes back to pending after a jittered backoff, and after max_attempts it is dead-lettered: it stays
+  in the dead state with its last error until requeued
+- Completion is idempotent: only the current lease holder can complete a task, a done task stays done, and its
+  result is stored with it for the stage that comes next
+- Stored in SQLite (WORK_QUEUE_URL=sqlite:///path/to/queue.sqlite). On storage shared between hosts (NFS), use
+  sqlite:///...?journal_mode=delete, since WAL needs shared memory.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from urllib.parse import parse_qs
+
+from retry import jittered_backoff
+
+WORK_QUEUE_PATH = Path(__file__).resolve().parent.parent / "joe-charlie-aa-js/test-output/queue/work_queue.sqlite"
+DEFAULT_LEASE_SECONDS = 120
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_RETRY_DELAY = 5
+STATES = ("pending", "leased", "done", "dead")
+
+class Task:
+    """
+    One claimed unit of work; `owner` is the lease holder that may heartbeat, complete or fail it
+    """
+    def __init__(self, job: str, stage: str, key: str, payload, attempts: int, max_attempts: int, owner: str):
+        self.job = job
+        self.stage = stage
+        self.key = key
+        self.payload = payload
+        self.attempts = attempts
+        self.max_attempts = max_attempts
+        self.owner = owner
+
+    def __str__(self):
+        return f"{self.job}/{self.stage}/{self.key}"
+
+class LeaseKeeper:
+    """
+    Renews a task's lease every third of the lease time until the block ends; `lost` is set if the lease was
+    taken over in the meantime (the work is then finished elsewhere, and complete() will say so)
+    """
+    def __init__(self, queue, task: Task, lease_seconds: float):
+        self.queue = queue
+        self.task = task
+        self.lease_seconds = lease_seconds
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.lease_seconds / 3):
+            if not self.queue.heartbeat(self.task, self.lease_seconds):
+                self.lost = True
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+class SQLiteWorkQueue:
+    """
+    All tasks in one SQLite table. Claims run in an IMMEDIATE transaction, so two processes never lease the same
+    task; every process opens its own connection.
+    """
+    def __init__(self, path, journal_mode: str = "wal", clock=time.time):
+        self.path = Path(path)
+        self._clock = clock
+        self._lock = threading.Lock()
+        os.makedirs(self.path.parent, exist_ok=True)
+        # Autocommit mode: transactions are opened explicitly with BEGIN IMMEDIATE
+        self._db = sqlite3.connect(str(self.path), timeout=30, isolation_level=None, check_same_thread=False)
+        self._db.execute(f"PRAGMA journal_mode={journal_mode}")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS tasks (
+                job TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                key TEXT NOT NULL,
+                payload TEXT,
+                after TEXT,
+                state TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL,
+                owner TEXT,
+                lease_expires REAL,
+                available_at REAL NOT NULL,
+                last_error TEXT,
+                result TEXT,
+                created REAL NOT NULL,
+                updated REAL NOT NULL,
+                PRIMARY KEY (job, stage, key)
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS tasks_state ON tasks(state, available_at)")
+
+    def _transaction(self, work):
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                value = work(self._db)
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+        return value
+
+    def enqueue_many(self, job: str, tasks, max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> int:
+        """
+        Add (stage, key, payload, after) tasks in one transaction; tasks that already exist are left as they are.
+        Returns how many were new.
+        """
+        now = self._clock()
+        rows = [(job, stage, key, json.dumps(payload, ensure_ascii=False), after, max_attempts, now, now, now)
+                for stage, key, payload, after in tasks]
+
+        def insert(db):
+            before = db.total_changes
+            db.executemany("""
+                INSERT OR IGNORE INTO tasks (job, stage, key, payload, after, max_attempts, available_at, created, updated)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+            return db.total_changes - before
+        return self._transaction(insert)
+
+    def enqueue(self, job: str, stage: str, key: str, payload=None, after: str = None,
+                max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> bool:
+        return self.enqueue_many(job, [(stage, key, payload, after)], max_attempts) == 1
+
+    def _expire_leases(self, db, now):
+        # A lease that ran out counts as a failed attempt: the worker died or hung
+        db.execute("""
+            UPDATE tasks SET state = CASE WHEN attempts >= max_attempts THEN 'dead' ELSE 'pending' END,
+                             owner = NULL, lease_expires = NULL, last_error = 'lease expired', updated = ?
+            WHERE state = 'leased' AND lease_expires < ?
+        """, (now, now))
+
+    def claim(self, owner: str, lease_seconds: float = DEFAULT_LEASE_SECONDS, stages=None):
+        """
+        Lease the oldest runnable task (of `stages`, if given) to owner; None if nothing is runnable right now
+        """
+        now = self._clock()
+        stage_filter = f"AND t.stage IN ({', '.join('?' * len(stages))})" if stages else ""
+
+        def lease(db):
+            self._expire_leases(db, now)
+            row = db.execute(f"""
+                SELECT job, stage, key, payload, attempts, max_attempts FROM tasks t
+                WHERE t.state = 'pending' AND t.available_at <= ? {stage_filter}
+                  AND (t.after IS NULL OR NOT EXISTS (
+                      SELECT 1 FROM tasks d WHERE d.job = t.job AND d.stage = t.after AND d.state != 'done'))
+                ORDER BY t.created, t.rowid LIMIT 1
+            """, (now, *(stages or ()))).fetchone()
+            if row is None:
+                return None
+            job, stage, key, payload, attempts, max_attempts = row
+            db.execute("""
+                UPDATE tasks SET state = 'leased', owner = ?, lease_expires = ?, attempts = attempts + 1, updated = ?
+                WHERE job = ? AND stage = ? AND key = ?
+            """, (owner, now + lease_seconds, now, job, stage, key))
+            return Task(job, stage, key, json.loads(payload), attempts + 1, max_attempts, owner)
+        return self._transaction(lease)
+
+    def _update_held(self, task: Task, assignments: str, values) -> bool:
+        def update(db):
+            cursor = db.execute(f"""
+                UPDATE tasks SET {assignments}, updated = ?
+                WHERE job = ? AND stage = ? AND key = ? AND state = 'leased' AND owner = ?
+            """, (*values, self._clock(), task.job, task.stage, task.key, task.owner))
+            return cursor.rowcount == 1
+        return self._transaction(update)
+
+    def heartbeat(self, task: Task, lease_seconds: float = DEFAULT_LEASE_SECONDS) -> bool:
+        return self._update_held(task, "lease_expires = ?", (self._clock() + lease_seconds,))
+
+    def complete(self, task: Task, result=None) -> bool:
+        """
+        Mark the task done with its result; False if this owner no longer holds it (taken over or already done)
+        """
+        return self._update_held(task, "state = 'done', owner = NULL, lease_expires = NULL, result = ?, last_error = NULL",
+                                 (json.dumps(result, ensure_ascii=False),))
+
+    def fail(self, task: Task, error: str, retry_delay: float = DEFAULT_RETRY_DELAY) -> str:
+        """
+        Give the task back for a retry after a backoff, or dead-letter it after its last attempt.
+        Returns the new state ("pending" or "dead"), or None if this owner no longer holds it.
+        """
+        if task.attempts >= task.max_attempts:
+            state, available_at = "dead", self._clock()
+        else:
+            state, available_at = "pending", self._clock() + jittered_backoff(task.attempts, retry_delay)
+        held = self._update_held(task, "state = ?, owner = NULL, lease_expires = NULL, available_at = ?, last_error = ?",
+                                 (state, available_at, error))
+        return state if held else None
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def results(self, job: str, stage: str) -> dict:
+        """
+        key -> (payload, result) of the stage's done tasks
+        """
+        rows = self._query("SELECT key, payload, result FROM tasks WHERE job = ? AND stage = ? AND state = 'done'",
+                           (job, stage))
+        return {key: (json.loads(payload), json.loads(result)) for key, payload, result in rows}
+
+    def open_tasks(self, job: str = None) -> int:
+        """
+        Pending and leased tasks that can still run (not waiting on a stage with dead tasks)
+        """
+        return self._query(f"""
+            SELECT COUNT(*) FROM tasks t WHERE t.state IN ('pending', 'leased') {'AND t.job = ?' if job else ''}
+              AND NOT EXISTS (SELECT 1 FROM tasks d WHERE d.job = t.job AND d.stage = t.after AND d.state = 'dead')
+        """, (job,) if job else ())[0][0]
+
+    def counts(self, job: str = None) -> dict:
+        """
+        (job, stage, state) -> number of tasks
+        """
+        rows = self._query(f"SELECT job, stage, state, COUNT(*) FROM tasks {'WHERE job = ?' if job else ''} "
+                           f"GROUP BY job, stage, state", (job,) if job else ())
+        return {(job, stage, state): n for job, stage, state, n in rows}
+
+    def dead_letters(self, job: str = None):
+        """
+        (job, stage, key, attempts, last error) of every dead task
+        """
+        return self._query(f"SELECT job, stage, key, attempts, last_error FROM tasks WHERE state = 'dead' "
+                           f"{'AND job = ?' if job else ''} ORDER BY job, created, rowid", (job,) if job else ())
+
+    def requeue_dead(self, job: str = None) -> int:
+        def requeue(db):
+            return db.execute(f"""
+                UPDATE tasks SET state = 'pending', attempts = 0, available_at = ?, last_error = NULL, updated = ?
+                WHERE state = 'dead' {'AND job = ?' if job else ''}
+            """, (self._clock(), self._clock(), *((job,) if job else ()))).rowcount
+        return self._transaction(requeue)
+
+    def forget(self, job: str) -> int:
+        """
+        Drop every task of a job, so enqueueing it again starts over
+        """
+        return self._transaction(lambda db: db.execute("DELETE FROM tasks WHERE job = ?", (job,)).rowcount)
+
+    def keep_alive(self, task: Task, lease_seconds: float = DEFAULT_LEASE_SECONDS) -> LeaseKeeper:
+        return LeaseKeeper(self, task, lease_seconds)
+
+    def summary(self) -> str:
+        totals = {}
+        for (_, _, state), n in self.counts().items():
+            totals[state] = totals.get(state, 0) + n
+        return "🗃 Work queue: " + ", ".join(f"{totals.get(state, 0)} {state}" for state in STATES) + f" in {self.path}"
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+def open_work_queue(url: str = None) -> SQLiteWorkQueue:
+    """
+    The queue at `url` (default: WORK_QUEUE_URL, else the SQLite file under test-output/queue)
+    """
+    url = url or os.getenv("WORK_QUEUE_URL") or f"sqlite:///{WORK_QUEUE_PATH}"
+    scheme, _, rest = url.partition("://")
+    if scheme == "sqlite":
+        # sqlite:///relative/path or sqlite:////absolute/path, as in SQLAlchemy URLs
+        path, _, query = rest[1:].partition("?")
+        options = {name: values[-1] for name, values in parse_qs(query).items()}
+        return SQLiteWorkQueue(path, journal_mode=options.get("journal_mode", "wal"))
+    raise ValueError(f"❌ Unsupported work queue backend '{scheme}' in {url} (supported: sqlite)")
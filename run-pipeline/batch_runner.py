@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Batch Runner
+- Runs the step-by-step stages (preprocess -> transcribe -> translate -> merge -> clean -> TTS -> MP3 merge) for
+  every episode in a directory of input audio
+- Each episode gets its own output directory and pipeline manifest, so re-running the batch only redoes what
+  changed, episode by episode
+- CPU-bound work (preprocessing, the final MP3 merge) runs on a process pool; the API stages of several episodes
+  run at once on threads
+- One AssemblyAI / OpenAI / Google TTS client and one rate budget per provider are shared by every episode, as are
+  the transcription cache, translation memory and TTS cache
+
+Usage:
+  python run-pipeline/batch_runner.py INPUT_DIR [--output-dir DIR] [--episodes N] [--cpu-workers N]
+  python run-pipeline/batch_runner.py INPUT_DIR --fake        # local fake AssemblyAI / OpenAI / TTS backends
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from dotenv import load_dotenv
+from pathlib import Path
+
+# === CONFIGURATION ===
+SCRIPT_DIR = Path(__file__).resolve().parent
+REPO_DIR = SCRIPT_DIR.parent
+DEFAULT_OUTPUT_DIR = REPO_DIR / "joe-charlie-aa-js/test-output/batch"
+AUDIO_EXTENSIONS = (".mp3", ".wav", ".m4a", ".flac")
+STEPS = ("preprocess", "transcribe", "translate", "tts", "merge")
+
+for stage_dir in ("pipeline-common", "extract-audio", "translate-text", "generate-audio"):
+    sys.path.insert(0, str(REPO_DIR / stage_dir))
+load_dotenv(dotenv_path=REPO_DIR / ".env")
+
+import assemblescript
+import clean_japanese_dialogue
+import merge_chunks
+import multi_speaker_tts
+import preprocess_audio
+import translate_chunks
+from metrics import finish_run, span, start_run
+from orchestrator import PipelineBackends, open_caches, workers_from_env
+from stage_manifest import StageManifest
+
+class EpisodePaths:
+    """
+    Every file one episode's stages read and write, laid out like joe-charlie-aa-js/test-output
+    """
+    def __init__(self, input_audio, output_root):
+        self.input_audio = Path(input_audio)
+        self.name = self.input_audio.stem
+        self.output_dir = Path(output_root) / self.name
+        self.cleaned_wav = self.output_dir / "preprocess-audio" / f"{self.name}.wav"
+        self.audio_chunk_dir = self.output_dir / "preprocess-audio" / "chunks"
+        self.en_transcript = self.output_dir / "EN-audio-text-output" / f"{self.name}.txt"
+        self.translation_chunk_dir = self.output_dir / "JP-text-translation" / "chunks"
+        self.ja_transcript = self.output_dir / "JP-text-translation" / f"JP-{self.name}.txt"
+        self.clean_ja_transcript = self.output_dir / "JP-text-translation" / f"clean-JP-{self.name}.txt"
+        self.tts_dir = self.output_dir / "JP-audio-output" / "chunks"
+        self.merged_audio = self.output_dir / "JP-audio-output" / f"JP-{self.name}.mp3"
+        self.failed_log = self.output_dir / "JP-audio-output" / "failed_audio_chunks.log"
+        self.manifest = self.output_dir / "pipeline_manifest.json"
+
+def find_episodes(input_dir):
+    return sorted(p for p in Path(input_dir).iterdir() if p.suffix.lower() in AUDIO_EXTENSIONS)
+
+# === CPU STEPS (run in the process pool; each opens, updates and saves the episode's manifest) ===
+def preprocess_episode(paths: EpisodePaths, streaming: bool):
+    manifest = StageManifest(paths.manifest)
+    try:
+        preprocess_audio.run_stage(manifest, streaming, paths.input_audio, paths.cleaned_wav, paths.audio_chunk_dir)
+    finally:
+        manifest.save()
+
+def merge_episode_audio(paths: EpisodePaths):
+    manifest = StageManifest(paths.manifest)
+    try:
+        multi_speaker_tts.merge_audio_chunks(str(paths.tts_dir), str(paths.merged_audio), manifest=manifest)
+    finally:
+        manifest.save()
+
+class SharedServices:
+    """
+    What every episode of a batch shares: the API clients, one token bucket and hedging policy per provider and
+    the caches
+    """
+    def __init__(self, backends: PipelineBackends, workers: dict, caches):
+        self.backends = backends
+        self.transcription_limiter, self.translation_limiter, self.tts_limiter = backends.rate_limiters(workers)
+        self.translation_hedging, self.tts_hedging = backends.hedging_policies()
+        self.transcription_cache, self.translation_memory, self.tts_cache = caches
+
+    def close(self):
+        for store in (self.transcription_cache, self.translation_memory, self.tts_cache):
+            if store is not None:
+                print(store.summary())
+                store.close()
+
+def create_backends(fake: bool, fake_latency, fake_cache_dir) -> PipelineBackends:
+    if not fake:
+        return PipelineBackends.from_env()
+    os.environ.setdefault("OPENAI_MODEL_NAME", "fake")
+    # Fake transcripts, translations and audio must never reach the real caches
+    os.environ.update({"TRANSCRIPTION_CACHE_PATH": str(Path(fake_cache_dir) / "transcription_cache.sqlite"),
+                       "TRANSLATION_MEMORY_PATH": str(Path(fake_cache_dir) / "translation_memory.sqlite"),
+                       "TTS_CACHE_DIR": str(Path(fake_cache_dir) / "tts")})
+    return PipelineBackends.fake(*fake_latency)
+
+def cache_settings() -> translate_chunks.TranslationSettings:
+    # Model and temperature key the translation memory
+    return translate_chunks.TranslationSettings(os.getenv("OPENAI_MODEL_NAME"),
+                                                float(os.getenv("OPENAI_TEMPERATURE", "0.3")), None, None)
+
+def run_episode(paths: EpisodePaths, services: SharedServices, cpu_pool, streaming: bool) -> dict:
+    """
+    All stages of one episode; returns the seconds spent in each step
+    """
+    timings = {}
+
+    def timed(step, run, *args, **kwargs):
+        start = time.perf_counter()
+        with span("batch", step, episode=paths.name):
+            run(*args, **kwargs)
+        timings[step] = time.perf_counter() - start
+
+    print(f"🎬 [{paths.name}] Starting")
+    timed("preprocess", lambda: cpu_pool.submit(preprocess_episode, paths, streaming).result())
+
+    backends = services.backends
+    manifest = StageManifest(paths.manifest)
+    try:
+        timed("transcribe", assemblescript.run_stage, manifest, backends.transcriber, paths.audio_chunk_dir,
+              paths.en_transcript, services.transcription_limiter, services.transcription_cache)
+        timed("translate", translate_chunks.run_stage, manifest, client=backends.openai_client,
+              input_file=paths.en_transcript, chunk_dir=paths.translation_chunk_dir,
+              rate_limiter=services.translation_limiter, memory=services.translation_memory,
+              hedging=services.translation_hedging)
+        merge_chunks.run_stage(manifest, paths.translation_chunk_dir, paths.ja_transcript)
+        clean_japanese_dialogue.run_stage(manifest, paths.ja_transcript, paths.clean_ja_transcript)
+        timed("tts", multi_speaker_tts.run_stage, manifest, backends.tts_client, paths.clean_ja_transcript,
+              paths.tts_dir, paths.merged_audio, services.tts_limiter, services.tts_cache, merge=False,
+              failed_log=paths.failed_log, hedging=services.tts_hedging)
+    finally:
+        manifest.save()   # The merge process reads the manifest next
+
+    timed("merge", lambda: cpu_pool.submit(merge_episode_audio, paths).result())
+    print(f"🎉 [{paths.name}] Done: {paths.merged_audio}")
+    return timings
+
+def print_report(results: dict, wall: float):
+    print("\n📊 Batch report:")
+    print(f"  {'episode':<36} " + " ".join(f"{step:>10}" for step in STEPS) + f" {'total':>9}")
+    for name, outcome in sorted(results.items()):
+        if isinstance(outcome, Exception):
+            print(f"  {name:<36} 💥 {outcome.__class__.__name__}: {outcome}")
+            continue
+        print(f"  {name:<36} " + " ".join(f"{outcome.get(step, 0):>9.1f}s" for step in STEPS)
+              + f" {sum(outcome.values()):>8.1f}s")
+    failed = sum(isinstance(outcome, Exception) for outcome in results.values())
+    print(f"⏱ {len(results)} episode(s) in {wall:.1f}s wall time, {failed} failed")
+
+def main():
+    parser = argparse.ArgumentParser(description="Run every stage for each audio file in a directory")
+    parser.add_argument("input_dir", type=Path)
+    parser.add_argument("--output-dir", type=Path, default=DEFAULT_OUTPUT_DIR,
+                        help="One sub-directory per episode is created here")
+    parser.add_argument("--episodes", type=int, default=int(os.getenv("BATCH_EPISODE_WORKERS", "2")),
+                        help="Episodes whose API stages run at the same time")
+    parser.add_argument("--cpu-workers", type=int, default=int(os.getenv("BATCH_CPU_WORKERS", str(os.cpu_count() or 1))),
+                        help="Processes for preprocessing and the final MP3 merge")
+    parser.add_argument("--fake", action="store_true", help="Use local fake AssemblyAI / OpenAI / TTS backends")
+    parser.add_argument("--fake-latency", type=float, nargs=3, default=[2.0, 0.3, 0.2],
+                        metavar=("TRANSCRIBE", "TRANSLATE", "TTS"), help="Seconds per fake call")
+    args = parser.parse_args()
+
+    episodes = [EpisodePaths(audio, args.output_dir) for audio in find_episodes(args.input_dir)]
+    if not episodes:
+        raise FileNotFoundError(f"❌ No audio files ({', '.join(AUDIO_EXTENSIONS)}) in {args.input_dir}")
+    streaming = os.getenv("PREPROCESS_STREAMING", "false").lower() == "true"
+
+    backends = create_backends(args.fake, args.fake_latency, args.output_dir / "fake-cache")
+    # Opened once here, so the stages never open their own copies per episode
+    services = SharedServices(backends, workers_from_env(), open_caches(backends, cache_settings()))
+
+    print(f"🚀 Batch: {len(episodes)} episode(s) from {args.input_dir} -> {args.output_dir} "
+          f"({args.episodes} at a time, {args.cpu_workers} CPU processes)")
+    start_run("batch")
+    results = {}
+    start = time.perf_counter()
+    # Spawned workers do not inherit the episode threads' locks, unlike forked ones
+    with ProcessPoolExecutor(max_workers=max(1, args.cpu_workers),
+                             mp_context=multiprocessing.get_context("spawn")) as cpu_pool:
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, args.episodes)) as episode_pool:
+                futures = {episode_pool.submit(run_episode, paths, services, cpu_pool, streaming): paths
+                           for paths in episodes}
+                for future in as_completed(futures):
+                    paths = futures[future]
+                    try:
+                        results[paths.name] = future.result()
+                    except Exception as e:
+                        # One broken episode must not stop the rest of the batch
+                        print(f"💥 [{paths.name}] Failed: {e.__class__.__name__}: {e}")
+                        results[paths.name] = e
+        finally:
+            services.close()
+            finish_run()
+    print_report(results, time.perf_counter() - start)
+    if any(isinstance(outcome, Exception) for outcome in results.values()):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Hedging Benchmark
+- Sends the same translation and TTS calls through translate_text / synthesize_to_file twice, without and with a
+  HedgingPolicy (pipeline-common/hedging.py), against fakes where a --straggler-rate share of calls stalls
+- Inputs: speaker turns of the sample transcripts in 01-extracted-native-text (translate) and
+  02-japanese-translation-text (TTS)
+- Reports p50/p95/p99/max call latency, the extra requests sent, and the hedges issued, won and skipped; the TTS
+  runs share a token bucket of --requests-per-minute, so hedges have to fit in the same budget; the translate runs
+  share an AIMD limit of twice --workers, since a hedge needs a free slot of its own
+
+Usage: python run-pipeline/benchmark_hedging.py [--calls 300] [--workers 4] [--straggler-rate 0.03] [--max-extra 0.05]
+"""
+
+import argparse
+import glob
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# === CONFIGURATION ===
+SCRIPT_DIR = Path(__file__).resolve().parent
+REPO_DIR = SCRIPT_DIR.parent
+EN_TEXT_DIR = REPO_DIR / "joe-charlie-aa-js/01-extracted-native-text"
+JA_TEXT_DIR = REPO_DIR / "joe-charlie-aa-js/02-japanese-translation-text"
+
+for stage_dir in ("pipeline-common", "translate-text", "generate-audio"):
+    sys.path.insert(0, str(REPO_DIR / stage_dir))
+from dialogue_format import format_turn, parse_dialogue
+from fake_backends import FakeOpenAI, FakeTTSClient
+from hedging import HedgingPolicy
+from metrics import percentile
+from rate_limit import AdaptiveConcurrency, TokenBucket
+
+def sample_turns(directory, pattern: str, calls: int):
+    turns = []
+    for path in sorted(glob.glob(str(directory / pattern))):
+        with open(path, "r", encoding="utf-8") as f:
+            turns.extend(turn for turn in parse_dialogue(f) if turn[0])
+    return [turns[n % len(turns)] for n in range(calls)]
+
+def timed_calls(call, items, workers: int):
+    def run(item):
+        start = time.perf_counter()
+        ok = call(item)
+        return time.perf_counter() - start, ok
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(run, items))
+
+def report(label: str, results, client, hedging: HedgingPolicy):
+    latencies = sorted(seconds for seconds, _ in results)
+    failures = sum(1 for _, ok in results if not ok)
+    p50, p95, p99 = (percentile(latencies, q) for q in (0.5, 0.95, 0.99))
+    extra = client.calls / len(results) - 1
+    hedges = (f"  {hedging.issued} hedged, {hedging.won} won, {hedging.skipped} skipped"
+              if hedging is not None else "")
+    print(f"  {label:<10} p50 {p50:6.3f}s  p95 {p95:6.3f}s  p99 {p99:6.3f}s  max {latencies[-1]:6.3f}s  "
+          f"requests +{100 * extra:4.1f}%  {failures} failed{hedges}")
+    return p99
+
+def policy(args, stage: str):
+    return HedgingPolicy(stage, args.initial_delay, args.quantile, args.max_extra)
+
+def run_translate(args, hedged: bool):
+    from translate_chunks import TranslationSettings, translate_text
+    client = FakeOpenAI(latency=args.latency, straggler_rate=args.straggler_rate,
+                        straggler_latency=args.straggler_latency, seed=args.seed)
+    settings = TranslationSettings("fake", 0.3, 1, 0, args.timeout)
+    hedging = policy(args, "translate") if hedged else None
+    concurrency = AdaptiveConcurrency(initial=2 * args.workers, maximum=2 * args.workers)
+    turns = sample_turns(EN_TEXT_DIR, "transcript_en_*.txt", args.calls)
+    results = timed_calls(lambda turn: translate_text(client, format_turn(*turn), "benchmark", settings,
+                                                      concurrency, hedging=hedging) is not None, turns, args.workers)
+    return report("hedged" if hedged else "plain", results, client, hedging)
+
+def run_tts(args, hedged: bool, output_dir):
+    from multi_speaker_tts import synthesize_to_file
+    client = FakeTTSClient(latency=args.latency, ms_per_char=1, straggler_rate=args.straggler_rate,
+                           straggler_latency=args.straggler_latency, seed=args.seed)
+    rate_limiter = TokenBucket.per_minute(args.requests_per_minute, burst=args.workers)
+    hedging = policy(args, "tts") if hedged else None
+    turns = sample_turns(JA_TEXT_DIR, "transcript_ja_*.txt", args.calls)
+
+    def synthesize(job):
+        n, (speaker, text) = job
+        return synthesize_to_file(client, speaker, text[:200], str(Path(output_dir) / f"{n:05}.mp3"), max_retries=1,
+                                  rate_limiter=rate_limiter, timeout=args.timeout, hedging=hedging)
+    results = timed_calls(synthesize, list(enumerate(turns)), args.workers)
+    return report("hedged" if hedged else "plain", results, client, hedging)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark hedged translation and TTS calls against stalling fakes")
+    parser.add_argument("--calls", type=int, default=300)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.05, help="Fake seconds per normal call")
+    parser.add_argument("--straggler-rate", type=float, default=0.03, help="Share of calls that stall")
+    parser.add_argument("--straggler-latency", type=float, default=1.0, help="Fake seconds of a stalled call")
+    parser.add_argument("--timeout", type=float, default=1.5, help="Request timeout passed to the clients")
+    parser.add_argument("--initial-delay", type=float, default=0.2, help="Hedge delay until enough calls are seen")
+    parser.add_argument("--quantile", type=float, default=0.95)
+    parser.add_argument("--max-extra", type=float, default=0.05, help="Hedges per call at most")
+    parser.add_argument("--requests-per-minute", type=float, default=12000, help="TTS token bucket")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"🧪 {args.calls} calls, {args.workers} workers, {100 * args.straggler_rate:.0f}% stall for "
+          f"{args.straggler_latency}s (normal {args.latency}s)")
+    print("\n📝 translate")
+    for hedged in (False, True):
+        run_translate(args, hedged)
+    print("\n🔊 tts")
+    with tempfile.TemporaryDirectory() as output_dir:
+        for hedged in (False, True):
+            run_tts(args, hedged, output_dir)
+
+if __name__ == "__main__":
+    main()
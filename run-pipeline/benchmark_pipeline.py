@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+"""
+Pipeline Benchmark
+- Runs each stage, and the whole chain through the orchestrator, against the local fake AssemblyAI / OpenAI /
+  Google TTS backends in pipeline-common/fake_backends.py, so no API quota is spent
+- Inputs: joe-charlie-aa-js/test-data/*.mp3 (preprocess, transcribe, chain) and the sample transcripts in
+  01-extracted-native-text (translate) and 02-japanese-translation-text (TTS, merge)
+- Fake latency, error rate and 429 behavior are set per service on the command line
+- Every stage runs in a fresh process, so peak RSS is that stage's own (ffmpeg children are reported separately)
+- Reports wall time, throughput (audio minutes per minute, items/s) and request counts. Results are saved as JSON;
+  --compare reports the difference from an earlier results file and exits non-zero on a regression.
+
+Usage:
+  python run-pipeline/benchmark_pipeline.py [--stages preprocess transcribe translate tts merge chain]
+  python run-pipeline/benchmark_pipeline.py --audio joe-charlie-aa-js/test-data/joe-charlie-first-5-minutes.mp3
+  python run-pipeline/benchmark_pipeline.py --compare joe-charlie-aa-js/test-output/benchmarks/OLD.json
+"""
+
+import argparse
+import contextlib
+import datetime
+import glob
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+# === CONFIGURATION ===
+SCRIPT_DIR = Path(__file__).resolve().parent
+REPO_DIR = SCRIPT_DIR.parent
+TEST_DATA_DIR = REPO_DIR / "joe-charlie-aa-js/test-data"
+EN_TEXT_DIR = REPO_DIR / "joe-charlie-aa-js/01-extracted-native-text"
+JA_TEXT_DIR = REPO_DIR / "joe-charlie-aa-js/02-japanese-translation-text"
+RESULTS_DIR = REPO_DIR / "joe-charlie-aa-js/test-output/benchmarks"
+STAGES = ("preprocess", "transcribe", "translate", "tts", "merge", "chain")
+SERVICES = ("transcribe", "translate", "tts")
+
+for stage_dir in ("pipeline-common", "extract-audio", "translate-text", "generate-audio", "run-pipeline"):
+    sys.path.insert(0, str(REPO_DIR / stage_dir))
+
+# === MEASUREMENT HELPERS ===
+def peak_rss_mb(who) -> float:
+    # ru_maxrss is kilobytes on Linux and bytes on macOS
+    usage = resource.getrusage(who).ru_maxrss
+    return usage / 1024 / 1024 if sys.platform == "darwin" else usage / 1024
+
+def mp3_minutes(path) -> float:
+    from mp3_frames import iter_frames
+    with open(path, "rb") as f:
+        data = f.read()
+    return sum(header.samples / header.sample_rate for _, header in iter_frames(data)) / 60
+
+def chunk_minutes(path) -> float:
+    from preprocess_audio import audio_duration_ms
+    return audio_duration_ms(path) / 1000 / 60
+
+def stage_result(wall: float, items: int, unit: str, audio_minutes: float = None, clients=(), failures: int = 0):
+    result = {
+        "wall_seconds": round(wall, 3),
+        "items": items,
+        "unit": unit,
+        "items_per_second": round(items / wall, 3) if wall else None,
+        "failures": failures,
+        "requests": {name: request_counts(client) for name, client in clients},
+    }
+    if audio_minutes is not None:
+        result["audio_minutes"] = round(audio_minutes, 2)
+        result["audio_minutes_per_minute"] = round(audio_minutes / (wall / 60), 2) if wall else None
+    return result
+
+def span_latencies() -> dict:
+    """
+    p50/p95/p99 seconds of every span the stage code recorded in this process (see pipeline-common/metrics.py)
+    """
+    from metrics import QUANTILES, get_metrics, percentile
+    latencies = {}
+    for (stage, name), values in sorted(get_metrics().durations.items()):
+        values = sorted(values)
+        latencies[f"{stage}.{name}"] = {"count": len(values),
+                                        **{f"p{round(q * 100)}": round(percentile(values, q), 4) for q in QUANTILES}}
+    return latencies
+
+def request_counts(client) -> dict:
+    return {
+        "calls": client.calls,
+        "throttled": getattr(client, "quota_errors", 0) + getattr(client, "rate_limited", 0),
+        "timeouts": getattr(client, "timeouts", 0),
+        "max_in_flight": client.max_in_flight,
+    }
+
+# === FAKE BACKENDS FROM THE BENCHMARK CONFIG ===
+def fake_transcriber(config):
+    from fake_backends import FakeTranscriber
+    return FakeTranscriber(latency=config["latency"]["transcribe"], failure_rate=config["failure_rate"]["transcribe"],
+                           utterances_per_chunk=6, quota_per_second=config["quota_per_second"]["transcribe"],
+                           retry_after=config["retry_after"])
+
+def fake_openai(config):
+    from fake_backends import FakeOpenAI
+    return FakeOpenAI(latency=config["latency"]["translate"], failure_rate=config["failure_rate"]["translate"],
+                      rate_limit_concurrency=config["openai_concurrency_limit"], retry_after=config["retry_after"])
+
+def fake_tts(config):
+    from fake_backends import FakeTTSClient
+    return FakeTTSClient(latency=config["latency"]["tts"], failure_rate=config["failure_rate"]["tts"],
+                         quota_per_second=config["quota_per_second"]["tts"], retry_after=config["retry_after"])
+
+def translation_settings(config):
+    from translate_chunks import TranslationSettings
+    return TranslationSettings("fake", 0.3, config["max_retries"], config["retry_delay"], None)
+
+# === STAGES (each runs in its own process) ===
+def preprocess_dir(config, audio) -> Path:
+    return Path(config["work_dir"]) / "preprocess" / Path(audio).stem
+
+def run_preprocess(config, audio):
+    from preprocess_audio import preprocess_audio_streaming
+    out_dir = preprocess_dir(config, audio)
+    return preprocess_audio_streaming(Path(audio), out_dir / "cleaned.wav", chunk_dir=out_dir / "chunks",
+                                      min_chunk_ms=config["min_chunk_ms"], max_chunk_ms=config["max_chunk_ms"],
+                                      chunk_format=config["chunk_format"], opus_bitrate=config["opus_bitrate"],
+                                      keep_cleaned_wav=False)
+
+def audio_chunks(config):
+    """
+    Chunk files of every benchmark input; made here (untimed) when the preprocess stage was not part of this run
+    """
+    from preprocess_audio import find_chunk_files
+    chunk_files = []
+    for audio in config["audio"]:
+        chunk_dir = preprocess_dir(config, audio) / "chunks"
+        if not find_chunk_files(chunk_dir):
+            run_preprocess(config, audio)
+        chunk_files += find_chunk_files(chunk_dir)
+    return chunk_files
+
+def tts_dir(config, transcript) -> Path:
+    return Path(config["work_dir"]) / "tts" / Path(transcript).stem
+
+def load_japanese_dialogue(transcript):
+    from multi_speaker_tts import parse_dialogue_lines
+    with open(transcript, "r", encoding="utf-8") as f:
+        return parse_dialogue_lines(f)
+
+def bench_preprocess(config):
+    from preprocess_audio import find_chunk_files
+    start = time.perf_counter()
+    plans = [run_preprocess(config, audio) for audio in config["audio"]]
+    wall = time.perf_counter() - start
+    result = stage_result(wall, sum(len(plan.chunks) for plan in plans), "chunks",
+                          sum(mp3_minutes(audio) for audio in config["audio"]))
+    # What the transcription step uploads: chunk bytes per hour of chunk audio
+    chunk_bytes = sum(os.path.getsize(path) for audio in config["audio"]
+                      for path in find_chunk_files(preprocess_dir(config, audio) / "chunks"))
+    chunk_hours = sum(chunk["duration_ms"] for plan in plans for chunk in plan.chunks) / 1000 / 3600
+    result["chunk_bytes"] = chunk_bytes
+    result["chunk_mb_per_audio_hour"] = round(chunk_bytes / 1024 / 1024 / chunk_hours, 1) if chunk_hours else None
+    return result
+
+def bench_transcribe(config):
+    from assemblescript import ChunkTranscriptionError, transcribe_chunks
+    from rate_limit import TokenBucket
+    chunk_files = audio_chunks(config)
+    transcriber = fake_transcriber(config)
+    out_dir = Path(config["work_dir"]) / "transcribe"
+    os.makedirs(out_dir, exist_ok=True)
+    failures = 0
+
+    start = time.perf_counter()
+    try:
+        with open(out_dir / "transcript.txt", "w", encoding="utf-8") as outfile:
+            transcribe_chunks(transcriber, chunk_files, outfile, config["workers"]["transcribe"], TokenBucket(),
+                              config["max_retries"], config["retry_delay"])
+    except ChunkTranscriptionError as e:
+        failures = str(e).count("\n  - ")
+    wall = time.perf_counter() - start
+    return stage_result(wall, len(chunk_files), "chunks", sum(chunk_minutes(f) for f in chunk_files),
+                        [("assemblyai", transcriber)], failures)
+
+def bench_translate(config):
+    from rate_limit import TokenBucket
+    from translate_chunks import build_speaker_chunks, translate_chunks
+    client = fake_openai(config)
+    settings = translation_settings(config)
+    jobs = []
+    for transcript in config["en_transcripts"]:
+        with open(transcript, "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        jobs.append((build_speaker_chunks(lines, config["chunk_width"]),
+                     Path(config["work_dir"]) / "translate" / Path(transcript).stem))
+
+    start = time.perf_counter()
+    failures = 0
+    for chunks, chunk_dir in jobs:
+        failures += len(translate_chunks(client, chunks, chunk_dir, settings, config["workers"]["translate"],
+                                         TokenBucket(), token_budget=config["token_budget"]))
+    wall = time.perf_counter() - start
+    return stage_result(wall, sum(len(chunks) for chunks, _ in jobs), "chunks", None, [("openai", client)], failures)
+
+def bench_tts(config):
+    from multi_speaker_tts import generate_audio_chunks
+    from rate_limit import TokenBucket
+    client = fake_tts(config)
+    failures = 0
+
+    start = time.perf_counter()
+    for transcript in config["ja_transcripts"]:
+        out_dir = tts_dir(config, transcript)
+        failures += len(generate_audio_chunks(load_japanese_dialogue(transcript), client,
+                                              config["workers"]["tts"], TokenBucket(), str(out_dir),
+                                              failed_log=str(out_dir) + "-failed.log"))
+    wall = time.perf_counter() - start
+
+    files = [f for transcript in config["ja_transcripts"] for f in glob.glob(str(tts_dir(config, transcript) / "*.mp3"))]
+    return stage_result(wall, len(files), "lines", sum(mp3_minutes(f) for f in files), [("google_tts", client)],
+                        failures)
+
+def bench_merge(config):
+    from multi_speaker_tts import merge_audio_chunks
+    if not all(glob.glob(str(tts_dir(config, transcript) / "*.mp3")) for transcript in config["ja_transcripts"]):
+        bench_tts(config)
+    out_dir = Path(config["work_dir"]) / "merge"
+    os.makedirs(out_dir, exist_ok=True)
+    merged = [out_dir / f"{Path(transcript).stem}.mp3" for transcript in config["ja_transcripts"]]
+
+    start = time.perf_counter()
+    for transcript, result_path in zip(config["ja_transcripts"], merged):
+        merge_audio_chunks(str(tts_dir(config, transcript)), str(result_path))
+    wall = time.perf_counter() - start
+
+    segments = sum(len(glob.glob(str(tts_dir(config, transcript) / "*.mp3"))) for transcript in config["ja_transcripts"])
+    return stage_result(wall, segments, "segments", sum(mp3_minutes(f) for f in merged))
+
+def bench_chain(config):
+    from orchestrator import Pipeline, PipelineBackends
+    transcriber, openai_client, tts_client = fake_transcriber(config), fake_openai(config), fake_tts(config)
+    backends = PipelineBackends(transcriber, {"model": "fake"}, openai_client, tts_client, rate_limited=False)
+    settings = translation_settings(config)
+    workers = dict(config["workers"])
+    lines = 0
+
+    start = time.perf_counter()
+    for audio in config["audio"]:
+        pipeline = Pipeline(Path(audio), Path(config["work_dir"]) / "chain" / Path(audio).stem, backends, settings,
+                            workers, config["queue_size"], config["min_chunk_ms"], config["max_chunk_ms"],
+                            config["chunk_width"])
+        pipeline.run()
+        lines += len(pipeline.audio_files)
+    wall = time.perf_counter() - start
+    return stage_result(wall, lines, "lines", sum(mp3_minutes(audio) for audio in config["audio"]),
+                        [("assemblyai", transcriber), ("openai", openai_client), ("google_tts", tts_client)])
+
+BENCHMARKS = {
+    "preprocess": bench_preprocess,
+    "transcribe": bench_transcribe,
+    "translate": bench_translate,
+    "tts": bench_tts,
+    "merge": bench_merge,
+    "chain": bench_chain,
+}
+
+def run_stage_process(stage: str, config: dict) -> dict:
+    """
+    Entry point of the per-stage process. Retry settings the scripts read at import time are set first.
+    """
+    os.environ.update({
+        "TTS_RETRY_BASE_DELAY": str(config["retry_delay"]),
+        "TTS_MAX_RETRIES": str(config["max_retries"]),
+        "TTS_MERGE_MODE": config["merge_mode"],
+        "TRANSCRIPTION_MAX_RETRIES": str(config["max_retries"]),
+        "TRANSCRIPTION_RETRY_DELAY": str(config["retry_delay"]),
+        "PREPROCESS_CHUNK_FORMAT": config["chunk_format"],
+        "PREPROCESS_OPUS_BITRATE": config["opus_bitrate"],
+    })
+    log_path = Path(config["work_dir"]) / f"{stage}.log"
+    os.makedirs(log_path.parent, exist_ok=True)
+    with open(log_path, "w", encoding="utf-8") as log:
+        with contextlib.redirect_stdout(sys.stdout if config["verbose"] else log):
+            result = BENCHMARKS[stage](config)
+    result["latency"] = span_latencies()
+    result["peak_rss_mb"] = round(peak_rss_mb(resource.RUSAGE_SELF), 1)
+    result["peak_child_rss_mb"] = round(peak_rss_mb(resource.RUSAGE_CHILDREN), 1)
+    return result
+
+def run_isolated(stage: str, config: dict) -> dict:
+    # An executor worker (unlike a Pool worker) may start its own processes, e.g. the chunk export pool
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(run_stage_process, stage, config).result()
+
+# === REPORTING ===
+def format_result(stage: str, result: dict) -> str:
+    throughput = f"{result['items_per_second']:.2f} {result['unit']}/s"
+    if result.get("audio_minutes_per_minute") is not None:
+        throughput += f", {result['audio_minutes_per_minute']:.1f} audio-min/min"
+    if result.get("chunk_mb_per_audio_hour") is not None:
+        throughput += f", {result['chunk_mb_per_audio_hour']:.1f} MB/audio-hour"
+    calls = ", ".join(f"{name} {counts['calls']} calls ({counts['throttled']} throttled)"
+                      for name, counts in result["requests"].items())
+    return (f"  {stage:<11} {result['wall_seconds']:8.2f}s  {result['items']:5d} {result['unit']:<8} {throughput}  "
+            f"RSS {result['peak_rss_mb']:.0f} MB (children {result['peak_child_rss_mb']:.0f} MB)"
+            f"{'  ' + calls if calls else ''}{'  ⚠️ ' + str(result['failures']) + ' failed' if result['failures'] else ''}")
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare_results(old: dict, new: dict, tolerance_pct: float) -> list:
+    """
+    Print wall-time and peak-RSS changes per stage; returns the stages that regressed beyond tolerance_pct
+    """
+    regressions = []
+    print(f"\n📈 Compared with {old.get('git_commit') or '?'} ({old.get('created', '?')}):")
+    changed = sorted(key for key in new["config"] if old.get("config", {}).get(key) != new["config"][key])
+    if changed:
+        print(f"  ⚠️ Settings differ ({', '.join(changed)}): the runs may not be comparable")
+    for stage, result in new["stages"].items():
+        before = old.get("stages", {}).get(stage)
+        if before is None:
+            print(f"  {stage:<11} (not in the earlier run)")
+            continue
+        changes = []
+        for metric in ("wall_seconds", "peak_rss_mb"):
+            if not before.get(metric):
+                continue
+            change = 100 * (result[metric] - before[metric]) / before[metric]
+            changes.append(f"{metric} {before[metric]} -> {result[metric]} ({change:+.1f}%)")
+            if change > tolerance_pct:
+                regressions.append(f"{stage} {metric}")
+        print(f"  {stage:<11} " + ", ".join(changes))
+    if regressions:
+        print(f"⚠️ Regressions beyond {tolerance_pct:.0f}%: {', '.join(regressions)}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages against local fake backends")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument("--audio", nargs="+", default=sorted(glob.glob(str(TEST_DATA_DIR / "*.mp3"))))
+    parser.add_argument("--en-transcripts", nargs="+", default=sorted(glob.glob(str(EN_TEXT_DIR / "*.txt"))))
+    parser.add_argument("--ja-transcripts", nargs="+", default=sorted(glob.glob(str(JA_TEXT_DIR / "*.txt"))))
+    parser.add_argument("--latency", type=float, nargs=3, default=[1.0, 0.2, 0.05], metavar=SERVICES,
+                        help="Seconds per fake call")
+    parser.add_argument("--failure-rate", type=float, nargs=3, default=[0.0, 0.0, 0.0], metavar=SERVICES,
+                        help="Fraction of fake calls that fail with a server error")
+    parser.add_argument("--quota-per-second", type=int, nargs=2, default=[None, None], metavar=("TRANSCRIBE", "TTS"),
+                        help="Fake AssemblyAI / TTS calls allowed per second before 429s")
+    parser.add_argument("--openai-concurrency-limit", type=int, default=None,
+                        help="Fake OpenAI returns 429 beyond this many calls in flight")
+    parser.add_argument("--retry-after", type=float, default=0.5, help="Retry-After seconds sent with fake 429s")
+    parser.add_argument("--workers", type=int, nargs=4, default=[2, 4, 8, 8],
+                        metavar=("PREPROCESS", "TRANSCRIBE", "TRANSLATE", "TTS"))
+    parser.add_argument("--max-retries", type=int, default=4)
+    parser.add_argument("--retry-delay", type=float, default=0.2, help="Base retry backoff in seconds")
+    parser.add_argument("--token-budget", type=int, default=0, help="TRANSLATION_TOKEN_BUDGET for the translate stage")
+    parser.add_argument("--chunk-width", type=int, default=3000)
+    parser.add_argument("--min-chunk-sec", type=float, default=240)
+    parser.add_argument("--max-chunk-sec", type=float, default=360)
+    parser.add_argument("--queue-size", type=int, default=4)
+    parser.add_argument("--merge-mode", choices=("frames", "decode"), default="frames")
+    parser.add_argument("--chunk-format", choices=("flac", "opus", "wav"), default="flac",
+                        help="Chunk files written by preprocessing (PREPROCESS_CHUNK_FORMAT)")
+    parser.add_argument("--opus-bitrate", default="32k")
+    parser.add_argument("--output", type=Path, default=None, help="Results JSON (default: a timestamped file in "
+                                                                  "joe-charlie-aa-js/test-output/benchmarks)")
+    parser.add_argument("--compare", type=Path, help="Earlier results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=10.0, help="Percent slower / larger counted as a regression")
+    parser.add_argument("--keep-work-dir", type=Path, help="Keep intermediate files here instead of a temp directory")
+    parser.add_argument("--verbose", action="store_true", help="Show the stages' own output instead of logging it")
+    args = parser.parse_args()
+
+    created = datetime.datetime.now(datetime.timezone.utc)
+    config = {
+        "audio": [str(Path(p).resolve()) for p in args.audio],
+        "en_transcripts": [str(Path(p).resolve()) for p in args.en_transcripts],
+        "ja_transcripts": [str(Path(p).resolve()) for p in args.ja_transcripts],
+        "latency": dict(zip(SERVICES, args.latency)),
+        "failure_rate": dict(zip(SERVICES, args.failure_rate)),
+        "quota_per_second": {"transcribe": args.quota_per_second[0], "tts": args.quota_per_second[1]},
+        "openai_concurrency_limit": args.openai_concurrency_limit,
+        "retry_after": args.retry_after,
+        "workers": dict(zip(("preprocess", "transcribe", "translate", "tts"), args.workers)),
+        "max_retries": args.max_retries,
+        "retry_delay": args.retry_delay,
+        "token_budget": args.token_budget,
+        "chunk_width": args.chunk_width,
+        "min_chunk_ms": int(args.min_chunk_sec * 1000),
+        "max_chunk_ms": int(args.max_chunk_sec * 1000),
+        "queue_size": args.queue_size,
+        "merge_mode": args.merge_mode,
+        "chunk_format": args.chunk_format,
+        "opus_bitrate": args.opus_bitrate,
+        "verbose": args.verbose,
+    }
+
+    results = {"created": created.isoformat(timespec="seconds"), "git_commit": git_commit(),
+               "python": platform.python_version(), "platform": platform.platform(),
+               "cpu_count": os.cpu_count(), "config": config, "stages": {}}
+    with contextlib.ExitStack() as stack:
+        if args.keep_work_dir:
+            os.makedirs(args.keep_work_dir, exist_ok=True)
+            work_dir = str(args.keep_work_dir.resolve())
+        else:
+            work_dir = stack.enter_context(tempfile.TemporaryDirectory(prefix="pipeline-benchmark-"))
+        config["work_dir"] = work_dir
+
+        print(f"🏁 Benchmarking {', '.join(args.stages)} on {len(config['audio'])} audio file(s), "
+              f"{len(config['en_transcripts'])} EN / {len(config['ja_transcripts'])} JA transcript(s)")
+        for stage in args.stages:
+            result = run_isolated(stage, config)
+            results["stages"][stage] = result
+            print(format_result(stage, result))
+    del config["work_dir"]
+
+    output = args.output or RESULTS_DIR / f"benchmark_{created.strftime('%Y%m%d_%H%M%S')}.json"
+    os.makedirs(output.parent, exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"💾 Results saved to {output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            if compare_results(json.load(f), results, args.tolerance):
+                sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,407 @@
+#!/usr/bin/env python3
+"""
+Pipelined Orchestrator
+- Runs preprocess -> transcribe -> translate (+ clean) -> TTS -> merge as one streaming pipeline
+- Stages are connected by bounded asyncio queues: chunk 1 can be in TTS while chunk 3 is still being transcribed
+- Each stage has its own worker pool; a full queue blocks the stage before it (backpressure)
+- Wall time approaches the slowest stage instead of the sum of all stages
+- Resume-safe: existing chunk, translation and MP3 files are reused, transcripts come from the transcription cache
+
+Usage:
+  python run-pipeline/orchestrator.py INPUT_AUDIO [--output-dir DIR]
+  python run-pipeline/orchestrator.py INPUT_AUDIO --fake        # local fake AssemblyAI / OpenAI / TTS backends
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from pathlib import Path
+
+# === CONFIGURATION ===
+SCRIPT_DIR = Path(__file__).resolve().parent
+REPO_DIR = SCRIPT_DIR.parent
+DEFAULT_OUTPUT_DIR = REPO_DIR / "joe-charlie-aa-js/test-output/pipeline"
+DEFAULT_QUEUE_SIZE = 4                    # Items buffered between two stages before the earlier one blocks
+
+for stage_dir in ("pipeline-common", "extract-audio", "translate-text", "generate-audio"):
+    sys.path.insert(0, str(REPO_DIR / stage_dir))
+from rate_limit import AdaptiveConcurrency, TokenBucket
+from hedging import HedgingPolicy
+from preprocess_audio import (TARGET_SAMPLE_RATE, MIN_CHUNK_MS, MAX_CHUNK_MS, chunk_format_from_env, export_chunk_from_wav,
+                              preprocess_audio_streaming)
+from assemblescript import create_transcriber, transcribe_chunk, transcription_settings, TRANSCRIPTION_CACHE_PATH
+from window_stitch import WindowSettings
+from transcription_cache import TranscriptionCache
+from translate_chunks import SYSTEM_PROMPT, TranslationSettings, build_speaker_chunks, translate_text, write_chunk_file
+from translation_memory import TRANSLATION_MEMORY_PATH, TranslationMemory
+from multi_speaker_tts import (TTS_CACHE_DIR, TTS_REQUEST_TIMEOUT, TTS_REQUESTS_PER_MINUTE, create_tts_client,
+                               merge_audio_files, sanitize_input, split_text_by_bytes, synthesize_cached)
+from tts_cache import TTSCache
+from dialogue_format import format_turn, parse_dialogue
+from metrics import finish_run, span, start_run
+
+STOP = object()                           # End-of-stream marker passed down the queues
+
+class PipelineError(Exception):
+    pass
+
+class Stage:
+    """
+    One pipeline step: `process(item)` is blocking (API calls, file IO) and runs on the stage's own thread pool.
+    It returns the items for the next stage; one chunk fans out into many turns, one turn into many TTS lines.
+    """
+    def __init__(self, name: str, workers: int, process):
+        self.name = name
+        self.workers = max(1, workers)
+        self.process = process
+        self.items = 0
+        self.busy_seconds = 0.0
+        self.first_start = None
+        self.last_end = None
+        self.failures = []
+
+    def report(self) -> str:
+        span = (self.last_end - self.first_start) if self.items else 0.0
+        return (f"  {self.name:<11} {self.items:>4} items, {self.workers:>2} workers, "
+                f"busy {self.busy_seconds:7.2f}s (~{self.busy_seconds / self.workers:6.2f}s per worker), "
+                f"active {span:6.2f}s, {len(self.failures)} failed")
+
+async def run_stage(stage: Stage, inbox: asyncio.Queue, outbox: asyncio.Queue = None):
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=stage.workers, thread_name_prefix=stage.name)
+
+    async def worker():
+        while True:
+            item = await inbox.get()
+            if item is STOP:
+                await inbox.put(STOP)  # Let the other workers of this stage see it too
+                return
+            key, _ = item
+            start = time.perf_counter()
+            stage.first_start = stage.first_start or start
+            try:
+                outputs = await loop.run_in_executor(executor, stage.process, item)
+            except Exception as e:
+                stage.failures.append((key, f"{e.__class__.__name__}: {e}"))
+                print(f"❌ {stage.name} failed for {key}: {e}")
+                outputs = []
+            stage.last_end = time.perf_counter()
+            stage.busy_seconds += stage.last_end - start
+            stage.items += 1
+            for output in outputs:
+                # Blocks while the next stage's queue is full: a slow stage throttles everything before it
+                await outbox.put(output)
+
+    try:
+        await asyncio.gather(*(worker() for _ in range(stage.workers)))
+    finally:
+        executor.shutdown(wait=False)
+    if outbox is not None:
+        await outbox.put(STOP)
+
+class PipelineBackends:
+    """
+    The three remote services plus their rate limits. `fake()` swaps in the local stand-ins from fake_backends.
+    """
+    def __init__(self, transcriber, transcription_config: dict, openai_client, tts_client, rate_limited: bool = True):
+        self.transcriber = transcriber
+        self.transcription_config = transcription_config
+        self.openai_client = openai_client
+        self.tts_client = tts_client
+        self.rate_limited = rate_limited
+
+    @classmethod
+    def from_env(cls):
+        from openai import OpenAI
+        transcriber, transcription_config = create_transcriber()
+        openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+        return cls(transcriber, transcription_config, openai_client, create_tts_client())
+
+    @classmethod
+    def fake(cls, transcribe_latency: float, translate_latency: float, tts_latency: float):
+        from fake_backends import FakeOpenAI, FakeTranscriber, FakeTTSClient
+        return cls(FakeTranscriber(latency=transcribe_latency, utterances_per_chunk=6),
+                   dict(transcription_settings(), model="fake"),
+                   FakeOpenAI(latency=translate_latency), FakeTTSClient(latency=tts_latency), rate_limited=False)
+
+    def rate_limiters(self, workers: dict):
+        """
+        (transcription, translation, TTS) token buckets from .env; everything that shares them shares one budget
+        """
+        if not self.rate_limited:
+            return TokenBucket(), TokenBucket(), TokenBucket()
+        return (TokenBucket.from_delay(float(os.getenv("TRANSCRIPTION_RATE_LIMIT_DELAY", "1")), burst=workers["transcribe"]),
+                TokenBucket.from_delay(float(os.getenv("TRANSLATION_RATE_LIMIT_DELAY", "1")), burst=workers["translate"]),
+                TokenBucket.per_minute(TTS_REQUESTS_PER_MINUTE, burst=workers["tts"]))
+
+    def hedging_policies(self):
+        """
+        (translation, TTS) hedging policies from .env, None where disabled; hedges spend the same token buckets
+        """
+        return (HedgingPolicy.from_env("TRANSLATION", "translate",
+                                       float(os.getenv("TRANSLATION_REQUEST_TIMEOUT", "120")) / 4),
+                HedgingPolicy.from_env("TTS", "tts", TTS_REQUEST_TIMEOUT / 3))
+
+def workers_from_env() -> dict:
+    return {
+        "preprocess": int(os.getenv("PIPELINE_PREPROCESS_WORKERS", "2")),
+        "transcribe": int(os.getenv("TRANSCRIPTION_MAX_IN_FLIGHT", "1")),
+        "translate": int(os.getenv("TRANSLATION_MAX_WORKERS", "1")),
+        "tts": int(os.getenv("TTS_MAX_WORKERS", "1")),
+    }
+
+def open_caches(backends: PipelineBackends, settings: TranslationSettings):
+    """
+    Transcription cache, translation memory and TTS cache as enabled in .env (None where disabled)
+    """
+    cache = memory = tts_cache = None
+    if os.getenv("TRANSCRIPTION_CACHE_ENABLED", "true").lower() == "true":
+        cache = TranscriptionCache(os.getenv("TRANSCRIPTION_CACHE_PATH", str(TRANSCRIPTION_CACHE_PATH)),
+                                   backends.transcription_config,
+                                   int(float(os.getenv("TRANSCRIPTION_CACHE_MAX_MB", "512")) * 1024 * 1024))
+    if os.getenv("TRANSLATION_MEMORY_ENABLED", "true").lower() == "true":
+        memory = TranslationMemory(os.getenv("TRANSLATION_MEMORY_PATH", str(TRANSLATION_MEMORY_PATH)),
+                                   SYSTEM_PROMPT, settings.model, settings.temperature,
+                                   os.getenv("TRANSLATION_MEMORY_MODE", "normalized"))
+    if os.getenv("TTS_CACHE_ENABLED", "true").lower() == "true":
+        tts_cache = TTSCache(os.getenv("TTS_CACHE_DIR", str(TTS_CACHE_DIR)),
+                             int(float(os.getenv("TTS_CACHE_MAX_MB", "1024")) * 1024 * 1024))
+    return cache, memory, tts_cache
+
+class Pipeline:
+    """
+    Wires the stage functions of the individual scripts together. Results are keyed by position
+    ((chunk,), (chunk, turn), (chunk, turn, line, part)) so out-of-order completion still merges in order.
+    """
+    def __init__(self, input_audio: Path, output_dir: Path, backends: PipelineBackends, settings: TranslationSettings,
+                 workers: dict, queue_size: int = DEFAULT_QUEUE_SIZE, min_chunk_ms: int = MIN_CHUNK_MS,
+                 max_chunk_ms: int = MAX_CHUNK_MS, chunk_width: int = 3000, cache: TranscriptionCache = None,
+                 memory: TranslationMemory = None, tts_cache: TTSCache = None):
+        self.input_audio = Path(input_audio)
+        self.output_dir = Path(output_dir)
+        self.backends = backends
+        self.settings = settings
+        self.queue_size = queue_size
+        self.min_chunk_ms = min_chunk_ms
+        self.max_chunk_ms = max_chunk_ms
+        self.chunk_width = chunk_width
+        self.cache = cache
+        self.memory = memory
+        self.tts_cache = tts_cache
+        # Low-latency transcription (TRANSCRIPTION_WINDOW_SEC): every chunk's windows share one pool of jobs
+        self.windows = WindowSettings.from_env()
+        self.window_pool = ThreadPoolExecutor(max_workers=self.windows.workers) if self.windows else None
+
+        self.cleaned_wav = self.output_dir / "preprocess" / (self.input_audio.stem + ".wav")
+        self.chunk_format, self.opus_bitrate = chunk_format_from_env()
+        self.keep_cleaned_wav = os.getenv("PREPROCESS_KEEP_CLEANED_WAV", "false").lower() == "true"
+        self.audio_chunk_dir = self.output_dir / "preprocess" / "chunks"
+        self.translation_dir = self.output_dir / "translation" / "chunks"
+        self.tts_dir = self.output_dir / "tts" / "chunks"
+        self.transcript_file = self.output_dir / f"EN-{self.input_audio.stem}.txt"
+        self.japanese_file = self.output_dir / f"clean-JP-{self.input_audio.stem}.txt"
+        self.merged_file = self.output_dir / f"JP-{self.input_audio.stem}.mp3"
+
+        self.translation_concurrency = AdaptiveConcurrency(initial=1, maximum=workers["translate"])
+        self.transcription_limiter, self.translation_limiter, self.tts_limiter = backends.rate_limiters(workers)
+        self.translation_hedging, self.tts_hedging = backends.hedging_policies()
+
+        self.stages = [
+            Stage("preprocess", workers["preprocess"], self.export_chunk),
+            Stage("transcribe", workers["transcribe"], self.transcribe),
+            Stage("translate", workers["translate"], self.translate),
+            Stage("tts", workers["tts"], self.synthesize),
+        ]
+        self.transcript_lines = {}
+        self.japanese_lines = {}
+        self.audio_files = {}
+        self.plan_seconds = 0.0
+        self._results_lock = threading.Lock()
+
+    # === STAGE FUNCTIONS (blocking, run on the stage's thread pool) ===
+    def export_chunk(self, item):
+        (chunk_index,), chunk = item
+        chunk_path = self.audio_chunk_dir / chunk["file"]
+        if not chunk_path.exists():
+            with span("preprocess", "export_chunk", chunk=chunk["file"]):
+                export_chunk_from_wav(self.cleaned_wav, chunk_path, chunk["offset_ms"], chunk["duration_ms"],
+                                      self.opus_bitrate)
+        return [((chunk_index,), chunk_path)]
+
+    def transcribe(self, item):
+        (chunk_index,), chunk_path = item
+        utterances = transcribe_chunk(self.backends.transcriber, str(chunk_path), self.transcription_limiter,
+                                      int(os.getenv("TRANSCRIPTION_MAX_RETRIES", "3")),
+                                      float(os.getenv("TRANSCRIPTION_RETRY_DELAY", "5")), self.cache,
+                                      windows=self.windows, window_pool=self.window_pool)
+        lines = [f"Speaker {utterance['speaker']}: {utterance['text']}" for utterance in utterances]
+        with self._results_lock:
+            self.transcript_lines[chunk_index] = lines
+        if not lines:
+            return []
+        turns = build_speaker_chunks(list(lines), self.chunk_width)
+        return [((chunk_index, turn_index), turn) for turn_index, turn in enumerate(turns, start=1)]
+
+    def translate(self, item):
+        (chunk_index, turn_index), turn = item
+        out_file = self.translation_dir / f"chunk_{chunk_index:03}_{turn_index:03}.txt"
+        if out_file.exists():
+            content = out_file.read_text(encoding="utf-8")
+        else:
+            content = self.memory.translate_turn(turn) if self.memory is not None else None
+            if content is None:
+                content = translate_text(self.backends.openai_client, turn, f"chunk {chunk_index}.{turn_index}",
+                                         self.settings, self.translation_concurrency, self.translation_limiter,
+                                         self.translation_hedging)
+                if content is None:
+                    raise PipelineError(f"translation failed after {self.settings.max_retries} attempts")
+                if self.memory is not None:
+                    self.memory.store_turn(turn, content)
+            write_chunk_file(out_file, content)
+
+        # Merge/clean step: the same cleanup clean_japanese_dialogue applies to the merged file
+        turns = list(parse_dialogue(content.splitlines()))
+        with self._results_lock:
+            self.japanese_lines[(chunk_index, turn_index)] = [format_turn(*turn) for turn in turns]
+        return [
+            ((chunk_index, turn_index, line_index, part_index), (speaker, part))
+            for line_index, (speaker, text) in enumerate((turn for turn in turns if turn[0]), start=1)
+            for part_index, part in enumerate(split_text_by_bytes(sanitize_input(text)), start=1)
+        ]
+
+    def synthesize(self, item):
+        key, (speaker, text) = item
+        chunk_index, turn_index, line_index, part_index = key
+        filename = self.tts_dir / (f"{chunk_index:03}_{turn_index:03}_{line_index:02}_"
+                                   f"{speaker.replace(' ', '_')}_{part_index}.mp3")
+        # With a TTS cache the line file is always re-linked from the cache entry for this exact text
+        if self.tts_cache is not None or not filename.exists():
+            if not synthesize_cached(self.backends.tts_client, speaker, text, str(filename), self.tts_cache,
+                                     self.tts_limiter, hedging=self.tts_hedging):
+                raise PipelineError(f"TTS failed for {filename.name}")
+        with self._results_lock:
+            self.audio_files[key] = str(filename)
+        return []
+
+    # === PIPELINE ===
+    async def run_async(self):
+        for directory in (self.audio_chunk_dir, self.translation_dir, self.tts_dir):
+            os.makedirs(directory, exist_ok=True)
+        queues = [asyncio.Queue(maxsize=self.queue_size) for _ in self.stages]
+        runners = [
+            asyncio.create_task(run_stage(stage, queues[i], queues[i + 1] if i + 1 < len(queues) else None))
+            for i, stage in enumerate(self.stages)
+        ]
+
+        # The split plan needs the whole file (normalization + silence), then chunks are cut and fed one by one
+        start = time.perf_counter()
+        try:
+            plan = await asyncio.get_running_loop().run_in_executor(
+                None, lambda: preprocess_audio_streaming(self.input_audio, self.cleaned_wav, TARGET_SAMPLE_RATE,
+                                                         self.audio_chunk_dir, self.min_chunk_ms, self.max_chunk_ms,
+                                                         export=False, chunk_format=self.chunk_format,
+                                                         opus_bitrate=self.opus_bitrate))
+            self.plan_seconds = time.perf_counter() - start
+            for chunk in plan.chunks:
+                await queues[0].put(((chunk["index"],), chunk))
+        finally:
+            await queues[0].put(STOP)
+            await asyncio.gather(*runners)
+        # Every chunk is cut by now; the cleaned WAV was only their source
+        if not self.keep_cleaned_wav and self.cleaned_wav.exists():
+            os.remove(self.cleaned_wav)
+
+    def run(self):
+        start = time.perf_counter()
+        try:
+            asyncio.run(self.run_async())
+        finally:
+            if self.window_pool is not None:
+                self.window_pool.shutdown()
+        wall = time.perf_counter() - start
+
+        failures = [(stage.name, key, error) for stage in self.stages for key, error in stage.failures]
+        self.write_text_outputs()
+        print("\n📊 Stage report:")
+        print(f"  {'plan':<11} whole-file normalization + silence planning {self.plan_seconds:.2f}s")
+        for stage in self.stages:
+            print(stage.report())
+        per_stage = [stage.busy_seconds / stage.workers for stage in self.stages]
+        print(f"⏱ Wall time {wall:.2f}s — sum of stages {sum(per_stage):.2f}s, slowest stage {max(per_stage):.2f}s")
+        for hedging in (self.translation_hedging, self.tts_hedging):
+            if hedging is not None:
+                print(hedging.summary())
+
+        if failures:
+            details = "\n".join(f"  - {name} {key}: {error}" for name, key, error in failures)
+            raise PipelineError(f"{len(failures)} item(s) failed; re-run to retry them (finished work is reused):\n"
+                                f"{details}")
+        merge_audio_files([self.audio_files[key] for key in sorted(self.audio_files)], str(self.merged_file))
+        return self.merged_file
+
+    def write_text_outputs(self):
+        with open(self.transcript_file, "w", encoding="utf-8") as f:
+            for chunk_index in sorted(self.transcript_lines):
+                for line in self.transcript_lines[chunk_index]:
+                    f.write(line + "\n")
+        with open(self.japanese_file, "w", encoding="utf-8") as f:
+            f.write("\n\n".join(block for key in sorted(self.japanese_lines) for block in self.japanese_lines[key]))
+        print(f"📄 Transcript: {self.transcript_file}\n📄 Japanese text: {self.japanese_file}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the whole audio translation pipeline as one streaming pipeline")
+    parser.add_argument("input_audio", type=Path)
+    parser.add_argument("--output-dir", type=Path, default=DEFAULT_OUTPUT_DIR)
+    parser.add_argument("--queue-size", type=int, default=None, help="Items buffered between stages")
+    parser.add_argument("--min-chunk-sec", type=float, default=MIN_CHUNK_MS / 1000)
+    parser.add_argument("--max-chunk-sec", type=float, default=MAX_CHUNK_MS / 1000)
+    parser.add_argument("--fake", action="store_true", help="Use local fake AssemblyAI / OpenAI / TTS backends")
+    parser.add_argument("--fake-latency", type=float, nargs=3, default=[2.0, 0.3, 0.2],
+                        metavar=("TRANSCRIBE", "TRANSLATE", "TTS"), help="Seconds per fake call")
+    parser.add_argument("--workers", type=int, nargs=4, metavar=("PREPROCESS", "TRANSCRIBE", "TRANSLATE", "TTS"),
+                        help="Override the per-stage worker counts from .env")
+    args = parser.parse_args()
+
+    # Load .env from the repository root
+    load_dotenv(dotenv_path=REPO_DIR / ".env")
+    workers = workers_from_env()
+    if args.workers:
+        workers = dict(zip(workers, args.workers))
+    queue_size = args.queue_size or int(os.getenv("PIPELINE_QUEUE_SIZE", str(DEFAULT_QUEUE_SIZE)))
+    model = os.getenv("OPENAI_MODEL_NAME", "fake" if args.fake else "")
+    settings = TranslationSettings(model, float(os.getenv("OPENAI_TEMPERATURE", "0.3")),
+                                   int(os.getenv("TRANSLATION_MAX_RETRIES", "4")),
+                                   float(os.getenv("TRANSLATION_RETRY_DELAY", "5")),
+                                   float(os.getenv("TRANSLATION_REQUEST_TIMEOUT", "120")))
+
+    if args.fake:
+        backends = PipelineBackends.fake(*args.fake_latency)
+        cache = memory = tts_cache = None
+    else:
+        if not model:
+            raise RuntimeError("❌ Missing OPENAI_MODEL_NAME in .env")
+        backends = PipelineBackends.from_env()
+        cache, memory, tts_cache = open_caches(backends, settings)
+
+    print(f"🚀 Pipeline: {args.input_audio} -> {args.output_dir} (workers {workers}, queue size {queue_size})")
+    pipeline = Pipeline(args.input_audio, args.output_dir, backends, settings, workers, queue_size,
+                        int(args.min_chunk_sec * 1000), int(args.max_chunk_sec * 1000),
+                        int(os.getenv("TRANSLATION_CHUNK_WIDTH", "3000")), cache, memory, tts_cache)
+    start_run("pipeline")
+    try:
+        merged = pipeline.run()
+    finally:
+        for store in (cache, memory, tts_cache):
+            if store is not None:
+                print(store.summary())
+                store.close()
+        finish_run()
+    print(f"🎉 Done: {merged}")
+
+if __name__ == "__main__":
+    main()
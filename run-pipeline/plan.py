@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Pipeline Plan
+- Lists every artifact of the step-by-step scripts (preprocess -> transcribe -> translate -> merge -> clean -> TTS)
+  that a re-run would rebuild, and why, from the shared stage manifest
+- Nothing is run or written. Dependents of an artifact that would be rebuilt are listed as well; the real run may
+  find some of them unchanged (e.g. a translated chunk whose text came out the same) and skip them.
+
+Usage: python run-pipeline/plan.py
+"""
+
+import os
+import sys
+from dotenv import load_dotenv
+from pathlib import Path
+
+# === CONFIGURATION ===
+SCRIPT_DIR = Path(__file__).resolve().parent
+REPO_DIR = SCRIPT_DIR.parent
+
+for stage_dir in ("pipeline-common", "extract-audio", "translate-text", "generate-audio"):
+    sys.path.insert(0, str(REPO_DIR / stage_dir))
+load_dotenv(dotenv_path=REPO_DIR / ".env")
+
+import assemblescript
+import clean_japanese_dialogue
+import merge_chunks
+import multi_speaker_tts
+import preprocess_audio
+import translate_chunks
+from stage_manifest import open_manifest
+
+def main():
+    manifest = open_manifest(dry_run=True)
+    print("🔎 Preprocess")
+    preprocess_audio.run_stage(manifest, streaming=os.getenv("PREPROCESS_STREAMING", "false").lower() == "true")
+    print("🔎 Transcribe")
+    assemblescript.run_stage(manifest)
+    print("🔎 Translate")
+    translate_chunks.run_stage(manifest)
+    print("🔎 Merge")
+    merge_chunks.run_stage(manifest)
+    print("🔎 Clean")
+    clean_japanese_dialogue.run_stage(manifest)
+    print("🔎 Text-to-speech")
+    multi_speaker_tts.run_stage(manifest)
+    manifest.print_plan()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+"""
+Queue Worker
+- Runs the pipeline as small durable tasks in a shared work queue (pipeline-common/work_queue.py), so any number
+  of worker processes, on one machine or several, can work on the same episodes and pick up where a crashed
+  worker stopped
+- Per episode (one job): preprocess -> transcribe/<chunk> -> transcript -> translate/<chunk> -> dialogue ->
+  tts/<line> -> merge. The per-unit tasks run anywhere at once; the episode-wide steps in between (transcript,
+  dialogue, merge) wait for every unit before them and enqueue the units after them. Only the episode-wide steps
+  touch the episode's pipeline manifest, and the queue runs them one at a time, so unchanged work is still skipped.
+- Units that keep failing end up dead-lettered in the queue with their error (see `status`) instead of in
+  failed_audio_chunks.log; `retry-dead` puts them back
+- Rate limits are per worker process: split the provider budgets in .env across the processes you start
+
+Usage:
+  python run-pipeline/queue_worker.py enqueue INPUT... [--output-dir DIR]     # episodes or directories of them
+  python run-pipeline/queue_worker.py work [--threads N] [--stages transcribe ...] [--wait] [--fake]
+  python run-pipeline/queue_worker.py status
+  python run-pipeline/queue_worker.py retry-dead [--job NAME]
+"""
+
+import argparse
+import os
+import random
+import socket
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# === CONFIGURATION ===
+SCRIPT_DIR = Path(__file__).resolve().parent
+REPO_DIR = SCRIPT_DIR.parent
+POLL_SECONDS = 2                          # Idle workers look for new tasks this often
+
+sys.path.insert(0, str(SCRIPT_DIR))
+from batch_runner import (AUDIO_EXTENSIONS, DEFAULT_OUTPUT_DIR, EpisodePaths, SharedServices, cache_settings,
+                          create_backends, find_episodes)
+
+import assemblescript
+import clean_japanese_dialogue
+import merge_chunks
+import multi_speaker_tts
+import preprocess_audio
+import translate_chunks
+from metrics import count, finish_run, span, start_run
+from orchestrator import open_caches, workers_from_env
+from stage_manifest import StageManifest
+from utterance_index import index_path_for, save_chunk_lines
+from window_stitch import WindowSettings
+from work_queue import DEFAULT_LEASE_SECONDS, DEFAULT_MAX_ATTEMPTS, STATES, open_work_queue
+
+STAGES = ("preprocess", "transcribe", "transcript", "translate", "dialogue", "tts", "merge")
+
+def episode_payload(paths: EpisodePaths, **fields) -> dict:
+    # Every task carries its episode, so any worker can find the files
+    return dict(fields, input_audio=str(paths.input_audio), output_root=str(paths.output_dir.parent))
+
+def episode_paths(payload: dict) -> EpisodePaths:
+    return EpisodePaths(payload["input_audio"], payload["output_root"])
+
+def translation_settings() -> translate_chunks.TranslationSettings:
+    return translate_chunks.TranslationSettings(
+        os.getenv("OPENAI_MODEL_NAME"), float(os.getenv("OPENAI_TEMPERATURE", "0.3")),
+        int(os.getenv("TRANSLATION_MAX_RETRIES", "4")), float(os.getenv("TRANSLATION_RETRY_DELAY", "5")),
+        float(os.getenv("TRANSLATION_REQUEST_TIMEOUT", "120")))
+
+def write_atomically(path, write):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_file = f"{path}.tmp"
+    with open(temp_file, "w", encoding="utf-8") as f:
+        write(f)
+    os.replace(temp_file, path)
+
+class TaskHandlers:
+    """
+    What each stage's task does. Handlers return the task's result and may enqueue the tasks that follow;
+    everything they write is keyed by the task, so a task run twice (after a lost lease) writes the same files.
+    """
+    def __init__(self, queue, services: SharedServices):
+        self.queue = queue
+        self.services = services
+        self.max_attempts = int(os.getenv("WORK_QUEUE_MAX_ATTEMPTS", str(DEFAULT_MAX_ATTEMPTS)))
+        self.translation = translation_settings()
+        self.windows = WindowSettings.from_env()
+        # Window jobs of every transcribe task in this process share one pool
+        self.window_pool = ThreadPoolExecutor(max_workers=self.windows.workers) if self.windows else None
+
+    def enqueue(self, job: str, tasks):
+        return self.queue.enqueue_many(job, tasks, self.max_attempts)
+
+    def run(self, task):
+        return getattr(self, task.stage)(task, episode_paths(task.payload))
+
+    # === EPISODE-WIDE STEPS (one at a time per episode: they own the manifest) ===
+    def preprocess(self, task, paths: EpisodePaths):
+        manifest = StageManifest(paths.manifest)
+        try:
+            preprocess_audio.run_stage(manifest, task.payload["streaming"], paths.input_audio, paths.cleaned_wav,
+                                       paths.audio_chunk_dir)
+        finally:
+            manifest.save()
+        chunk_files = preprocess_audio.find_chunk_files(paths.audio_chunk_dir)
+        if not chunk_files:
+            raise FileNotFoundError(f"❌ No chunk files in {paths.audio_chunk_dir}")
+        self.enqueue(task.job, [("transcribe", os.path.basename(chunk_path),
+                                 episode_payload(paths, chunk_path=str(chunk_path)), None)
+                                for chunk_path in chunk_files]
+                     + [("transcript", "episode", episode_payload(paths), "transcribe")])
+        return {"chunks": len(chunk_files)}
+
+    def transcript(self, task, paths: EpisodePaths):
+        chunk_files = preprocess_audio.find_chunk_files(paths.audio_chunk_dir)
+        utterances = {os.path.basename(payload["chunk_path"]): result["utterances"]
+                      for payload, result in self.queue.results(task.job, "transcribe").values()}
+        missing = [chunk_path for chunk_path in chunk_files if os.path.basename(chunk_path) not in utterances]
+        if missing:
+            raise RuntimeError(f"❌ No transcribe task for {', '.join(map(str, missing))}; enqueue the episode again")
+
+        # Same transcript and utterance index as assemblescript.run_stage writes
+        index_file = index_path_for(paths.en_transcript)
+        to_source_ms = assemblescript.chunk_time_map(paths.audio_chunk_dir, chunk_files)
+
+        def write_transcript(outfile):
+            with open(f"{index_file}.tmp", "w", encoding="utf-8") as index:
+                next_id = 1
+                for chunk_path in chunk_files:
+                    next_id = assemblescript.write_chunk_rows(assemblescript.chunk_number(chunk_path),
+                                                              utterances[os.path.basename(chunk_path)], outfile,
+                                                              index, next_id, to_source_ms)
+        write_atomically(paths.en_transcript, write_transcript)
+        os.replace(f"{index_file}.tmp", index_file)
+        print(f"✅ [{task.job}] Transcript saved to: {paths.en_transcript}")
+
+        manifest = StageManifest(paths.manifest)
+        try:
+            manifest.record("transcript", "transcribe", inputs=chunk_files,
+                            config=assemblescript.transcription_settings(),
+                            outputs=[paths.en_transcript, index_file])
+            return self.split_translation(task, paths, manifest)
+        finally:
+            manifest.save()
+
+    def split_translation(self, task, paths: EpisodePaths, manifest: StageManifest):
+        # Speaker-safe chunks as in translate_chunks.run_stage; each one still to translate becomes a task
+        with open(paths.en_transcript, "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        spans = []
+        chunks = translate_chunks.build_speaker_chunks(lines, int(os.getenv("TRANSLATION_CHUNK_WIDTH", "3000")), spans)
+        translate_chunks.remove_stale_chunk_files(chunks, paths.translation_chunk_dir, manifest)
+        os.makedirs(paths.translation_chunk_dir, exist_ok=True)
+        save_chunk_lines(paths.translation_chunk_dir, paths.en_transcript, spans)
+
+        memory = self.services.translation_memory
+        tasks = []
+        for idx, chunk in enumerate(chunks, start=1):
+            out_file = os.path.join(paths.translation_chunk_dir, f"chunk_{idx:03}.txt")
+            if translate_chunks.chunk_is_current(idx, chunk, out_file, self.translation, manifest):
+                continue
+            if not translate_chunks.is_speaker_line(chunk):
+                raise ValueError(f"❌ Chunk {idx} is missing a speaker tag at the top.")
+            remembered = memory.translate_turn(chunk) if memory is not None else None
+            if remembered is not None:
+                translate_chunks.write_chunk_file(out_file, remembered)
+                translate_chunks.record_chunk(manifest, idx, chunk, out_file, self.translation)
+                continue
+            tasks.append(("translate", f"{idx:03}", episode_payload(paths, idx=idx, chunk=chunk, out_file=out_file),
+                          None))
+        self.enqueue(task.job, tasks + [("dialogue", "episode", episode_payload(paths), "translate")])
+        print(f"🔹 [{task.job}] {len(chunks)} translation chunk(s), {len(tasks)} to translate")
+        return {"chunks": len(chunks), "queued": len(tasks)}
+
+    def dialogue(self, task, paths: EpisodePaths):
+        manifest = StageManifest(paths.manifest)
+        try:
+            for payload, _ in self.queue.results(task.job, "translate").values():
+                translate_chunks.record_chunk(manifest, payload["idx"], payload["chunk"], payload["out_file"],
+                                              self.translation)
+            merge_chunks.run_stage(manifest, paths.translation_chunk_dir, paths.ja_transcript)
+            clean_japanese_dialogue.run_stage(manifest, paths.ja_transcript, paths.clean_ja_transcript)
+            return self.split_speech(task, paths, manifest)
+        finally:
+            manifest.save()
+
+    def split_speech(self, task, paths: EpisodePaths, manifest: StageManifest):
+        # One task per per-line MP3 whose text or voice changed, as in multi_speaker_tts.generate_audio_chunks
+        dialogue = multi_speaker_tts.load_dialogue_from_file(paths.clean_ja_transcript)
+        os.makedirs(paths.tts_dir, exist_ok=True)
+        current, tasks = set(), []
+        for _, _, _, speaker, chunk, filename in multi_speaker_tts.dialogue_segments(dialogue, paths.tts_dir):
+            current.add(os.path.basename(filename))
+            if manifest.check(multi_speaker_tts.line_artifact(filename),
+                              **multi_speaker_tts.line_spec(speaker, chunk, filename)) is None:
+                continue
+            tasks.append(("tts", os.path.basename(filename),
+                          episode_payload(paths, speaker=speaker, chunk=chunk, filename=filename), None))
+        multi_speaker_tts.remove_stale_line_files(paths.tts_dir, current)
+        manifest.prune("tts", {f"tts/{name}" for name in current})
+        self.enqueue(task.job, tasks + [("merge", "episode", episode_payload(paths), "tts")])
+        print(f"🔹 [{task.job}] {len(current)} dialogue line file(s), {len(tasks)} to synthesize")
+        return {"lines": len(current), "queued": len(tasks)}
+
+    def merge(self, task, paths: EpisodePaths):
+        manifest = StageManifest(paths.manifest)
+        try:
+            for payload, _ in self.queue.results(task.job, "tts").values():
+                manifest.record(multi_speaker_tts.line_artifact(payload["filename"]), "tts",
+                                **multi_speaker_tts.line_spec(payload["speaker"], payload["chunk"], payload["filename"]))
+            multi_speaker_tts.merge_audio_chunks(str(paths.tts_dir), str(paths.merged_audio), manifest=manifest)
+        finally:
+            manifest.save()
+        print(f"🎉 [{task.job}] Done: {paths.merged_audio}")
+        return {"output": str(paths.merged_audio)}
+
+    # === PER-UNIT TASKS (any number at once, across processes) ===
+    def transcribe(self, task, paths: EpisodePaths):
+        utterances = assemblescript.transcribe_chunk(
+            self.services.backends.transcriber, task.payload["chunk_path"], self.services.transcription_limiter,
+            int(os.getenv("TRANSCRIPTION_MAX_RETRIES", "3")), float(os.getenv("TRANSCRIPTION_RETRY_DELAY", "5")),
+            self.services.transcription_cache, windows=self.windows, window_pool=self.window_pool)
+        return {"utterances": utterances}
+
+    def translate(self, task, paths: EpisodePaths):
+        idx, chunk = task.payload["idx"], task.payload["chunk"]
+        content = translate_chunks.translate_text(self.services.backends.openai_client, chunk, f"chunk {idx}",
+                                                  self.translation, rate_limiter=self.services.translation_limiter,
+                                                  hedging=self.services.translation_hedging)
+        if content is None:
+            raise RuntimeError(f"Gave up on chunk {idx} after {self.translation.max_retries} attempts")
+        translate_chunks.write_chunk_file(task.payload["out_file"], content)
+        if self.services.translation_memory is not None:
+            self.services.translation_memory.store_turn(chunk, content)
+        return {"characters": len(content)}
+
+    def tts(self, task, paths: EpisodePaths):
+        ok = multi_speaker_tts.synthesize_cached(
+            self.services.backends.tts_client, task.payload["speaker"], task.payload["chunk"],
+            task.payload["filename"], self.services.tts_cache, self.services.tts_limiter,
+            hedging=self.services.tts_hedging)
+        if not ok:
+            raise RuntimeError(f"Gave up on {os.path.basename(task.payload['filename'])}")
+        return {}
+
+    def close(self):
+        if self.window_pool is not None:
+            self.window_pool.shutdown()
+
+def work_loop(queue, handlers: TaskHandlers, owner: str, stages, lease_seconds: float, wait: bool):
+    """
+    Claim and run tasks until none is left (or forever with `wait`); returns how many ran
+    """
+    done = 0
+    while True:
+        task = queue.claim(owner, lease_seconds, stages)
+        if task is None:
+            if not wait and queue.open_tasks() == 0:
+                return done
+            # Other workers still hold tasks that may enqueue more
+            time.sleep(POLL_SECONDS * random.uniform(0.5, 1.5))
+            continue
+
+        print(f"🔧 [{owner}] {task} (attempt {task.attempts}/{task.max_attempts})")
+        try:
+            with queue.keep_alive(task, lease_seconds), span("queue", task.stage, job=task.job, key=task.key):
+                result = handlers.run(task)
+        except Exception as e:
+            state = queue.fail(task, f"{e.__class__.__name__}: {e}",
+                               float(os.getenv("WORK_QUEUE_RETRY_DELAY", "5")))
+            outcome = {"pending": "retry", "dead": "dead"}.get(state, "lost")
+            print(f"{'💀' if state == 'dead' else '⚠️'} [{owner}] {task} failed ({outcome}): {e}")
+            count("queue_tasks_total", stage=task.stage, outcome=outcome)
+            continue
+        if queue.complete(task, result):
+            done += 1
+            count("queue_tasks_total", stage=task.stage, outcome="done")
+        else:
+            # The lease ran out and another worker has the task now; it writes the same files
+            print(f"⚠️ [{owner}] Lost the lease on {task}; its result is dropped")
+            count("queue_tasks_total", stage=task.stage, outcome="lost")
+
+# === COMMANDS ===
+def enqueue_command(args, queue):
+    episodes = []
+    for path in args.inputs:
+        episodes.extend(find_episodes(path) if path.is_dir() else [path])
+    if not episodes:
+        raise FileNotFoundError(f"❌ No audio files ({', '.join(AUDIO_EXTENSIONS)}) in {args.inputs}")
+    streaming = os.getenv("PREPROCESS_STREAMING", "false").lower() == "true"
+    for audio in episodes:
+        paths = EpisodePaths(audio.resolve(), args.output_dir.resolve())
+        counts = queue.counts(paths.name)
+        if counts and queue.open_tasks(paths.name) == 0 and not queue.dead_letters(paths.name):
+            # Finished before: start over; the manifest skips whatever is still current
+            queue.forget(paths.name)
+        elif counts:
+            print(f"⏩ [{paths.name}] Already queued")
+            continue
+        queue.enqueue(paths.name, "preprocess", "episode", episode_payload(paths, streaming=streaming),
+                      max_attempts=int(os.getenv("WORK_QUEUE_MAX_ATTEMPTS", str(DEFAULT_MAX_ATTEMPTS))))
+        print(f"📥 [{paths.name}] Queued -> {paths.output_dir}")
+
+def work_command(args, queue):
+    backends = create_backends(args.fake, args.fake_latency, args.fake_cache_dir)
+    services = SharedServices(backends, workers_from_env(), open_caches(backends, cache_settings()))
+    handlers = TaskHandlers(queue, services)
+    lease_seconds = args.lease or float(os.getenv("WORK_QUEUE_LEASE_SEC", str(DEFAULT_LEASE_SECONDS)))
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    print(f"👷 Worker {owner}: {args.threads} thread(s), stages {', '.join(args.stages or STAGES)}, "
+          f"lease {lease_seconds:.0f}s")
+
+    start_run("queue")
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=args.threads) as pool:
+            futures = [pool.submit(work_loop, queue, handlers, f"{owner}:{n}", args.stages, lease_seconds, args.wait)
+                       for n in range(args.threads)]
+            done = sum(future.result() for future in futures)
+    finally:
+        handlers.close()
+        services.close()
+        finish_run()
+    print(f"⏱ {done} task(s) in {time.perf_counter() - start:.1f}s")
+    status_command(args, queue)
+
+def status_command(args, queue):
+    counts = queue.counts()
+    for job in sorted({job for job, _, _ in counts}):
+        cells = []
+        for stage in STAGES:
+            by_state = {state: counts.get((job, stage, state), 0) for state in STATES}
+            if any(by_state.values()):
+                cells.append(f"{stage} " + "/".join(str(by_state[state]) for state in STATES))
+        print(f"  {job:<36} " + ", ".join(cells))
+    for job, stage, key, attempts, error in queue.dead_letters():
+        print(f"  💀 {job}/{stage}/{key} after {attempts} attempt(s): {error}")
+    print(queue.summary() + " (per stage: pending/leased/done/dead)")
+
+def retry_dead_command(args, queue):
+    print(f"🔁 Requeued {queue.requeue_dead(args.job)} dead task(s)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the pipeline from a durable work queue shared by many workers")
+    parser.add_argument("--queue", help="Work queue URL (default: WORK_QUEUE_URL or test-output/queue)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    enqueue = commands.add_parser("enqueue", help="Queue episodes (audio files or directories of them)")
+    enqueue.add_argument("inputs", nargs="+", type=Path)
+    enqueue.add_argument("--output-dir", type=Path, default=DEFAULT_OUTPUT_DIR,
+                         help="One sub-directory per episode is created here")
+
+    work = commands.add_parser("work", help="Claim and run tasks until the queue is drained")
+    work.add_argument("--threads", type=int, default=int(os.getenv("WORK_QUEUE_THREADS", "4")),
+                      help="Tasks this process runs at once")
+    work.add_argument("--stages", nargs="+", choices=STAGES, help="Only claim tasks of these stages")
+    work.add_argument("--lease", type=float, help="Lease seconds (default: WORK_QUEUE_LEASE_SEC)")
+    work.add_argument("--wait", action="store_true", help="Keep polling for new work when the queue is drained")
+    work.add_argument("--fake", action="store_true", help="Use local fake AssemblyAI / OpenAI / TTS backends")
+    work.add_argument("--fake-latency", type=float, nargs=3, default=[2.0, 0.3, 0.2],
+                      metavar=("TRANSCRIBE", "TRANSLATE", "TTS"), help="Seconds per fake call")
+    work.add_argument("--fake-cache-dir", type=Path, default=DEFAULT_OUTPUT_DIR / "fake-cache")
+
+    commands.add_parser("status", help="Tasks per episode and stage, and the dead letters")
+    retry_dead = commands.add_parser("retry-dead", help="Give dead-lettered tasks another max_attempts")
+    retry_dead.add_argument("--job", help="Only this episode")
+    args = parser.parse_args()
+
+    queue = open_work_queue(args.queue)
+    try:
+        {"enqueue": enqueue_command, "work": work_command, "status": status_command,
+         "retry-dead": retry_dead_command}[args.command](args, queue)
+    finally:
+        queue.close()
+
+if __name__ == "__main__":
+    main()
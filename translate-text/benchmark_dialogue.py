@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Dialogue Parsing Benchmark
+- Times the previous merge / clean / TTS loading code (whole-file reads, per-stage regexes, `merged += line`)
+  against the streaming parser in pipeline-common/dialogue_format.py
+- clean: merged transcript file -> cleaned transcript file
+- chain: translated chunk files -> merge -> clean -> (speaker, text) records; the legacy chain writes both
+  intermediate files, the streaming chain none
+- Reports wall time, throughput (MB/s, turns/s) and peak Python memory (tracemalloc, measured on a second run)
+- Transcripts are synthetic: the sample Japanese turns in joe-charlie-aa-js/02-japanese-translation-text repeated
+  to the requested size, with every turn split into sentence lines and a chunk header every --turns-per-chunk turns
+
+Usage: python translate-text/benchmark_dialogue.py [--turns 10000 100000] [--lines-per-turn 8] [--skip-legacy-above 100000]
+"""
+
+import argparse
+import glob
+import os
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+SAMPLE_DIR = SCRIPT_DIR.parent / "joe-charlie-aa-js/02-japanese-translation-text"
+
+sys.path.insert(0, str(SCRIPT_DIR.parent / "pipeline-common"))
+from dialogue_format import merged_lines, parse_dialogue, write_dialogue
+
+# === LEGACY (the merge_chunks / clean_japanese_dialogue / load_dialogue_from_file code this replaces) ===
+def legacy_merge(chunk_paths, output_file):
+    with open(output_file, "w", encoding="utf-8") as out:
+        for chunk_path in chunk_paths:
+            with open(chunk_path, "r", encoding="utf-8") as f:
+                lines = f.read().splitlines()
+            out.write(f"\n\n=== TRANSLATION CHUNK {os.path.basename(chunk_path)} ===\n")
+            last_speaker = None
+            for line in lines:
+                match = re.match(r"^(Speaker [AB]):", line.strip())
+                if match:
+                    speaker = match.group(1)
+                    if last_speaker and speaker != last_speaker:
+                        out.write("\n\n")
+                    last_speaker = speaker
+                out.write(line + "\n")
+
+def legacy_clean(input_file, output_file) -> int:
+    with open(input_file, "r", encoding="utf-8") as f:
+        raw_text = f.read()
+    raw_text = raw_text.replace('\r\n', '\n').replace('\r', '\n')
+    raw_text = re.sub(r"^=== TRANSLATION CHUNK chunk_\d{3}\.txt ===\s*", "", raw_text, flags=re.MULTILINE)
+    raw_text = re.sub(r'[^\x20-\x7E\u3000-\u303F\u3040-\u309F\u30A0-\u30FF\u4E00-\u9FFF。、「」！？\sA-Za-z0-9:：]', '', raw_text)
+    cleaned_blocks = []
+    for block in re.split(r'(?=Speaker [A-Z][:：])', raw_text):
+        block = block.strip()
+        if not block:
+            continue
+        lines = block.splitlines()
+        merged = lines[0]
+        for line in lines[1:]:
+            merged += line.strip()
+        cleaned_blocks.append(merged)
+    with open(output_file, "w", encoding="utf-8") as f:
+        f.write("\n\n".join(cleaned_blocks))
+    return len(cleaned_blocks)
+
+def legacy_load(input_file):
+    dialogue = []
+    with open(input_file, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or ":" not in line:
+                continue
+            speaker, text = line.split(":", 1)
+            dialogue.append((speaker.strip(), text.strip()))
+    return dialogue
+
+# === SYNTHETIC INPUT ===
+def sample_turns():
+    turns = []
+    for path in sorted(glob.glob(str(SAMPLE_DIR / "transcript_ja_*.txt"))):
+        with open(path, "r", encoding="utf-8") as f:
+            turns.extend(turn for turn in parse_dialogue(f) if turn[0])
+    if not turns:
+        raise FileNotFoundError(f"❌ No sample transcripts in {SAMPLE_DIR}")
+    return turns
+
+def turn_lines(speaker, text, lines_per_turn: int):
+    sentences = [s for s in re.split(r"(?<=。)", text) if s]
+    step = max(1, -(-len(sentences) // lines_per_turn))
+    pieces = ["".join(sentences[i:i + step]) for i in range(0, len(sentences), step)]
+    return [f"{speaker}: {pieces[0]}"] + pieces[1:]
+
+def make_chunks(directory, turns: int, turns_per_chunk: int, lines_per_turn: int):
+    """
+    Translated chunk files like translate_chunks writes them, `turns` speaker turns in total
+    """
+    samples = sample_turns()
+    paths = []
+    for start in range(0, turns, turns_per_chunk):
+        path = os.path.join(directory, f"chunk_{len(paths) + 1:03}.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            for n in range(start, min(start + turns_per_chunk, turns)):
+                speaker, text = samples[n % len(samples)]
+                f.write("\n".join(turn_lines(speaker, text, lines_per_turn)) + "\n")
+        paths.append(path)
+    return paths
+
+# === RUNS ===
+def legacy_chain(chunk_paths, directory) -> int:
+    merged, cleaned = os.path.join(directory, "legacy_merged.txt"), os.path.join(directory, "legacy_clean.txt")
+    legacy_merge(chunk_paths, merged)
+    legacy_clean(merged, cleaned)
+    return len(legacy_load(cleaned))
+
+def streaming_chain(chunk_paths, directory) -> int:
+    return sum(1 for speaker, _ in parse_dialogue(merged_lines(chunk_paths)) if speaker)
+
+def streaming_clean(input_file, output_file) -> int:
+    with open(input_file, "r", encoding="utf-8") as f:
+        return write_dialogue(parse_dialogue(f), output_file)
+
+def measure(label: str, run, *args, size_mb: float):
+    start = time.perf_counter()
+    turns = run(*args)
+    elapsed = time.perf_counter() - start
+    # Peak memory from a second run: tracemalloc slows down code that allocates many small objects
+    tracemalloc.start()
+    run(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"  {label:<16} {elapsed:8.2f}s  {size_mb / max(elapsed, 1e-9):8.1f} MB/s  "
+          f"{turns / max(elapsed, 1e-9):10.0f} turns/s  peak {peak / 1024 / 1024:8.1f} MB  ({turns} turns)")
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the legacy dialogue merge/clean/load code vs the streaming parser")
+    parser.add_argument("--turns", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--turns-per-chunk", type=int, default=20)
+    parser.add_argument("--lines-per-turn", type=int, default=8, help="Sentence lines each turn is split into")
+    parser.add_argument("--skip-legacy-above", type=int, default=100000,
+                        help="Only run the legacy code up to this many turns")
+    args = parser.parse_args()
+
+    for turns in args.turns:
+        with tempfile.TemporaryDirectory() as directory:
+            chunk_paths = make_chunks(directory, turns, args.turns_per_chunk, args.lines_per_turn)
+            merged = os.path.join(directory, "merged.txt")
+            legacy_merge(chunk_paths, merged)
+            chunk_mb = sum(os.path.getsize(p) for p in chunk_paths) / 1024 / 1024
+            merged_mb = os.path.getsize(merged) / 1024 / 1024
+            print(f"\n📝 {turns} turns in {len(chunk_paths)} chunk files ({chunk_mb:.1f} MB)")
+
+            streaming_time = measure("clean streaming", streaming_clean, merged,
+                                     os.path.join(directory, "clean.txt"), size_mb=merged_mb)
+            if turns <= args.skip_legacy_above:
+                legacy_time = measure("clean legacy", legacy_clean, merged,
+                                      os.path.join(directory, "legacy_clean.txt"), size_mb=merged_mb)
+                print(f"  clean: streaming vs legacy x{legacy_time / max(streaming_time, 1e-9):.1f}")
+
+            streaming_time = measure("chain streaming", streaming_chain, chunk_paths, directory, size_mb=chunk_mb)
+            if turns > args.skip_legacy_above:
+                print("  legacy           skipped")
+                continue
+            legacy_time = measure("chain legacy", legacy_chain, chunk_paths, directory, size_mb=chunk_mb)
+            print(f"  chain: streaming vs legacy x{legacy_time / max(streaming_time, 1e-9):.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,14 @@
-import re
+import argparse
 import os
+import sys
 from pathlib import Path
 
 # === CONFIGURATION ===
 SCRIPT_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(SCRIPT_DIR.parent / "pipeline-common"))
+from dialogue_format import parse_dialogue, write_dialogue
+from stage_manifest import StageManifest, open_manifest
+
 input_path = SCRIPT_DIR.parent / "joe-charlie-aa-js/test-output/JP-text-translation/JP-joe-charlie-first-5-minutes.txt"
 output_path = SCRIPT_DIR.parent / "joe-charlie-aa-js/test-output/JP-text-translation/clean-JP-joe-charlie-first-5-minutes.txt"
 
@@ -12,53 +17,40 @@ def clean_japanese_dialogue(input_path, output_path):
         print(f"❌ File not found: {input_path}")
         return
 
-    # Read raw input
+    # One streaming pass: chunk headers and unspeakable characters go, each speaker turn becomes one line
     with open(input_path, "r", encoding="utf-8") as f:
-        raw_text = f.read()
-
-    # Normalize line endings
-    raw_text = raw_text.replace('\r\n', '\n').replace('\r', '\n')
-    # Remove all chunk header lines like "=== TRANSLATION CHUNK chunk_006.txt ==="
-    raw_text = re.sub(r"^=== TRANSLATION CHUNK chunk_\d{3}\.txt ===\s*", "", raw_text, flags=re.MULTILINE)
-
-    # Remove non-printable or problematic characters (safe for TTS)
-    raw_text = re.sub(r'[^\x20-\x7E\u3000-\u303F\u3040-\u309F\u30A0-\u30FF\u4E00-\u9FFF。、「」！？\sA-Za-z0-9:：]', '', raw_text)
-
-    # Split into speaker blocks, allowing both full-width and half-width colons
-    speaker_blocks = re.split(r'(?=Speaker [A-Z][:：])', raw_text)
-    cleaned_blocks = []
-
-    for block in speaker_blocks:
-        block = block.strip()
-        if not block:
-            continue
-
-        # Merge lines inside each speaker's block
-        lines = block.splitlines()
-        merged = lines[0]  # Keep the speaker tag + first line
-        for line in lines[1:]:
-            merged += line.strip()  # Remove internal newlines
-        cleaned_blocks.append(merged)
-
-    if not cleaned_blocks:
+        block_count = write_dialogue(parse_dialogue(f), output_path)
+    if not block_count:
         print("⚠️ No speaker blocks found. Check your input file formatting.")
         return
 
-    # Join with two line breaks between speakers
-    final_output = "\n\n".join(cleaned_blocks)
-
-    # Save to output file
-    with open(output_path, "w", encoding="utf-8") as f:
-        f.write(final_output)
-
-    print(f"✅ Cleaned {len(cleaned_blocks)} speaker blocks.")
+    print(f"✅ Cleaned {block_count} speaker blocks.")
     print(f"📄 Saved to: {output_path}")
 
-# Run the function
-clean_japanese_dialogue(input_path, output_path)
+def run_stage(manifest: StageManifest, input_file=input_path, output_file=output_path):
+    spec = {"inputs": [input_file], "outputs": [output_file]}
+    reason = manifest.check("clean", **spec)
+    if reason is None:
+        print(f"✅ {output_file} is up to date. Skipping.")
+        return
+    if manifest.dry_run:
+        return
+    clean_japanese_dialogue(input_file, output_file)
+    if os.path.exists(output_file):
+        manifest.record("clean", "clean", **spec)
 
 def main():
-    clean_japanese_dialogue(input_path, output_path)
+    parser = argparse.ArgumentParser(description="Clean the merged Japanese transcript for TTS")
+    parser.add_argument("--plan", action="store_true", help="List what would be rebuilt without running anything")
+    args = parser.parse_args()
+
+    manifest = open_manifest(dry_run=args.plan)
+    try:
+        run_stage(manifest)
+    finally:
+        manifest.save()
+    if args.plan:
+        manifest.print_plan()
 
 if __name__ == "__main__":
     main()
@@ -1,36 +1,47 @@
+import argparse
 import os
-import re
+import sys
 from pathlib import Path
 
 # === CONFIGURATION ===
 SCRIPT_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(SCRIPT_DIR.parent / "pipeline-common"))
+from dialogue_format import merged_lines
+from stage_manifest import StageManifest, open_manifest
+
 CHUNK_DIR = SCRIPT_DIR.parent / "joe-charlie-aa-js/test-output/JP-text-translation/chunks"
 MERGED_JP_OUTPUT_FILE = SCRIPT_DIR.parent / "joe-charlie-aa-js/test-output/JP-text-translation/JP-joe-charlie-first-5-minutes.txt"
 
-def main():
-    chunk_files = sorted(f for f in os.listdir(CHUNK_DIR) if f.startswith("chunk_") and f.endswith(".txt"))
-
-    with open(MERGED_JP_OUTPUT_FILE, "w", encoding="utf-8") as out:
-        for chunk_file in chunk_files:
-            chunk_path = os.path.join(CHUNK_DIR, chunk_file)
-            with open(chunk_path, "r", encoding="utf-8") as f:
-                lines = f.read().splitlines()
+def run_stage(manifest: StageManifest, chunk_dir=CHUNK_DIR, output_file=MERGED_JP_OUTPUT_FILE):
+    chunk_files = sorted(f for f in os.listdir(chunk_dir) if f.startswith("chunk_") and f.endswith(".txt")) \
+        if os.path.isdir(chunk_dir) else []
+    spec = {"inputs": [os.path.join(chunk_dir, f) for f in chunk_files], "outputs": [output_file]}
+    reason = manifest.check("merge", **spec)
+    if reason is None:
+        print(f"✅ {output_file} is up to date. Skipping.")
+        return
+    if manifest.dry_run:
+        return
 
-            # Optional: mark chunk boundary
-            out.write(f"\n\n=== TRANSLATION CHUNK {chunk_file} ===\n")
+    # Streamed line by line: a chunk header, then the chunk with two line breaks between speaker switches
+    with open(output_file, "w", encoding="utf-8") as out:
+        out.writelines(line + "\n" for line in merged_lines(spec["inputs"]))
 
-            last_speaker = None
-            for line in lines:
-                match = re.match(r"^(Speaker [AB]):", line.strip())
-                if match:
-                    speaker = match.group(1)
-                    if last_speaker and speaker != last_speaker:
-                        out.write("\n\n")  # 🔸 Insert two line breaks between speaker switches
-                    last_speaker = speaker
+    print(f"✅ Merged {len(chunk_files)} chunks into {output_file} with double line breaks between speakers.")
+    manifest.record("merge", "merge", **spec)
 
-                out.write(line + "\n")
-
-    print(f"✅ Merged {len(chunk_files)} chunks into {MERGED_JP_OUTPUT_FILE} with double line breaks between speakers.")
+def main():
+    parser = argparse.ArgumentParser(description="Merge the translated chunk files into one transcript")
+    parser.add_argument("--plan", action="store_true", help="List what would be rebuilt without running anything")
+    args = parser.parse_args()
+
+    manifest = open_manifest(dry_run=args.plan)
+    try:
+        run_stage(manifest)
+    finally:
+        manifest.save()
+    if args.plan:
+        manifest.print_plan()
 
 if __name__ == "__main__":
     main()
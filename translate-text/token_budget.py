@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Token-budget request packing for translation
+- Local token estimate (no tokenizer download, no API call)
+- Packs consecutive speaker turns into one request up to a token budget
+- Validates that a packed response has the same speaker lines, in the same order, before splitting it back
+- Speaker lines are recognized by pipeline-common/dialogue_format.py, like everywhere else in the pipeline
+"""
+
+from dialogue_format import normalize_tags, speaker_of
+
+class PackValidationError(ValueError):
+    pass
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough BPE token count: ~4 characters per token for ASCII, ~1 token per character for Japanese/CJK
+    """
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return (ascii_chars + 3) // 4 + (len(text) - ascii_chars)
+
+def speaker_labels(text: str):
+    return [speaker for speaker in map(speaker_of, text.splitlines()) if speaker]
+
+def pack_turns(turns, token_budget: int, indexes=None):
+    """
+    Group consecutive turns into packs whose estimated tokens stay within token_budget.
+    `indexes` are the turn numbers (default 1..n); a gap in them (e.g. an already translated turn) starts a new pack.
+    A single turn larger than the budget gets a pack of its own. Returns lists of (index, turn) pairs.
+    """
+    indexes = list(indexes) if indexes is not None else list(range(1, len(turns) + 1))
+    packs = []
+    current, current_tokens, previous_index = [], 0, None
+
+    for index, turn in zip(indexes, turns):
+        tokens = estimate_tokens(turn)
+        contiguous = previous_index is not None and index == previous_index + 1
+        if current and (not contiguous or current_tokens + tokens > token_budget):
+            packs.append(current)
+            current, current_tokens = [], 0
+        current.append((index, turn))
+        current_tokens += tokens
+        previous_index = index
+
+    if current:
+        packs.append(current)
+    return packs
+
+def join_pack(pack) -> str:
+    return "\n".join(turn for _, turn in pack)
+
+def split_packed_response(response: str, expected_labels):
+    """
+    Split a packed translation back into one text per turn. The speaker lines of the response must match
+    expected_labels exactly (same count, same order); otherwise PackValidationError is raised.
+    Label variants (話者A, SpeakerA, full-width colons) are normalized before the check.
+    """
+    parts = []
+    for line in normalize_tags(response).splitlines():
+        if speaker_of(line):
+            parts.append([line])
+        elif parts:
+            parts[-1].append(line)
+        elif line.strip():
+            raise PackValidationError(f"Text before the first speaker label: {line.strip()[:40]!r}")
+
+    labels = [speaker_of(part[0]) for part in parts]
+    if labels != list(expected_labels):
+        raise PackValidationError(
+            f"Expected {len(expected_labels)} speaker lines {list(expected_labels)}, got {len(labels)} {labels}"
+        )
+    return ["\n".join(part).strip() for part in parts]
@@ -1,6 +1,12 @@
+import argparse
+import hashlib
+import json
 import os
 import re
+import sys
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 from pathlib import Path
 from openai import OpenAI
@@ -9,183 +15,579 @@ import textwrap
 # === CONFIGURATION ===
 SCRIPT_DIR = Path(__file__).resolve().parent
 INPUT_FILE = SCRIPT_DIR.parent / "joe-charlie-aa-js/test-output/EN-audio-text-output/joe-charlie-first-5-minutes.txt"
+CHUNK_DIR = SCRIPT_DIR.parent / "joe-charlie-aa-js/test-output/JP-text-translation/chunks"
 
-def main():
-    # === CONSTANTS USED THROUGHOUT ===
-    SPEAKER_IDS = ["A", "B", "C", "D", "E"]
-    speaker_pattern = "|".join([f"Speaker {s}" for s in SPEAKER_IDS])
+sys.path.insert(0, str(SCRIPT_DIR.parent / "pipeline-common"))
+from rate_limit import AdaptiveConcurrency, TokenBucket
+from hedging import HedgingPolicy
+from retry import is_overload_error, jittered_backoff, retry_after_seconds
+from token_budget import PackValidationError, estimate_tokens, join_pack, pack_turns, speaker_labels, split_packed_response
+from translation_memory import TRANSLATION_MEMORY_PATH, TranslationMemory
+from dialogue_format import normalize_tags, separate_speakers, speaker_of
+from utterance_index import (Selection, UtteranceIndex, add_selection_arguments, chunks_for_lines, index_path_for,
+                             save_chunk_lines, selection_from_args)
+from stage_manifest import StageManifest, open_manifest
+from metrics import count, finish_run, span, start_run
 
-    # === SETUP ===
-    # Load .env from parent of current file
-    env_path = Path(__file__).resolve().parent.parent / ".env"
-    load_dotenv(dotenv_path=env_path)
+# === CONSTANTS USED THROUGHOUT ===
+ENABLE_TAG_NORMALIZATION = True
 
-    OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-    CHUNK_DIR = SCRIPT_DIR.parent / "joe-charlie-aa-js/test-output/JP-text-translation/chunks"
-    TRANSLATION_CHUNK_WIDTH = int(os.getenv("TRANSLATION_CHUNK_WIDTH", "3000"))
-    TRANSLATION_MAX_RETRIES = int(os.getenv("TRANSLATION_MAX_RETRIES", "4"))
-    OPENAI_MODEL_NAME = os.getenv("OPENAI_MODEL_NAME")
-    ENABLE_TAG_NORMALIZATION = True
-    OPENAI_TEMPERATURE = float(os.getenv("OPENAI_TEMPERATURE", "0.3"))
-    TRANSLATION_RETRY_DELAY = float(os.getenv("TRANSLATION_RETRY_DELAY", "5"))
-    TRANSLATION_RATE_LIMIT_DELAY = float(os.getenv("TRANSLATION_RATE_LIMIT_DELAY", "1"))
-    
-    print(f"🔍 Model: {OPENAI_MODEL_NAME}, Chunk width: {TRANSLATION_CHUNK_WIDTH}, Retries: {TRANSLATION_MAX_RETRIES}")
-    
-    if not OPENAI_API_KEY or not OPENAI_MODEL_NAME or not INPUT_FILE:
-        raise RuntimeError("❌ Missing required environment variables (OPENAI_API_KEY, OPENAI_MODEL_NAME, English_Text)")
+SYSTEM_PROMPT = textwrap.dedent("""\
+    This is the well-known Joe and Charlie's AA workshop conversation.
+    You are a professional translator. Translate the following English dialogue into natural, sincere spoken Japanese, as if it were a respectful and heartfelt conversation between two older men.
+    The tone should feel like a mature discussion between two lifelong friends or seasoned individuals — warm, humble, and spoken, yet carrying dignity and emotional depth.
+    Avoid stiff or formal language. Use natural phrasing that fits a spoken tone, suitable for an audiobook, podcast, or sincere AA talk.
+    Use 私 instead of 俺. Translate 'sobriety' as ソーバー (not 清酒). Translate ALCOHOLICS ANONYMOUS as アルコホーリクス・アノニマス. Translate Big Book as ビッグブック.
+    Do not change or translate the speaker labels — keep 'Speaker A:' and 'Speaker B:' exactly as they are.
+    Do not use labels like '話者', 'スピーカー', or 'Speaker 1/2'.
+    Translate ALL English into natural spoken Japanese. Do not leave any part in English. Even if the sentence sounds like a quote, a slogan, or an AA motto, translate it. Do not preserve any English phrases. Keep the speaker labels exactly as they are (e.g., 'Speaker A:', 'Speaker B:').
+    Do not add or infer speaker tags if they are missing. Keep all line breaks and structure as-is.
+""")
 
-    client = OpenAI(api_key=OPENAI_API_KEY)
-    os.makedirs(CHUNK_DIR, exist_ok=True)
-
-    def is_speaker_line(line):
-        return bool(re.match(r"^Speaker [A-Z]:", line.strip()))
-
-    def split_long_block(block_lines, max_chars):
-        if not block_lines:
-            return []
-        header_match = re.match(r"^(Speaker [A-Z]:)", block_lines[0].strip())
-        speaker_label = header_match.group(1) if header_match else "Speaker X:"
-        content = "\n".join(block_lines)
-        sentences = re.split(r'(?<=[.?!])\s+', content)
-        chunks = []
-        current_chunk = speaker_label + " "
-        for sentence in sentences:
-            if len(current_chunk) + len(sentence) > max_chars:
-                chunks.append(current_chunk.strip())
-                current_chunk = speaker_label + " " + sentence
-            else:
-                current_chunk += sentence
-        if current_chunk:
-            chunks.append(current_chunk.strip())
-        return chunks
+def is_speaker_line(line):
+    return speaker_of(line) is not None
 
-    # === STEP 1: Speaker-aware chunking ===
-    with open(INPUT_FILE, "r", encoding="utf-8") as f:
-        lines = f.read().splitlines()
+def split_long_block(block_lines, max_chars):
+    if not block_lines:
+        return []
+    speaker = speaker_of(block_lines[0])
+    speaker_label = f"{speaker}:" if speaker else "Speaker X:"
+    content = "\n".join(block_lines)
+    sentences = re.split(r'(?<=[.?!])\s+', content)
+    chunks = []
+    current_chunk = speaker_label + " "
+    for sentence in sentences:
+        if len(current_chunk) + len(sentence) > max_chars:
+            chunks.append(current_chunk.strip())
+            current_chunk = speaker_label + " " + sentence
+        else:
+            current_chunk += sentence
+    if current_chunk:
+        chunks.append(current_chunk.strip())
+    return chunks
 
+def build_speaker_chunks(lines, chunk_width, spans=None):
+    """
+    Speaker-aware chunking: one chunk per speaker turn, long turns split on sentence boundaries.
+    With a `spans` list, the (first, last) input line of every chunk is appended to it.
+    """
     if not is_speaker_line(lines[0]):
         print("⚠️ First line is missing a speaker label. Assuming 'Speaker B:'")
         lines[0] = f"Speaker B: {lines[0]}"
 
     chunks = []
     current_block = []
+    block_start = 0
 
-    for line in lines:
+    def flush_block():
+        block_text = "\n".join(current_block)
+        if len(block_text) > chunk_width:
+            sub_blocks = split_long_block(current_block, chunk_width)
+            chunks.extend(sub_blocks)
+        else:
+            sub_blocks = [block_text]
+            chunks.append(block_text)
+        if spans is not None:
+            # Sentences are not tracked back to lines: every part of a split turn spans the whole turn
+            spans.extend([(block_start, block_start + len(current_block) - 1)] * len(sub_blocks))
+
+    for line_number, line in enumerate(lines):
         if is_speaker_line(line):
             if current_block:
-                block_text = "\n".join(current_block)
-                if len(block_text) > TRANSLATION_CHUNK_WIDTH:
-                    sub_blocks = split_long_block(current_block, TRANSLATION_CHUNK_WIDTH)
-                    chunks.extend(sub_blocks)
-                else:
-                    chunks.append(block_text)
+                flush_block()
                 current_block.clear()
+            block_start = line_number
         current_block.append(line)
 
     if current_block:
-        block_text = "\n".join(current_block)
-        if len(block_text) > TRANSLATION_CHUNK_WIDTH:
-            sub_blocks = split_long_block(current_block, TRANSLATION_CHUNK_WIDTH)
-            chunks.extend(sub_blocks)
-        else:
-            chunks.append(block_text)
+        flush_block()
 
-    print(f"🔹 Total speaker-safe chunks: {len(chunks)}")
+    return chunks
 
-    # === STEP 2: Translate and save each chunk ===
+def build_messages(chunk):
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": chunk},
+    ]
+
+def normalize_speaker_tags(content):
+    #  the “Speaker” lable (who is speaking) is already determined earlier in  the chunking process.
+    #   and what this block does is normalize or correct the speaker labels to match your expected format.
+    return "\n".join(separate_speakers(normalize_tags(content).splitlines()))
+
+def write_chunk_file(out_file, content):
+    # Write to a temp file first so an interrupted run never leaves a half-written chunk that resume would skip
+    temp_file = f"{out_file}.tmp"
+    with open(temp_file, "w", encoding="utf-8") as f:
+        f.write(content)
+    os.replace(temp_file, out_file)
+
+def chunk_artifact(idx) -> str:
+    return f"translate/chunk_{idx:03}"
+
+def translation_spec(chunk, out_file, settings, source_file=INPUT_FILE) -> dict:
+    """
+    Manifest inputs of one chunk file: the chunk's source text plus everything that shapes its translation.
+    Retry, concurrency, packing and memory settings are left out: they change how, not what, is translated.
+    source_file (the English transcript the chunk came from) only matters to plan mode.
+    """
+    return {
+        "content": chunk,
+        "config": {"prompt": SYSTEM_PROMPT, "model": settings.model, "temperature": settings.temperature,
+                   "normalize_tags": ENABLE_TAG_NORMALIZATION},
+        "outputs": [out_file],
+        "upstream": [source_file],
+    }
+
+def chunk_is_current(idx, chunk, out_file, settings, manifest: StageManifest = None, source_file=INPUT_FILE) -> bool:
+    """
+    Without a manifest, an existing chunk file counts as done; with one, it must also match the current
+    source text and settings
+    """
+    if manifest is None:
+        return os.path.exists(out_file)
+    return manifest.check(chunk_artifact(idx), **translation_spec(chunk, out_file, settings, source_file)) is None
+
+def record_chunk(manifest: StageManifest, idx, chunk, out_file, settings):
+    if manifest is not None:
+        manifest.record(chunk_artifact(idx), "translate", **translation_spec(chunk, out_file, settings))
+
+def remove_stale_chunk_files(chunks, chunk_dir, manifest: StageManifest):
+    """
+    chunk_NNN.txt files past the last chunk of the current transcript would otherwise end up in the merge
+    """
+    manifest.prune("translate", {chunk_artifact(idx) for idx in range(1, len(chunks) + 1)})
+    if manifest.dry_run or not os.path.isdir(chunk_dir):
+        return
+    for name in os.listdir(chunk_dir):
+        match = re.match(r"^chunk_(\d{3})\.txt$", name)
+        if match and int(match.group(1)) > len(chunks):
+            os.remove(os.path.join(chunk_dir, name))
+            print(f"🗑 Removed {name} (past the end of the current transcript)")
+
+class TranslationSettings:
+    """
+    Model and retry settings shared by every translation worker
+    """
+    def __init__(self, model, temperature, max_retries, retry_delay, request_timeout=None):
+        self.model = model
+        self.temperature = temperature
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.request_timeout = request_timeout
+
+def translate_text(client, chunk, label, settings: TranslationSettings, concurrency: AdaptiveConcurrency = None,
+                   rate_limiter: TokenBucket = None, hedging: HedgingPolicy = None):
+    """
+    Translate one speaker-tagged chunk. 429s and timeouts shrink the shared concurrency limit and honor
+    Retry-After; every retry waits a jittered exponential backoff. Returns None after the last failed attempt.
+    With a hedging policy, a request slower than the recent p95 gets a duplicate and the first answer wins.
+    """
+    concurrency = concurrency or AdaptiveConcurrency(maximum=1)
+    rate_limiter = rate_limiter or TokenBucket()
+    messages = build_messages(chunk)
+
+    request_bytes = sum(len(message["content"].encode("utf-8")) for message in messages)
+
+    for attempt in range(1, settings.max_retries + 1):
+        try:
+            with concurrency:
+                rate_limiter.acquire()
+                with span("translate", "api_call", label=label, attempt=attempt, request_bytes=request_bytes) as call:
+                    def request():
+                        return client.chat.completions.create(
+                            model=settings.model,
+                            messages=messages,
+                            temperature=settings.temperature,
+                            timeout=settings.request_timeout,
+                        )
+                    response = hedging.call(request, rate_limiter, concurrency) if hedging is not None else request()
+                    content = response.choices[0].message.content.strip()
+                    usage = getattr(response, "usage", None)
+                    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+                    completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+                    call.set(response_bytes=len(content.encode("utf-8")), prompt_tokens=prompt_tokens,
+                             completion_tokens=completion_tokens)
+                    if not content:
+                        raise ValueError("Empty response.")
+            count("request_bytes_total", request_bytes, stage="translate")
+            count("response_bytes_total", len(content.encode("utf-8")), stage="translate")
+            count("openai_tokens_total", prompt_tokens, stage="translate", kind="prompt")
+            count("openai_tokens_total", completion_tokens, stage="translate", kind="completion")
+            concurrency.on_success()
+
+            if ENABLE_TAG_NORMALIZATION:
+                content = normalize_speaker_tags(content)
+            return content
+
+        except Exception as e:
+            print(f"❌ Attempt {attempt}/{settings.max_retries} failed on {label}: {e}")
+            if attempt == settings.max_retries:
+                print(f"💥 Giving up on {label}")
+                return None
+
+            count("retries_total", stage="translate")
+            delay = jittered_backoff(attempt, settings.retry_delay)
+            if is_overload_error(e):
+                concurrency.on_throttle()
+                delay = max(delay, retry_after_seconds(e) or 0)
+                print(f"🐢 Throttled — concurrency limit now {int(concurrency.limit)}")
+            print(f"⏳ Waiting {delay:.1f} seconds before retrying...")
+            time.sleep(delay)
+
+def translate_chunks(client, chunks, chunk_dir, settings: TranslationSettings, workers: int = 1,
+                     rate_limiter: TokenBucket = None, token_budget: int = 0, memory: TranslationMemory = None,
+                     manifest: StageManifest = None, selected=None, hedging: HedgingPolicy = None):
+    """
+    Translate every chunk that has no chunk_NNN.txt yet (with a manifest: no up-to-date chunk_NNN.txt),
+    with up to `workers` requests in flight. With `selected` (chunk numbers), exactly those chunks are
+    translated again, bypassing the translation memory, and all others are left alone.
+    The actual concurrency adapts (AIMD) between 1 and `workers`. With a token_budget, consecutive turns
+    are packed into one request and the validated response is split back into per-turn files.
+    Turns found in the translation memory are written without any request, and new translations are added to it.
+    With a hedging policy, slow requests are duplicated within its budget (see pipeline-common/hedging.py).
+    Returns the indexes that failed.
+    """
+    os.makedirs(chunk_dir, exist_ok=True)
+    concurrency = AdaptiveConcurrency(initial=1, maximum=max(1, workers))
+    rate_limiter = rate_limiter or TokenBucket()
+    print_lock = threading.Lock()
+
+    pending = []
     for idx, chunk in enumerate(chunks, start=1):
-        out_file = os.path.join(CHUNK_DIR, f"chunk_{idx:03}.txt")
-        if os.path.exists(out_file):
+        out_file = os.path.join(chunk_dir, f"chunk_{idx:03}.txt")
+        if selected is not None:
+            if idx not in selected:
+                continue
+        elif chunk_is_current(idx, chunk, out_file, settings, manifest):
             print(f"✅ Chunk {idx:03} already exists. Skipping.")
             continue
+        if not is_speaker_line(chunk):
+            raise ValueError(f"❌ Chunk {idx} is missing a speaker tag at the top.")
+        if memory is not None and selected is None:
+            remembered = memory.translate_turn(chunk)
+            if remembered is not None:
+                write_chunk_file(out_file, remembered)
+                record_chunk(manifest, idx, chunk, out_file, settings)
+                print(f"🧠 Chunk {idx:03} served from translation memory.")
+                continue
+        pending.append((idx, chunk, out_file))
 
-        print(f"🔁 Translating chunk {idx}/{len(chunks)}...")
+    def translate_one(idx, chunk, out_file):
+        with print_lock:
+            print(f"🔁 Translating chunk {idx}/{len(chunks)}...")
+        with span("translate", "chunk", chunk=idx, characters=len(chunk)) as chunk_span:
+            content = translate_text(client, chunk, f"chunk {idx}", settings, concurrency, rate_limiter, hedging)
+            if content is None:
+                chunk_span.fail("GaveUp")
+        if content is None:
+            return [idx]
+        # Save successful translation
+        write_chunk_file(out_file, content)
+        record_chunk(manifest, idx, chunk, out_file, settings)
+        if memory is not None:
+            memory.store_turn(chunk, content)
+        with print_lock:
+            print(f"✅ Saved: {out_file}")
+        return []
 
-        if not re.match(r"^Speaker [A-Z]:", chunk.strip()):
-            raise ValueError(f"❌ Chunk {idx} is missing a speaker tag at the top.")
+    def translate_pack(pack):
+        if len(pack) == 1:
+            return translate_one(*pack[0])
+
+        first, last = pack[0][0], pack[-1][0]
+        with print_lock:
+            print(f"🔁 Translating chunks {first}-{last}/{len(chunks)} in one request...")
+        request = join_pack([(idx, chunk) for idx, chunk, _ in pack])
+        with span("translate", "pack", chunks=f"{first}-{last}", turns=len(pack), characters=len(request)) as pack_span:
+            content = translate_text(client, request, f"chunks {first}-{last}", settings, concurrency, rate_limiter,
+                                     hedging)
+            try:
+                if content is None:
+                    raise PackValidationError("no response")
+                turns = split_packed_response(content, speaker_labels(request))
+            except PackValidationError as e:
+                pack_span.fail(e)
+                turns, rejection = None, e
+        if turns is None:
+            # The model merged, dropped or relabeled a turn: translate this pack turn by turn instead
+            with print_lock:
+                print(f"⚠️ Packed response for chunks {first}-{last} rejected ({rejection}); retrying turn by turn.")
+            return [failed_idx for job in pack for failed_idx in translate_one(*job)]
+
+        for (idx, chunk, out_file), turn in zip(pack, turns):
+            content = normalize_speaker_tags(turn) if ENABLE_TAG_NORMALIZATION else turn
+            write_chunk_file(out_file, content)
+            record_chunk(manifest, idx, chunk, out_file, settings)
+            if memory is not None:
+                memory.store_turn(chunk, content)
+        with print_lock:
+            print(f"✅ Saved chunks {first}-{last}")
+        return []
+
+    if token_budget > 0:
+        packs = pack_turns([chunk for _, chunk, _ in pending], token_budget, [idx for idx, _, _ in pending])
+        jobs_by_index = {job[0]: job for job in pending}
+        units = [[jobs_by_index[idx] for idx, _ in pack] for pack in packs]
+        saved_tokens = (len(pending) - len(units)) * estimate_tokens(SYSTEM_PROMPT)
+        print(f"📦 Packed {len(pending)} turns into {len(units)} requests "
+              f"(budget {token_budget} tokens, ~{saved_tokens} system-prompt tokens saved)")
+    else:
+        units = [[job] for job in pending]
+
+    failed = []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = [pool.submit(translate_pack, unit) for unit in units]
+        for future in as_completed(futures):
+            failed.extend(future.result())
+
+    print(f"📊 Concurrency limit ended at {int(concurrency.limit)} "
+          f"({concurrency.increases} increases, {concurrency.decreases} decreases)")
+    if memory is not None:
+        print(memory.summary())
+    if hedging is not None:
+        print(hedging.summary())
+    if failed:
+        print(f"⚠️ {len(failed)} chunk(s) failed: {sorted(failed)}. Re-run to retry them.")
+    return sorted(failed)
+
+class BatchResultError(ValueError):
+    pass
+
+def batch_custom_id(idx, chunk, settings: TranslationSettings) -> str:
+    """
+    Stable ID for one chunk request: its number plus a hash of everything that shapes the translation,
+    so results from another transcript, prompt, model or temperature are rejected on ingest
+    """
+    digest = hashlib.sha256(
+        f"{SYSTEM_PROMPT}|{settings.model}|{settings.temperature}|{chunk}".encode("utf-8")
+    ).hexdigest()[:8]
+    return f"chunk_{idx:03}-{digest}"
 
-        messages = [
-            {
-                "role": "system",
-                "content": textwrap.dedent("""\
-                    This is the well-known Joe and Charlie's AA workshop conversation.
-                    You are a professional translator. Translate the following English dialogue into natural, sincere spoken Japanese, as if it were a respectful and heartfelt conversation between two older men. 
-                    The tone should feel like a mature discussion between two lifelong friends or seasoned individuals — warm, humble, and spoken, yet carrying dignity and emotional depth. 
-                    Avoid stiff or formal language. Use natural phrasing that fits a spoken tone, suitable for an audiobook, podcast, or sincere AA talk. 
-                    Use 私 instead of 俺. Translate 'sobriety' as ソーバー (not 清酒). Translate ALCOHOLICS ANONYMOUS as アルコホーリクス・アノニマス. Translate Big Book as ビッグブック. 
-                    Do not change or translate the speaker labels — keep 'Speaker A:' and 'Speaker B:' exactly as they are. 
-                    Do not use labels like '話者', 'スピーカー', or 'Speaker 1/2'. 
-                    Translate ALL English into natural spoken Japanese. Do not leave any part in English. Even if the sentence sounds like a quote, a slogan, or an AA motto, translate it. Do not preserve any English phrases. Keep the speaker labels exactly as they are (e.g., 'Speaker A:', 'Speaker B:').
-                    Do not add or infer speaker tags if they are missing. Keep all line breaks and structure as-is.
-                """)
-            },
-            {
-                "role": "user",
-                "content": chunk
+def pending_chunks(chunks, chunk_dir, settings: TranslationSettings = None, manifest: StageManifest = None,
+                   source_file=INPUT_FILE):
+    for idx, chunk in enumerate(chunks, start=1):
+        out_file = os.path.join(chunk_dir, f"chunk_{idx:03}.txt")
+        if not chunk_is_current(idx, chunk, out_file, settings, manifest, source_file):
+            yield idx, chunk, out_file
+
+def write_batch_requests(chunks, chunk_dir, settings: TranslationSettings, batch_file,
+                         manifest: StageManifest = None, memory: TranslationMemory = None) -> int:
+    """
+    Batch mode, first half: write every chunk without a chunk_NNN.txt as one request line of an
+    OpenAI Batch API JSONL file (same system prompt and temperature as the interactive path).
+    Chunks the translation memory already knows are written straight to chunk_NNN.txt and get no request.
+    """
+    written = 0
+    remembered_count = 0
+    os.makedirs(os.path.dirname(os.path.abspath(batch_file)), exist_ok=True)
+    with open(batch_file, "w", encoding="utf-8") as f:
+        for idx, chunk, out_file in pending_chunks(chunks, chunk_dir, settings, manifest):
+            remembered = memory.translate_turn(chunk) if memory is not None else None
+            if remembered is not None:
+                write_chunk_file(out_file, remembered)
+                record_chunk(manifest, idx, chunk, out_file, settings)
+                remembered_count += 1
+                continue
+            request = {
+                "custom_id": batch_custom_id(idx, chunk, settings),
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {"model": settings.model, "messages": build_messages(chunk),
+                         "temperature": settings.temperature},
             }
-        ]
+            f.write(json.dumps(request, ensure_ascii=False) + "\n")
+            written += 1
+    if remembered_count:
+        print(f"🧠 {remembered_count} chunk(s) served from translation memory without a batch request.")
+    print(f"📝 Wrote {written} batch requests to {batch_file}")
+    if memory is not None:
+        print(memory.summary())
+    return written
 
-        for attempt in range(1, TRANSLATION_MAX_RETRIES + 1):
+def read_batch_results(results_file):
+    """
+    custom_id -> translated content from an OpenAI Batch API output JSONL. Raises BatchResultError on
+    duplicate IDs, per-request errors, non-200 responses or empty content.
+    """
+    results = {}
+    with open(results_file, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            custom_id = record.get("custom_id")
+            where = f"{results_file}:{line_number} ({custom_id})"
+            if custom_id in results:
+                raise BatchResultError(f"❌ Duplicate result {where}")
+            response = record.get("response") or {}
+            if record.get("error") or response.get("status_code") != 200:
+                raise BatchResultError(f"❌ Failed request {where}: {record.get('error') or response.get('body')}")
             try:
-                response = client.chat.completions.create(
-                    model=OPENAI_MODEL_NAME,
-                    messages=messages,
-                    temperature=OPENAI_TEMPERATURE
-                )
-                content = response.choices[0].message.content.strip()
-                if not content:
-                    raise ValueError("Empty response.")
-
-                #  the “Speaker” lable (who is speaking) is already determined earlier in  the chunking process.
-                #   and what this block does is normalize or correct the speaker labels to match your expected format.
-                if ENABLE_TAG_NORMALIZATION:
-                    for speaker in SPEAKER_IDS:
-                        pattern = fr"(話者\s*{speaker}|スピーカー\s*{speaker}|Speaker\s*\d|Speaker{speaker})"
-                        content = re.sub(pattern, f"Speaker {speaker}:", content)
-
-                    lines = content.splitlines()
-                    output_lines = []
-                    last_speaker = None
-
-                    for line in lines:
-                        match = re.match(fr"^({speaker_pattern}):", line.strip())
-                        if match:
-                            speaker = match.group(1)
-                            if last_speaker and speaker != last_speaker:
-                                output_lines.append("")
-                                output_lines.append("")
-                            last_speaker = speaker
-                        output_lines.append(line)
-                    content = "\n".join(output_lines)
-
-                # Save successful translation
-                with open(out_file, "w", encoding="utf-8") as f:
-                    f.write(content)
-
-                print(f"✅ Saved: {out_file}")
-                # Delay between successful translations to avoid hitting rate limits
-                time.sleep(TRANSLATION_RATE_LIMIT_DELAY)
-                break
-
-            except Exception as e:
-                print(f"❌ Attempt {attempt}/{TRANSLATION_MAX_RETRIES} failed on chunk {idx}: {e}")
-                if attempt == TRANSLATION_MAX_RETRIES:
-                    print(f"💥 Giving up on chunk {idx}")
-                else:
-                    '''
-                	•	On the first attempt, attempt = 1:
-                           → 5 * (1.5 ** 0) → 5 * 1 → 5 seconds
-	                •	On the second attempt, attempt = 2:
-                            → 5 * (1.5 ** 1) → 5 * 1.5 → 7.5 seconds
-                	•	Third attempt:
-                            → 5 * (1.5 ** 2) → 5 * 2.25 → 11.25 seconds
-	                •	Fourth:
-                            → 5 * (1.5 ** 3) → 5 * 3.375 → ~16.9 seconds
-                    '''
-                    delay = TRANSLATION_RETRY_DELAY * (1.5 ** (attempt - 1))  # Exponential backoff
-                    print(f"⏳ Waiting {delay} seconds before retrying...")
-                    time.sleep(delay)
+                content = response["body"]["choices"][0]["message"]["content"].strip()
+            except (KeyError, IndexError, TypeError, AttributeError) as e:
+                raise BatchResultError(f"❌ Malformed result {where}") from e
+            if not content:
+                raise BatchResultError(f"❌ Empty translation {where}")
+            results[custom_id] = content
+    return results
+
+def ingest_batch_results(chunks, chunk_dir, settings: TranslationSettings, results_file,
+                         memory: TranslationMemory = None, manifest: StageManifest = None) -> int:
+    """
+    Batch mode, second half: check that the results answer exactly the pending chunks of this transcript and
+    configuration, then normalize speaker tags and write the usual chunk_NNN.txt files.
+    Nothing is written unless the whole result file is complete and matches.
+    """
+    results = read_batch_results(results_file)
+    expected = {batch_custom_id(idx, chunk, settings): (idx, chunk) for idx, chunk in enumerate(chunks, start=1)}
+
+    unknown = sorted(set(results) - set(expected))
+    if unknown:
+        raise BatchResultError(f"❌ {len(unknown)} result(s) do not match this transcript/prompt/model: {unknown[:5]}")
+    pending = list(pending_chunks(chunks, chunk_dir, settings, manifest))
+    missing = [batch_custom_id(idx, chunk, settings) for idx, chunk, _ in pending
+               if batch_custom_id(idx, chunk, settings) not in results]
+    if missing:
+        raise BatchResultError(f"❌ Partial batch: {len(missing)} pending chunk(s) have no result: {missing[:5]}")
+
+    os.makedirs(chunk_dir, exist_ok=True)
+    written = 0
+    for idx, chunk, out_file in pending:
+        content = results[batch_custom_id(idx, chunk, settings)]
+        if ENABLE_TAG_NORMALIZATION:
+            content = normalize_speaker_tags(content)
+        write_chunk_file(out_file, content)
+        record_chunk(manifest, idx, chunk, out_file, settings)
+        if memory is not None:
+            memory.store_turn(chunk, content)
+        written += 1
+    print(f"✅ Ingested {written} batch results into {chunk_dir}")
+    return written
+
+def run_stage(manifest: StageManifest, batch_submit=None, batch_ingest=None, client=None, input_file=INPUT_FILE,
+              chunk_dir=CHUNK_DIR, rate_limiter: TokenBucket = None, memory: TranslationMemory = None,
+              selection: Selection = None, hedging: HedgingPolicy = None):
+    """
+    Translate input_file into chunk files in chunk_dir; chunks that are up to date in the manifest are skipped.
+    With a selection, only the chunks holding the selected utterances (see input_file's utterance index) are
+    translated again. In plan mode (manifest.dry_run) only the checks run. `client` replaces the OpenAI client
+    (e.g. fake_backends.FakeOpenAI). A batch run passes its shared client, rate limiter, translation memory and
+    hedging policy; they are not closed here.
+    """
+    OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+    TRANSLATION_CHUNK_WIDTH = int(os.getenv("TRANSLATION_CHUNK_WIDTH", "3000"))
+    TRANSLATION_MAX_RETRIES = int(os.getenv("TRANSLATION_MAX_RETRIES", "4"))
+    OPENAI_MODEL_NAME = os.getenv("OPENAI_MODEL_NAME")
+    OPENAI_TEMPERATURE = float(os.getenv("OPENAI_TEMPERATURE", "0.3"))
+    TRANSLATION_RETRY_DELAY = float(os.getenv("TRANSLATION_RETRY_DELAY", "5"))
+    TRANSLATION_RATE_LIMIT_DELAY = float(os.getenv("TRANSLATION_RATE_LIMIT_DELAY", "1"))
+    TRANSLATION_MAX_WORKERS = int(os.getenv("TRANSLATION_MAX_WORKERS", "1"))
+    TRANSLATION_REQUEST_TIMEOUT = float(os.getenv("TRANSLATION_REQUEST_TIMEOUT", "120"))
+    TRANSLATION_TOKEN_BUDGET = int(os.getenv("TRANSLATION_TOKEN_BUDGET", "0"))
+    TRANSLATION_MEMORY_ENABLED = os.getenv("TRANSLATION_MEMORY_ENABLED", "true").lower() == "true"
+    TRANSLATION_MEMORY_MODE = os.getenv("TRANSLATION_MEMORY_MODE", "normalized")
+
+    print(f"🔍 Model: {OPENAI_MODEL_NAME}, Chunk width: {TRANSLATION_CHUNK_WIDTH}, Retries: {TRANSLATION_MAX_RETRIES}, "
+          f"Workers: {TRANSLATION_MAX_WORKERS}")
+
+    offline = batch_submit or batch_ingest or manifest.dry_run or client is not None
+    if (not OPENAI_API_KEY and not offline) or not OPENAI_MODEL_NAME or not input_file:
+        raise RuntimeError("❌ Missing required environment variables (OPENAI_API_KEY, OPENAI_MODEL_NAME, English_Text)")
+
+    settings = TranslationSettings(OPENAI_MODEL_NAME, OPENAI_TEMPERATURE, TRANSLATION_MAX_RETRIES,
+                                   TRANSLATION_RETRY_DELAY, TRANSLATION_REQUEST_TIMEOUT)
+    if manifest.dry_run and not os.path.exists(input_file):
+        manifest.note("translate", f"input {input_file} does not exist yet")
+        return
+    if selection and (batch_submit or batch_ingest):
+        raise ValueError("❌ --range / --utterances cannot be combined with batch mode")
+
+    # === STEP 1: Speaker-aware chunking ===
+    with open(input_file, "r", encoding="utf-8") as f:
+        lines = f.read().splitlines()
+
+    spans = []
+    chunks = build_speaker_chunks(lines, TRANSLATION_CHUNK_WIDTH, spans)
+    print(f"🔹 Total speaker-safe chunks: {len(chunks)}")
+    selected = None
+    if selection:
+        index = UtteranceIndex.load(index_path_for(input_file))
+        index.check_transcript(len(lines), input_file)
+        selected = chunks_for_lines(spans, index.select(selection))
+        print(f"🎯 {selection}: chunk(s) {sorted(selected) or 'none'}")
+    if manifest.dry_run:
+        if selected is not None:
+            manifest.note("translate", f"would re-translate chunk(s) {sorted(selected)}")
+            return
+        remove_stale_chunk_files(chunks, chunk_dir, manifest)
+        list(pending_chunks(chunks, chunk_dir, settings, manifest, input_file))
+        return
+    remove_stale_chunk_files(chunks, chunk_dir, manifest)
+    os.makedirs(chunk_dir, exist_ok=True)
+    save_chunk_lines(chunk_dir, input_file, spans)   # Lets the TTS step map utterances to dialogue lines
+
+    # === STEP 2: Translate and save each chunk ===
+    # The memory is opened first so batch requests, too, are only written for turns it cannot translate
+    shared_memory = memory is not None
+    if TRANSLATION_MEMORY_ENABLED and not shared_memory:
+        memory = TranslationMemory(os.getenv("TRANSLATION_MEMORY_PATH", str(TRANSLATION_MEMORY_PATH)),
+                                   SYSTEM_PROMPT, OPENAI_MODEL_NAME, OPENAI_TEMPERATURE, TRANSLATION_MEMORY_MODE)
+    if batch_submit:
+        try:
+            write_batch_requests(chunks, chunk_dir, settings, batch_submit, manifest, memory)
+        finally:
+            if memory is not None and not shared_memory:
+                memory.close()
+        return
+    if batch_ingest:
+        try:
+            ingest_batch_results(chunks, chunk_dir, settings, batch_ingest, memory, manifest)
+        finally:
+            if memory is not None and not shared_memory:
+                memory.close()
+        return
+
+    # Retries are handled here (AIMD + Retry-After), so the client's own silent retries are turned off.
+    # OPENAI_BASE_URL, if set, points the client at an OpenAI-compatible server (e.g. a local stub).
+    client = client or OpenAI(api_key=OPENAI_API_KEY, max_retries=0)
+    # Requests from all workers share one budget: on average one per TRANSLATION_RATE_LIMIT_DELAY seconds
+    rate_limiter = rate_limiter or TokenBucket.from_delay(TRANSLATION_RATE_LIMIT_DELAY, burst=TRANSLATION_MAX_WORKERS)
+    # TRANSLATION_HEDGE_ENABLED=true: duplicate requests slower than the recent p95, within the same rate budget
+    hedging = hedging or HedgingPolicy.from_env("TRANSLATION", "translate", initial_delay=TRANSLATION_REQUEST_TIMEOUT / 4)
+    try:
+        translate_chunks(client, chunks, chunk_dir, settings, TRANSLATION_MAX_WORKERS, rate_limiter,
+                         token_budget=TRANSLATION_TOKEN_BUDGET, memory=memory, manifest=manifest, selected=selected,
+                         hedging=hedging)
+    finally:
+        if memory is not None and not shared_memory:
+            memory.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Translate the English transcript into Japanese chunk files")
+    parser.add_argument("--plan", action="store_true", help="List what would be rebuilt without running anything")
+    batch = parser.add_mutually_exclusive_group()
+    batch.add_argument("--batch-submit", metavar="REQUESTS_JSONL",
+                       help="Write pending chunks as an OpenAI batch-request file instead of calling the API")
+    batch.add_argument("--batch-ingest", metavar="RESULTS_JSONL",
+                       help="Write chunk files from a batch results file (fails on partial or mismatched results)")
+    add_selection_arguments(parser)
+    args = parser.parse_args()
+
+    # === SETUP ===
+    # Load .env from parent of current file
+    env_path = Path(__file__).resolve().parent.parent / ".env"
+    load_dotenv(dotenv_path=env_path)
+
+    manifest = open_manifest(dry_run=args.plan)
+    start_run("translate", enabled=not args.plan)
+    try:
+        run_stage(manifest, args.batch_submit, args.batch_ingest, selection=selection_from_args(args))
+    finally:
+        manifest.save()
+        finish_run()
+    if args.plan:
+        manifest.print_plan()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Translation Memory
+- Persistent SQLite store of earlier translations (AA mottos, Big Book readings, stock phrases)
+- Keyed on source text + system prompt hash + model + temperature, looked up before any API call
+- Exact mode (only surrounding whitespace ignored) or normalized mode (whitespace, case and punctuation ignored)
+- Turn-level lookup first, then sentence-level: a turn whose every sentence is known needs no request.
+  Sentence entries come from single-sentence turns and imported entries; a translation is never split up by
+  position, since the model may merge or reorder sentences
+- Import/export as JSONL so a memory can be shared between machines or seeded by hand
+
+Usage:
+  python translate-text/translation_memory.py export memory.jsonl [--db PATH]
+  python translate-text/translation_memory.py import memory.jsonl [--db PATH]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+import unicodedata
+from pathlib import Path
+
+# === CONFIGURATION ===
+SCRIPT_DIR = Path(__file__).resolve().parent
+TRANSLATION_MEMORY_PATH = SCRIPT_DIR.parent / "joe-charlie-aa-js/test-output/cache/translation_memory.sqlite"
+MEMORY_MODES = ("exact", "normalized")
+
+sys.path.insert(0, str(SCRIPT_DIR.parent / "pipeline-common"))
+from dialogue_format import SPEAKER_LINE
+from token_budget import estimate_tokens, speaker_labels
+
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.?!。？！])\s+")        # Needs a space, so "3.5 miles" stays whole
+
+def split_speaker_label(text: str):
+    """
+    "Speaker A: Keep coming back." -> ("Speaker A", "Keep coming back."); the label is not part of the memory key
+    """
+    match = SPEAKER_LINE.match(text)
+    if not match:
+        return None, text.strip()
+    return match.group(1), text[match.end():].strip()
+
+def split_sentences(text: str):
+    """
+    Sentences of `text`; never split inside a 「」 quote
+    """
+    text = text.strip()
+    sentences, start = [], 0
+    for boundary in SENTENCE_BOUNDARY.finditer(text):
+        if text.count("「", 0, boundary.start()) > text.count("」", 0, boundary.start()):
+            continue
+        sentences.append(text[start:boundary.start()])
+        start = boundary.end()
+    sentences.append(text[start:])
+    return [sentence for sentence in sentences if sentence]
+
+def normalize_exact(text: str) -> str:
+    return text.strip()
+
+def normalize_loose(text: str) -> str:
+    """
+    Case-folded, punctuation dropped, whitespace collapsed: "Keep coming back!" == "keep coming back"
+    """
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = "".join(ch for ch in text if not unicodedata.category(ch).startswith("P"))
+    return " ".join(text.split())
+
+def prompt_hash(system_prompt: str) -> str:
+    return hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()[:16]
+
+def memory_key(text: str, prompt_digest: str, model: str, temperature: float) -> str:
+    return hashlib.sha256(f"{text}|{prompt_digest}|{model}|{float(temperature)}".encode("utf-8")).hexdigest()
+
+class TranslationMemory:
+    """
+    SQLite-backed source -> target store. Every entry carries both an exact and a normalized key, so one memory
+    serves either mode; `mode` only selects which key is used for lookups.
+    """
+    def __init__(self, path, system_prompt: str = "", model: str = "", temperature: float = 0.0,
+                 mode: str = "normalized"):
+        if mode not in MEMORY_MODES:
+            raise ValueError(f"❌ Unknown translation memory mode {mode!r} (expected one of {MEMORY_MODES})")
+        self.path = Path(path)
+        self.system_prompt = system_prompt
+        self.prompt_digest = prompt_hash(system_prompt)
+        self.model = model
+        self.temperature = float(temperature)
+        self.mode = mode
+        self.turn_hits = 0
+        self.sentence_hits = 0
+        self.misses = 0
+        self.tokens_saved = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(self.path.parent, exist_ok=True)
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS memory (
+                exact_key TEXT PRIMARY KEY,
+                normalized_key TEXT NOT NULL,
+                source TEXT NOT NULL,
+                target TEXT NOT NULL,
+                prompt_hash TEXT NOT NULL,
+                model TEXT NOT NULL,
+                temperature REAL NOT NULL,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL,
+                use_count INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS memory_normalized_key ON memory(normalized_key)")
+        self._db.commit()
+
+    def _keys(self, source: str, prompt_digest=None, model=None, temperature=None):
+        context = (prompt_digest or self.prompt_digest,
+                   self.model if model is None else model,
+                   self.temperature if temperature is None else temperature)
+        return memory_key(normalize_exact(source), *context), memory_key(normalize_loose(source), *context)
+
+    def lookup(self, source: str):
+        """
+        Target text for `source` under the current prompt/model/temperature, or None
+        """
+        exact_key, normalized_key = self._keys(source)
+        column, key = ("exact_key", exact_key) if self.mode == "exact" else ("normalized_key", normalized_key)
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT exact_key, target FROM memory WHERE {column} = ? ORDER BY use_count DESC LIMIT 1", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE memory SET last_used = ?, use_count = use_count + 1 WHERE exact_key = ?",
+                             (time.time(), row[0]))
+            self._db.commit()
+        return row[1]
+
+    def translate_turn(self, turn: str):
+        """
+        Translate a speaker turn from memory alone: the whole turn first, then sentence by sentence.
+        Returns the labeled translation, or None (and counts a miss) if any part is unknown.
+        """
+        label, body = split_speaker_label(turn)
+        target = self.lookup(body)
+        if target is not None:
+            self.turn_hits += 1
+        else:
+            sentences = split_sentences(body)
+            parts = [self.lookup(sentence) for sentence in sentences] if len(sentences) > 1 else [None]
+            if any(part is None for part in parts):
+                self.misses += 1
+                return None
+            self.sentence_hits += 1
+            target = "".join(parts)
+
+        self.tokens_saved += estimate_tokens(self.system_prompt) + estimate_tokens(turn) + estimate_tokens(target)
+        return f"{label}: {target}" if label else target
+
+    def store_turn(self, turn: str, translation: str):
+        """
+        Remember a translated turn. Responses that do not come back as exactly one speaker turn are not stored.
+        A single-sentence turn doubles as a sentence entry for later turns that contain it.
+        """
+        if len(speaker_labels(translation)) != 1:
+            return
+        _, source = split_speaker_label(turn)
+        _, target = split_speaker_label(translation)
+        if not source or not target:
+            return
+        self.put(source, target)
+
+    def put(self, source: str, target: str, prompt_digest=None, model=None, temperature=None):
+        exact_key, normalized_key = self._keys(source, prompt_digest, model, temperature)
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO memory (exact_key, normalized_key, source, target, prompt_hash, model, "
+                "temperature, created, last_used, use_count) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 0)",
+                (exact_key, normalized_key, normalize_exact(source), target.strip(),
+                 prompt_digest or self.prompt_digest, self.model if model is None else model,
+                 self.temperature if temperature is None else float(temperature), now, now),
+            )
+            self._db.commit()
+
+    def export_jsonl(self, path) -> int:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT source, target, prompt_hash, model, temperature FROM memory ORDER BY created"
+            ).fetchall()
+        with open(path, "w", encoding="utf-8") as f:
+            for source, target, digest, model, temperature in rows:
+                f.write(json.dumps({"source": source, "target": target, "prompt_hash": digest,
+                                    "model": model, "temperature": temperature}, ensure_ascii=False) + "\n")
+        return len(rows)
+
+    def import_jsonl(self, path) -> int:
+        """
+        Load entries written by export_jsonl. Entries without prompt_hash/model/temperature get this memory's own.
+        """
+        count = 0
+        with open(path, "r", encoding="utf-8") as f:
+            for line_number, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                if not entry.get("source") or not entry.get("target"):
+                    raise ValueError(f"❌ {path}:{line_number}: entry needs both 'source' and 'target'")
+                self.put(entry["source"], entry["target"], entry.get("prompt_hash"), entry.get("model"),
+                         entry.get("temperature"))
+                count += 1
+        return count
+
+    def summary(self) -> str:
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM memory").fetchone()[0]
+        hits = self.turn_hits + self.sentence_hits
+        lookups = hits + self.misses
+        hit_rate = 100 * hits / lookups if lookups else 0
+        return (f"🧠 Translation memory ({self.mode}): {hits}/{lookups} turns served ({hit_rate:.0f}% hit rate; "
+                f"{self.turn_hits} whole-turn, {self.sentence_hits} sentence-level), "
+                f"~{self.tokens_saved} tokens saved, {entries} entries in {self.path}")
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Import or export the translation memory as JSONL")
+    parser.add_argument("action", choices=["export", "import"])
+    parser.add_argument("file", help="JSONL file to write (export) or read (import)")
+    parser.add_argument("--db", default=os.getenv("TRANSLATION_MEMORY_PATH", str(TRANSLATION_MEMORY_PATH)))
+    args = parser.parse_args()
+
+    # Hand-written entries without prompt_hash/model/temperature are keyed for the current translate_chunks setup
+    from dotenv import load_dotenv
+    from translate_chunks import SYSTEM_PROMPT
+    load_dotenv(dotenv_path=SCRIPT_DIR.parent / ".env")
+    memory = TranslationMemory(args.db, SYSTEM_PROMPT, os.getenv("OPENAI_MODEL_NAME", ""),
+                               float(os.getenv("OPENAI_TEMPERATURE", "0.3")))
+    try:
+        if args.action == "export":
+            print(f"📤 Exported {memory.export_jsonl(args.file)} entries to {args.file}")
+        else:
+            print(f"📥 Imported {memory.import_jsonl(args.file)} entries into {args.db}")
+    finally:
+        memory.close()
+
+if __name__ == "__main__":
+    main()